@@ -0,0 +1,132 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####        Cache de montagem endereçado por conteúdo        ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+
+from assembler import assemble
+
+
+class AssembledImage:
+    """Resultado de uma montagem: imagem de 256 bytes, símbolos e mapa de linhas."""
+    __slots__ = ('image','symbols','line_map')
+
+    def __init__(self, image, symbols, line_map):
+        self.image = bytes(image)
+        self.symbols = dict(symbols)
+        self.line_map = dict(line_map)
+
+    def load(self, cpu):
+        """
+        Carrega a imagem em `cpu` sem nenhuma análise do fonte.
+        Equivale a reset() da memória seguido de assemble().
+        """
+        cpu.load_image(self.image)
+        cpu.symbols = dict(self.symbols)
+        cpu.line_map = dict(self.line_map)
+
+    def to_json(self):
+        return json.dumps({'image': self.image.hex(), 'symbols': self.symbols,
+                           'line_map': {str(k): v for k, v in self.line_map.items()}})
+
+    @classmethod
+    def from_json(cls, text):
+        d = json.loads(text)
+        image = bytes.fromhex(d['image'])
+        symbols = d['symbols']
+        line_map = {int(k): v for k, v in d['line_map'].items()}
+        if len(image)!=256 or not isinstance(symbols, dict) \
+           or not all(isinstance(v, int) for v in symbols.values()) \
+           or not all(isinstance(v, int) for v in line_map.values()):
+            raise ValueError('entrada de cache malformada')
+        return cls(image, symbols, line_map)
+
+
+class AssemblyCache:
+    """
+    Cache de montagens indexado pelo SHA-256 do texto-fonte.
+    Mantém um LRU em memória limitado a `maxsize` entradas e,
+    opcionalmente, um armazenamento em disco (`directory`), um
+    arquivo JSON por fonte.
+    """
+
+    def __init__(self, maxsize=256, directory=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if directory: os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(src):
+        return hashlib.sha256(src.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key+'.json')
+
+    def _remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def get(self, src):
+        """Retorna a montagem em cache de `src` ou None."""
+        key = self.key(src)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry
+        if self.directory:
+            try:
+                with open(self._path(key), encoding='utf-8') as f:
+                    entry = AssembledImage.from_json(f.read())
+            except (OSError, ValueError, KeyError, TypeError, AttributeError):
+                # arquivo ilegível ou com formato inesperado: falta no cache
+                return None
+            self._remember(key, entry)
+            return entry
+        return None
+
+    def put(self, src, entry):
+        key = self.key(src)
+        self._remember(key, entry)
+        if self.directory:
+            # escrita atômica: arquivo temporário + rename
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(entry.to_json())
+                os.replace(tmp, self._path(key))
+            except BaseException:
+                try: os.unlink(tmp)
+                except OSError: pass
+                raise
+
+    def assemble(self, cpu, src):
+        """
+        Carrega `src` em `cpu`: usa o cache quando possível, senão
+        monta com o montador de passagem única e guarda o resultado.
+        Erros de montagem são propagados e não ficam em cache.
+        """
+        entry = self.get(src)
+        if entry is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            prog = assemble(src)
+            entry = AssembledImage(prog.image, prog.symbols, prog.line_map)
+            self.put(src, entry)
+        entry.load(cpu)
+        return entry
+
+    def clear(self):
+        self.entries.clear()
@@ -0,0 +1,265 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####    Montador de passagem única com backpatch de labels   ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+import re
+import time
+from functools import lru_cache
+
+from main import CPU
+
+# ---------- Analisador léxico ----------
+
+# Linha já sem comentário: [label:] [instrução [operando]] [resto ignorado]
+_LINE = re.compile(r'\s*(?:(?P<label>\S*):(?:\s+|$))?(?:(?P<instr>\S+)(?:\s+(?P<op>\S+))?)?')
+
+# Formatos numéricos aceitos por CPU.parse_value (caminho rápido)
+_HEX_H = re.compile(r'([0-9A-Fa-f]+)[Hh]')          # FFh
+_BIN_B = re.compile(r'([01]+)[Bb]')                  # 1010b
+_NUM = re.compile(r'(?P<dec>[0-9]+)|0[xX](?P<x>[0-9A-Fa-f]+)|(?P<hex>[0-9A-Fa-f]+)')
+
+# Sufixos de modo de endereçamento (caminho rápido, só ASCII)
+_SUFFIX = re.compile(r'(.*),([IiRr])')
+
+OPCODES = {
+    'NOT':0x0,'STA':0x1,'LDA':0x4,'ADD':0x5,'OR':0x6,'AND':0x7,
+    'JMP':0x8,'JC':0x9,'JN':0xA,'JZ':0xB,'JSR':0xC,'RTS':0xD,'JV':0xE,'HLT':0xF
+}
+
+_BAD = object()   # valor inválido (parse_value retornaria None)
+
+
+def _slow_int(t, base):
+    try: return int(t, base)&0xFF
+    except: return _BAD
+
+
+@lru_cache(maxsize=8192)
+def classify(token):
+    """
+    Classifica um operando exatamente como CPU.parse_value, sem a busca
+    em tabela de símbolos: retorna o valor (0..255), `_BAD` se o token é
+    um número inválido, ou o nome do símbolo (str) a ser resolvido no fim.
+    """
+    t = token.strip()
+    if t.startswith('#'): t = t[1:]
+    last = t[-1:]
+    if last=='H' or last=='h':
+        m = _HEX_H.fullmatch(t)
+        return int(m.group(1),16)&0xFF if m else _slow_int(t[:-1],16)
+    if last=='B' or last=='b':
+        m = _BIN_B.fullmatch(t)
+        return int(m.group(1),2)&0xFF if m else _slow_int(t[:-1],2)
+    m = _NUM.fullmatch(t)
+    if m:
+        if m.group('dec') is not None: return int(m.group('dec'))&0xFF
+        return int(m.group('x') or m.group('hex'),16)&0xFF
+    # formatos raros que int() aceita (sinal, '_', dígitos Unicode)
+    try: return int(t,10)&0xFF
+    except: pass
+    if t.lower().startswith('0x'): return _slow_int(t,16)
+    return t
+
+
+@lru_cache(maxsize=8192)
+def operand_mode(op):
+    """
+    Retorna (modo, token sem sufixo) de um operando de instrução,
+    como CPU.get_mode + remoção de ',I'/',R' em CPU.assemble.
+    """
+    m = _SUFFIX.fullmatch(op) if op.isascii() else None
+    if m: tok = m.group(1); suf = m.group(2).upper()
+    else:
+        u = op.upper()
+        tok = op[:-2] if u.endswith(',I') or u.endswith(',R') else op
+        suf = u[-1] if tok is not op else None
+    if op.startswith('#'): return 0x0, tok
+    if suf=='I': return 0x2, tok
+    if suf=='R': return 0x3, tok
+    return 0x1, tok
+
+
+# Tabela de translate: byte de `written` (0/1) -> máscara (00/FF)
+_WRITTEN_MASK = bytes([0x00]+[0xFF]*255)
+
+
+class Program:
+    """
+    Resultado da montagem: bytes gerados (com máscara dos endereços
+    escritos), tabela de símbolos, mapa linha -> endereço e seções
+    ([tipo 'CODE'/'DATA', início, nº de bytes], uma por trecho contínuo
+    aberto por .CODE/.DATA/ORG).
+    """
+    __slots__ = ('image','written','symbols','line_map','sections')
+
+    def __init__(self):
+        self.image = bytearray(256)
+        self.written = bytearray(256)
+        self.symbols = {}
+        self.line_map = {}
+        self.sections = []
+
+    def load(self, cpu):
+        """Grava em `cpu` exatamente o que CPU.assemble gravaria."""
+        # máscara 00/FF dos bytes escritos: mescla imagem e memória atual
+        # de uma vez e carrega por load_image (invalidação e hashes da CPU)
+        mask = int.from_bytes(self.written.translate(_WRITTEN_MASK), 'big')
+        mem = int.from_bytes(cpu.dump_image(), 'big')
+        img = int.from_bytes(self.image, 'big')
+        cpu.load_image(((mem & ~mask) | (img & mask)).to_bytes(256, 'big'))
+        cpu.symbols = dict(self.symbols)
+        cpu.line_map = dict(self.line_map)
+
+
+def _out_of_range(ln, addr):
+    # ORG/.CODE/.DATA além de FF: CPU.assemble falharia com IndexError
+    # ao gravar esta linha na 2ª passagem
+    return f'Linha {ln}: endereço fora da memória {addr:X}'
+
+
+def assemble(src):
+    """
+    Monta `src` em uma única passagem e retorna um Program.
+    Operandos simbólicos são resolvidos no fim (backpatch), com a tabela
+    de símbolos completa, como na 2ª passagem de CPU.assemble. Gera os
+    mesmos bytes e as mesmas mensagens de erro que CPU.assemble.
+    """
+    prog = Program()
+    image = prog.image; written = prog.written
+    symbols = prog.symbols; line_map = prog.line_map
+    owner = [0]*256        # nº de sequência da última escrita em cada endereço
+    seq = 0
+    fixups = []            # (endereço, símbolo, seq, linha, é DB, texto do operando)
+    late_err = None        # 1º erro que CPU.assemble só detectaria na 2ª passagem
+    addr = 0
+    mode_code = False
+    sections = prog.sections
+    sect = None            # seção em que os bytes estão sendo gravados
+    match = _LINE.match
+    opcodes = OPCODES
+
+    for ln, line in enumerate(src.splitlines(), 1):
+        m = match(line.split(';',1)[0])
+        label, instr, op = m.group('label', 'instr', 'op')
+        if label is not None:
+            symbols[label] = addr
+        if instr is None: continue
+
+        # diretivas de seção
+        if instr=='.CODE' or instr=='.DATA':
+            if op: addr = int(op[1:],16)
+            mode_code = instr=='.CODE'; sect = None; continue
+        if instr=='.ENDCODE': mode_code = False; sect = None; continue
+        if instr=='.ENDDATA': sect = None; continue
+        if instr=='ORG' and op:
+            addr = int(op[1:],16); sect = None; continue
+        if instr=='DB':
+            val = classify(op) if op is not None else _BAD
+            seq += 1
+            line_map[ln] = addr
+            if val is _BAD:
+                if late_err is None: late_err = (ln, f'Linha {ln}: valor DB inválido {op}')
+            elif not -256 <= addr <= 0xFF:
+                if type(val) is str: fixups.append((addr, val, seq, ln, True, op))
+                elif late_err is None: late_err = (ln, _out_of_range(ln, addr))
+            else:
+                if type(val) is str: fixups.append((addr, val, seq, ln, True, op))
+                else: image[addr] = val
+                owner[addr] = seq; written[addr] = 1
+                if sect is None:
+                    sect = ['CODE' if mode_code else 'DATA', addr&0xFF, 0]; sections.append(sect)
+                sect[2] += 1
+            addr = (addr+1)&0xFF; continue
+        if not mode_code: raise Exception(f'Linha {ln}: instrução fora de .CODE')
+
+        opc = opcodes.get(instr)
+        if opc is None:
+            if late_err is None: late_err = (ln, f'Linha {ln}: opcode inválido {instr}')
+            addr = (addr+(2 if op is not None else 1))&0xFF; continue
+        if not -256 <= addr <= 0xFF:
+            if late_err is None: late_err = (ln, _out_of_range(ln, addr))
+            addr = (addr+(2 if op is not None else 1))&0xFF; continue
+        line_map[ln] = addr
+        seq += 1
+        if sect is None:
+            sect = ['CODE', addr&0xFF, 0]; sections.append(sect)
+        sect[2] += 1 if op is None else 2
+        if op is None:
+            image[addr] = opc<<4
+            owner[addr] = seq; written[addr] = 1
+            addr = (addr+1)&0xFF; continue
+        mode, tok = operand_mode(op)
+        image[addr] = (opc<<4)|(mode<<2)
+        owner[addr] = seq; written[addr] = 1
+        addr = (addr+1)&0xFF
+        val = classify(tok)
+        seq += 1
+        if type(val) is str:
+            fixups.append((addr, val, seq, ln, False, op))
+        else:
+            image[addr] = 0 if val is _BAD else val
+        owner[addr] = seq; written[addr] = 1
+        addr = (addr+1)&0xFF
+
+    # backpatch: só vale se nenhuma linha posterior sobrescreveu o endereço
+    for a, name, s, ln, is_db, op in fixups:
+        val = symbols.get(name)
+        if is_db and (val is None or not -256 <= a <= 0xFF):
+            if late_err is None or ln < late_err[0]:
+                late_err = (ln, f'Linha {ln}: valor DB inválido {op}' if val is None
+                            else _out_of_range(ln, a))
+            continue
+        if val is None: val = 0
+        if owner[a]==s: image[a] = val&0xFF
+    if late_err is not None: raise Exception(late_err[1])
+    return prog
+
+
+def assemble_into(cpu, src):
+    """Substituto direto de cpu.assemble(src) usando o montador de passagem única."""
+    assemble(src).load(cpu)
+    return True
+
+
+# ---------- Comparação de desempenho ----------
+
+def generate_source(n_lines=5000, n_labels=1000):
+    """Gera um fonte grande com muitos labels e referências à frente."""
+    mnems = ['LDA','ADD','OR','AND','STA','JMP','JZ','JN','JC','JSR']
+    out = ['.CODE #00']
+    for i in range(n_lines):
+        lbl = f'L_{i%n_labels}:' if i < n_labels else ''
+        m = mnems[i%len(mnems)]
+        if i%7==0: opnd = f'#{i&0xFF:02X}h'
+        elif i%5==0: opnd = f'L_{(i*31)%n_labels},I'
+        elif i%11==0: opnd = f'{i%97}'
+        else: opnd = f'L_{(i*17)%n_labels}'
+        out.append(f'{lbl:10} {m} {opnd}   ; linha {i}')
+        if i%13==0: out.append(f'{"":10} NOT')
+    out.append('.ENDCODE')
+    out.append('.DATA #F0')
+    for i in range(8): out.append(f'V_{i}: DB {i*3}')
+    out.append('.ENDDATA')
+    return '\n'.join(out)+'\n'
+
+
+if __name__=='__main__':
+    src = generate_source()
+    n = src.count('\n')
+    ref = CPU()
+    t0 = time.perf_counter()
+    for _ in range(5): ref.assemble(src)
+    t_ref = (time.perf_counter()-t0)/5
+    classify.cache_clear()
+    t0 = time.perf_counter()
+    for _ in range(5): prog = assemble(src)
+    t_new = (time.perf_counter()-t0)/5
+    fresh = CPU(); prog.load(fresh)
+    assert list(fresh.memory)==list(ref.memory) and fresh.symbols==ref.symbols
+    print(f'{n} linhas')
+    print(f'CPU.assemble       : {n/t_ref:12,.0f} linhas/s')
+    print(f'assembler.assemble : {n/t_new:12,.0f} linhas/s')
+    print(f'Ganho              : {t_ref/t_new:.2f}x')
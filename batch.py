@@ -0,0 +1,188 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####        Execução em lote (montagem + execução paralela)   ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from main import CPU
+from engine import PredecodedCPU
+from asmcache import AssemblyCache
+from cycles import CycleCPU
+
+# 'cycle' detecta laços infinitos (status 'nonterminating')
+ENGINES = {'ref': CPU, 'predecoded': PredecodedCPU, 'cycle': CycleCPU}
+
+DEFAULT_MAX_STEPS = 100000
+DEFAULT_TIMEOUT = 5.0      # segundos de relógio por trabalho
+
+# Intervalo (em instruções) entre verificações do relógio
+_CLOCK_CHECK = 1024
+
+# CPU e cache de montagem reaproveitados por todos os trabalhos de um
+# processo trabalhador
+_cpu = None
+_cache = None
+
+
+def _init_worker(engine, cache_dir=None):
+    global _cpu, _cache
+    _cpu = ENGINES[engine]()
+    _cache = AssemblyCache(directory=cache_dir)
+
+
+def memory_digest(memory):
+    """SHA-256 (hex) dos 256 bytes de memória (aceita memoryview, sem cópia)."""
+    return hashlib.sha256(memory).hexdigest()
+
+
+def run_source(cpu, src, max_steps=DEFAULT_MAX_STEPS, timeout=DEFAULT_TIMEOUT, cache=None):
+    """
+    Reinicia `cpu`, monta `src` (via `cache`, se fornecido) e executa
+    a partir de PC=0.
+    Retorna um dicionário com o estado final:
+    status = 'halt' | 'budget' | 'timeout' | 'asm_error' | 'error'
+             | 'nonterminating' (apenas com CycleCPU)
+    """
+    cpu.reset()
+    res = {'status': None, 'steps': 0, 'error': None, 'line': None}
+    try:
+        if cache is not None: cache.assemble(cpu, src)
+        else: cpu.assemble(src)
+    except Exception as e:
+        m = re.match(r'Linha (\d+)', str(e))
+        res.update(status='asm_error', error=str(e), line=int(m.group(1)) if m else None)
+        return res
+    cpu.pc = 0
+    if isinstance(cpu, CycleCPU):
+        r = cpu.run_detect(max_steps, timeout)
+        res.update(status=r['status'], error=r['error'])
+        if r['status'] == 'nonterminating':
+            res.update(cycle_length=r['cycle_length'], pc_range=r['pc_range'])
+        steps = r['steps']
+    else:
+        steps = _run_plain(cpu, res, max_steps, timeout)
+    res['steps'] = steps
+    res.update(ac=cpu.ac, pc=cpu.pc, rs=cpu.rs,
+               n=cpu.negative, z=cpu.zero, c=cpu.carry, v=cpu.overflow,
+               digest=memory_digest(cpu.view))
+    return res
+
+
+def _run_plain(cpu, res, max_steps, timeout):
+    """Laço de fetch com limite de passos e de tempo; preenche res['status']."""
+    fetch = cpu.fetch
+    steps = 0
+    deadline = time.monotonic()+timeout
+    try:
+        while res['status'] is None:
+            if steps >= max_steps:
+                res['status'] = 'budget'; break
+            if time.monotonic() > deadline:
+                res['status'] = 'timeout'; break
+            # executa em lotes entre verificações do relógio
+            for _ in range(min(_CLOCK_CHECK, max_steps-steps)):
+                steps += 1
+                if not fetch():
+                    res['status'] = 'halt'; break
+    except Exception as e:
+        res.update(status='error', error=str(e))
+    return steps
+
+
+def _run_job(job):
+    """Executado no processo trabalhador: lê o arquivo e roda o trabalho."""
+    t0 = time.perf_counter()
+    try:
+        with open(job['path'], encoding='utf-8') as f:
+            src = f.read()
+    except OSError as e:
+        res = {'status': 'io_error', 'error': str(e)}
+    else:
+        res = run_source(_cpu, src, job['max_steps'], job['timeout'], _cache)
+    res['path'] = job['path']
+    res['time'] = round(time.perf_counter()-t0, 6)
+    return res
+
+
+def load_jobs(target, max_steps=DEFAULT_MAX_STEPS, timeout=DEFAULT_TIMEOUT):
+    """
+    Lista de trabalhos a partir de um diretório (todos os *.asm,
+    recursivamente) ou de um manifesto JSON lines, onde cada linha tem
+    "path" e, opcionalmente, "max_steps" e "timeout".
+    Caminhos relativos do manifesto são relativos ao próprio manifesto.
+    """
+    jobs = []
+    if os.path.isdir(target):
+        for root, _, files in os.walk(target):
+            for name in sorted(files):
+                if name.lower().endswith('.asm'):
+                    jobs.append({'path': os.path.join(root, name)})
+        jobs.sort(key=lambda j: j['path'])
+    else:
+        base = os.path.dirname(os.path.abspath(target))
+        with open(target, encoding='utf-8') as f:
+            for ln, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith('#'): continue
+                try:
+                    job = json.loads(line)
+                    path = job['path']
+                except (ValueError, KeyError, TypeError):
+                    raise Exception(f'Manifesto linha {ln}: entrada inválida')
+                job['path'] = path if os.path.isabs(path) else os.path.join(base, path)
+                jobs.append(job)
+    for job in jobs:
+        job.setdefault('max_steps', max_steps)
+        job.setdefault('timeout', timeout)
+    return jobs
+
+
+def run_batch(jobs, workers=None, engine='predecoded', cache_dir=None):
+    """
+    Distribui os trabalhos em um ProcessPoolExecutor e gera os
+    resultados (dicionários) à medida que terminam.
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(engine, cache_dir)) as ex:
+        futures = {ex.submit(_run_job, job): job for job in jobs}
+        for fut in as_completed(futures):
+            try:
+                yield fut.result()
+            except Exception as e:
+                yield {'path': futures[fut]['path'], 'status': 'error', 'error': str(e)}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Monta e executa programas CLEÓPATRA em lote.')
+    ap.add_argument('target', help='diretório com arquivos .asm ou manifesto JSON lines')
+    ap.add_argument('-j', '--workers', type=int, default=None, help='processos trabalhadores')
+    ap.add_argument('--max-steps', type=int, default=DEFAULT_MAX_STEPS)
+    ap.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='segundos por trabalho')
+    ap.add_argument('--engine', choices=sorted(ENGINES), default='predecoded')
+    ap.add_argument('--cache-dir', help='diretório do cache de montagens em disco')
+    ap.add_argument('-o', '--output', help='arquivo de saída (padrão: stdout)')
+    args = ap.parse_args(argv)
+
+    jobs = load_jobs(args.target, args.max_steps, args.timeout)
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for res in run_batch(jobs, args.workers, args.engine, args.cache_dir):
+            out.write(json.dumps(res)+'\n')
+            out.flush()
+    finally:
+        if out is not sys.stdout: out.close()
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
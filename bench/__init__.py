@@ -0,0 +1,130 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####        Benchmarks do montador e do interpretador        ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+import json
+import platform
+import time
+import tracemalloc
+
+from main import CPU
+from engine import PredecodedCPU
+from bench.corpus import PROGRAMS
+
+ENGINES = {'ref': CPU, 'predecoded': PredecodedCPU}
+
+# Métricas: nome -> True se maior é melhor
+METRICS = {'asm_lines_per_s': True, 'instr_per_s': True, 'peak_kib': False}
+
+DEFAULT_THRESHOLD = 0.15   # regressão tolerada (fração do baseline)
+
+# Tempo mínimo (s) de cada medição; repete o trabalho até atingi-lo
+_MIN_TIME = 0.05
+
+
+def _best_rate(work, units, rounds):
+    """Melhor taxa (unidades/s) de `work()` em `rounds` medições."""
+    best = 0.0
+    for _ in range(rounds):
+        n = 0
+        t0 = time.perf_counter()
+        while True:
+            work(); n += 1
+            dt = time.perf_counter()-t0
+            if dt >= _MIN_TIME: break
+        best = max(best, n*units/dt)
+    return best
+
+
+def _run(cpu, image, max_steps):
+    cpu.reset()
+    cpu.load_image(image)
+    fetch = cpu.fetch
+    steps = 0
+    while steps < max_steps:
+        steps += 1
+        if not fetch(): break
+    return steps
+
+
+def measure(src, max_steps=None, engine='ref', rounds=5):
+    """
+    Mede um programa: linhas montadas por segundo, instruções executadas
+    por segundo (se `max_steps` não for None) e pico de memória alocada
+    (KiB, via tracemalloc) de uma montagem seguida de execução.
+    """
+    cls = ENGINES[engine]
+    cpu = cls()
+    lines = len(src.splitlines())
+    res = {'lines': lines, 'steps': None, 'instr_per_s': None}
+    res['asm_lines_per_s'] = _best_rate(lambda: cpu.assemble(src), lines, rounds)
+
+    image = cpu.dump_image()
+    if max_steps is not None:
+        steps = _run(cpu, image, max_steps)
+        res['steps'] = steps
+        res['instr_per_s'] = _best_rate(lambda: _run(cpu, image, max_steps), steps, rounds)
+
+    tracemalloc.start()
+    try:
+        cpu = cls()
+        cpu.assemble(src)
+        if max_steps is not None: _run(cpu, image, max_steps)
+        res['peak_kib'] = tracemalloc.get_traced_memory()[1]/1024
+    finally:
+        tracemalloc.stop()
+    return res
+
+
+def run_suite(names=None, engine='ref', rounds=5):
+    """Mede os programas do corpus (todos, ou os de `names`)."""
+    programs = {}
+    for name in names or PROGRAMS:
+        p = PROGRAMS[name]
+        programs[name] = measure(p['src'], p['max_steps'], engine, rounds)
+    return {'engine': engine, 'python': platform.python_version(),
+            'machine': platform.machine(), 'programs': programs}
+
+
+def save_baseline(results, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compara `results` com `baseline`. Retorna a lista de regressões
+    (programa, métrica, valor do baseline, valor atual, variação),
+    isto é, métricas que pioraram mais que `threshold`.
+    Programas ou métricas ausentes em um dos lados são ignorados.
+    """
+    regressions = []
+    base_progs = baseline.get('programs', {})
+    for name, cur in results['programs'].items():
+        base = base_progs.get(name)
+        if base is None: continue
+        for metric, higher_better in METRICS.items():
+            b = base.get(metric); c = cur.get(metric)
+            if not b or c is None: continue
+            change = (c-b)/b
+            if (-change if higher_better else change) > threshold:
+                regressions.append((name, metric, b, c, change))
+    return regressions
+
+
+def format_results(results):
+    out = [f"engine={results['engine']} python={results['python']}",
+           f"{'programa':20} {'linhas/s':>12} {'instr/s':>12} {'pico KiB':>10}"]
+    for name, r in results['programs'].items():
+        ips = f"{r['instr_per_s']:12,.0f}" if r['instr_per_s'] is not None else f"{'-':>12}"
+        out.append(f"{name:20} {r['asm_lines_per_s']:12,.0f} {ips} {r['peak_kib']:10.1f}")
+    return '\n'.join(out)
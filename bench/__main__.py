@@ -0,0 +1,54 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####       python -m bench {run,save,check} [opções]         ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+import argparse
+import sys
+
+from bench import (ENGINES, DEFAULT_THRESHOLD, run_suite, save_baseline,
+                   load_baseline, compare, format_results)
+from bench.corpus import PROGRAMS
+
+DEFAULT_BASELINE = 'bench_baseline.json'
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog='python -m bench',
+                                 description='Benchmarks do montador e do interpretador CLEÓPATRA.')
+    ap.add_argument('command', choices=['run','save','check'], nargs='?', default='run',
+                    help='run: mede e mostra; save: grava o baseline; check: falha se houver regressão')
+    ap.add_argument('--baseline', default=DEFAULT_BASELINE, help='arquivo JSON do baseline')
+    ap.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                    help='piora tolerada, como fração (padrão: %(default)s)')
+    ap.add_argument('--engine', choices=sorted(ENGINES), default='ref')
+    ap.add_argument('--rounds', type=int, default=5, help='medições por métrica (vale a melhor)')
+    ap.add_argument('-p', '--program', action='append', choices=sorted(PROGRAMS),
+                    help='limita aos programas indicados (pode repetir)')
+    args = ap.parse_args(argv)
+
+    results = run_suite(args.program, args.engine, args.rounds)
+    print(format_results(results))
+
+    if args.command=='save':
+        save_baseline(results, args.baseline)
+        print(f'\nBaseline gravado em {args.baseline}')
+    elif args.command=='check':
+        baseline = load_baseline(args.baseline)
+        if baseline.get('engine') != results['engine']:
+            print(f"\nBaseline medido com engine={baseline.get('engine')}", file=sys.stderr)
+            return 2
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} regressão(ões) acima de {args.threshold:.0%}:', file=sys.stderr)
+            for name, metric, b, c, change in regressions:
+                print(f'  {name}.{metric}: {b:,.1f} -> {c:,.1f} ({change:+.1%})', file=sys.stderr)
+            return 1
+        print(f'\nSem regressões acima de {args.threshold:.0%}')
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
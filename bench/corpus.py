@@ -0,0 +1,152 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####           Corpus de programas para benchmarks           ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+from assembler import generate_source
+
+# Vetor de 32 bytes em 80h, usado pelos programas de varredura
+_VETOR = '.DATA #80\n' + ''.join(f'       DB {(i*37+11)&0xFF}\n' for i in range(32)) + '.ENDDATA\n'
+
+ARITH_LOOP = """
+; multiplicação por somas sucessivas (FATOR x VALOR), repetida VEZES vezes
+.CODE #00
+EXTERNO: LDA #0
+         STA SOMA
+         STA ALTO
+         LDA FATOR
+         STA CONT
+SOMAR:   LDA SOMA
+         ADD VALOR
+         STA SOMA
+         JC VAI
+VOLTA:   LDA CONT
+         ADD #FFh
+         STA CONT
+         JZ PROX
+         JMP SOMAR
+VAI:     LDA ALTO
+         ADD #1
+         STA ALTO
+         JMP VOLTA
+PROX:    LDA VEZES
+         ADD #FFh
+         STA VEZES
+         JZ FIM
+         JMP EXTERNO
+FIM:     HLT
+.ENDCODE
+.DATA #E0
+SOMA:    DB 0
+ALTO:    DB 0
+CONT:    DB 0
+FATOR:   DB 200
+VALOR:   DB 37
+VEZES:   DB 50
+.ENDDATA
+"""
+
+INDIRECT_RELATIVE = """
+; soma do vetor via ponteiro (,I); contador e desvios relativos (,R)
+.CODE #00
+        LDA #80h          ; 00
+        STA PTR           ; 02
+        LDA #32           ; 04
+        STA CONT          ; 06
+SOMAR:  LDA SOMA          ; 08
+        ADD PTR,I         ; 0A
+        STA SOMA          ; 0C
+        LDA PTR           ; 0E
+        ADD #1            ; 10
+        STA PTR           ; 12
+        LDA 27,R          ; 14: CONT (16h+27 = 31h)
+        ADD #FFh          ; 16
+        STA 23,R          ; 18: CONT (1Ah+23 = 31h)
+        JZ 2,R            ; 1A: -> 1Eh
+        JMP -22,R         ; 1C: -> SOMAR
+        LDA VEZES         ; 1E
+        ADD #FFh          ; 20
+        STA VEZES         ; 22
+        JZ 2,R            ; 24: -> 28h
+        JMP -40,R         ; 26: -> 00h
+        HLT               ; 28
+.ENDCODE
+.DATA #30
+PTR:    DB 0
+CONT:   DB 0
+SOMA:   DB 0
+VEZES:  DB 100
+.ENDDATA
+""" + _VETOR
+
+JSR_HEAVY = """
+; laço dominado por chamadas de sub-rotinas folha (JSR/RTS)
+.CODE #00
+LOOP:   JSR INCR
+        JSR DOBRA
+        JSR INCR
+        LDA CONT
+        ADD #FFh
+        STA CONT
+        JZ FIM
+        JMP LOOP
+FIM:    HLT
+INCR:   LDA TOTAL
+        ADD #1
+        STA TOTAL
+        RTS
+DOBRA:  LDA TOTAL
+        ADD TOTAL
+        AND #7Fh
+        STA TOTAL
+        RTS
+.ENDCODE
+.DATA #C0
+TOTAL:  DB 0
+CONT:   DB 0
+.ENDDATA
+"""
+
+SELF_MODIFYING = """
+; soma do vetor reescrevendo o operando do ADD em 0Ah a cada iteração
+.CODE #00
+REPETE: LDA #80h          ; 00
+        STA 0Bh           ; 02: operando do ADD
+        LDA #32           ; 04
+        STA CONT          ; 06
+SOMAR:  LDA SOMA          ; 08
+        ADD 80h           ; 0A: operando reescrito
+        STA SOMA          ; 0C
+        LDA 0Bh           ; 0E
+        ADD #1            ; 10
+        STA 0Bh           ; 12
+        LDA CONT
+        ADD #FFh
+        STA CONT
+        JZ PROX
+        JMP SOMAR
+PROX:   LDA VEZES
+        ADD #FFh
+        STA VEZES
+        JZ FIM
+        JMP REPETE
+FIM:    HLT
+.ENDCODE
+.DATA #40
+CONT:   DB 0
+SOMA:   DB 0
+VEZES:  DB 100
+.ENDDATA
+""" + _VETOR
+
+# Programa do corpus: fonte e limite de passos (None = só montagem;
+# o fonte gerado não é um programa executável com término)
+PROGRAMS = {
+    'arith_loop':        {'src': ARITH_LOOP, 'max_steps': 1000000},
+    'indirect_relative': {'src': INDIRECT_RELATIVE, 'max_steps': 1000000},
+    'jsr_heavy':         {'src': JSR_HEAVY, 'max_steps': 1000000},
+    'self_modifying':    {'src': SELF_MODIFYING, 'max_steps': 1000000},
+    'large_generated':   {'src': generate_source(5000, 1000), 'max_steps': None},
+}
@@ -0,0 +1,257 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####        Compilador de blocos básicos para closures       ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+from main import CPU
+from engine import INSTR_SIZE, steps_per_second
+
+# Opcodes que encerram um bloco básico (JMP, Jcc, JSR, RTS, HLT)
+TERMINATORS = {0x8,0x9,0xA,0xB,0xC,0xD,0xE,0xF}
+
+# Limite de instruções por bloco (evita funções gigantes)
+MAX_BLOCK = 64
+
+# Código-fonte gerado -> objeto de código compilado. Recompilar o mesmo
+# bloco (após invalidação ou em outra CPU) reaproveita o compile().
+_CODE_CACHE = {}
+_CODE_CACHE_MAX = 4096
+
+
+class Block:
+    """Bloco compilado: função gerada e faixa de bytes que ele cobre."""
+    __slots__ = ('start','addrs','n','halts','fn','source')
+
+    def __init__(self, start, addrs, n, halts, fn, source):
+        self.start = start     # endereço inicial (chave do cache)
+        self.addrs = addrs     # bytes de código lidos pelo bloco
+        self.n = n             # nº de instruções quando executado inteiro
+        self.halts = halts     # True se termina em HLT
+        self.fn = fn           # closure gerada; retorna nº de instruções executadas
+        self.source = source   # código Python gerado (para depuração)
+
+
+class BlockCPU(CPU):
+    """
+    CPU que compila trechos lineares (até o próximo JMP/Jcc/JSR/RTS/HLT)
+    em uma única função Python, guardada em cache pelo endereço inicial.
+
+    Um STA que escreve dentro da faixa de um bloco descarta o bloco,
+    então programas automodificáveis continuam corretos.
+    Escritas externas em `memory` exigem `invalidate_all()`.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.blocks = {}                          # início -> Block
+        self.owners = [set() for _ in range(256)] # endereço -> inícios de blocos
+
+    # ---------- Cache de blocos ----------
+
+    def invalidate(self, addr):
+        """Descarta todos os blocos que cobrem o byte `addr`."""
+        starts = self.owners[addr&0xFF]
+        for s in list(starts):
+            blk = self.blocks.pop(s, None)
+            if blk is not None:
+                for a in blk.addrs:
+                    self.owners[a].discard(s)
+
+    def invalidate_all(self):
+        self.blocks.clear()
+        for o in self.owners: o.clear()
+
+    def assemble(self, src):
+        r = super().assemble(src)
+        self.invalidate_all()
+        return r
+
+    def reset(self):
+        super().reset()
+        self.invalidate_all()
+
+    def load_image(self, data, origin=0):
+        super().load_image(data, origin)
+        self.invalidate_all()
+
+    def store(self, addr, val):
+        # STA executado passo a passo (fetch) também descarta os blocos
+        self.memory[addr] = val
+        if self.owners[addr]: self.invalidate(addr)
+
+    # ---------- Compilação ----------
+
+    def compile_block(self, start):
+        """
+        Gera o bloco que começa em `start`.
+        Retorna None se a primeira instrução for inválida
+        (o erro é então reportado por CPU.fetch).
+        """
+        mem = self.memory
+        instrs = []
+        a = start
+        while len(instrs) < MAX_BLOCK:
+            opc, mode = self.decode(mem[a])
+            if opc in (0x2,0x3): break
+            if mode==0x0 and (opc==0x1 or opc in TERMINATORS and opc not in (0xD,0xF)): break
+            nxt = (a+INSTR_SIZE[opc])&0xFF
+            v = mem[(a+1)&0xFF]
+            ea = (nxt+self.signed8(v))&0xFF if mode==0x3 else v
+            instrs.append((a, opc, mode, v, ea, nxt))
+            a = nxt
+            if opc in TERMINATORS: break
+        if not instrs: return None
+
+        # STA direto que escreve em uma instrução posterior do mesmo
+        # bloco: o bloco termina logo após esse STA
+        for i, (a, opc, mode, v, ea, nxt) in enumerate(instrs):
+            if opc==0x1 and mode!=0x2:
+                later = set()
+                for ins in instrs[i+1:]:
+                    later.add(ins[0])
+                    if INSTR_SIZE[ins[1]]==2: later.add((ins[0]+1)&0xFF)
+                if ea in later:
+                    instrs = instrs[:i+1]
+                    break
+
+        addrs = set()
+        for ins in instrs:
+            addrs.add(ins[0])
+            if INSTR_SIZE[ins[1]]==2: addrs.add((ins[0]+1)&0xFF)
+
+        src, halts = self._gen_source(instrs)
+        code = _CODE_CACHE.get(src)
+        if code is None:
+            if len(_CODE_CACHE) >= _CODE_CACHE_MAX: _CODE_CACHE.clear()
+            code = _CODE_CACHE[src] = compile(src, f'<bloco {start:02X}>', 'exec')
+        ns = self.block_globals()
+        exec(code, ns)
+        blk = Block(start, addrs, len(instrs), halts, ns['blk'], src)
+        self.blocks[start] = blk
+        for x in addrs: self.owners[x].add(start)
+        return blk
+
+    def block_globals(self):
+        """Nomes globais visíveis ao código gerado."""
+        return {'cpu': self, 'mem': self.memory, 'owners': self.owners, 'drop': self.invalidate}
+
+    def exit_source(self, executed):
+        """
+        Linhas extras emitidas em cada saída do bloco, antes do return;
+        `executed` são as instruções executadas até essa saída. Ponto de
+        extensão para contadores (ver timing.TimedCPU).
+        """
+        return ()
+
+    def _gen_source(self, instrs):
+        """Gera o código-fonte Python de um bloco."""
+        out = ['def blk():', '    ac = cpu.ac']
+        # flags alterados no bloco: N/Z saem de ac, C/V dos operandos
+        # (ca, cb) do último ADD; a CPU recebe o mesmo registro preguiçoso
+        st = {'nz': False, 'cv': False}
+
+        def writeback(ind, pc_expr, count):
+            w = [f'{ind}cpu.ac = ac']
+            if st['nz']: w.append(f'{ind}cpu._nz = ac')
+            if st['cv']: w.append(f'{ind}cpu._ca = ca; cpu._cb = cb')
+            w.append(f'{ind}cpu.pc = {pc_expr}')
+            w.extend(ind+line for line in self.exit_source(instrs[:count]))
+            w.append(f'{ind}return {count}')
+            return w
+
+        def flag(name):
+            if name=='negative': return '(ac>>7)' if st['nz'] else 'cpu.negative'
+            if name=='zero': return '(not ac)' if st['nz'] else 'cpu.zero'
+            if not st['cv']: return f'cpu.{name}'
+            if name=='carry': return '((ca+cb)>>8)'
+            return '(((ca^(ca+cb))&(cb^(ca+cb))&0x80)>>7)'
+
+        halts = False
+        later_bytes = []
+        for ins in instrs:
+            later_bytes.append({ins[0]} | ({(ins[0]+1)&0xFF} if INSTR_SIZE[ins[1]]==2 else set()))
+
+        for i, (a, opc, mode, v, ea, nxt) in enumerate(instrs):
+            count = i+1
+            out.append(f'    # {a:02X}: opc={opc:X} modo={mode}')
+            if mode==0x0: operand = str(v)
+            elif mode==0x2: operand = f'mem[mem[{ea}]]'
+            else: operand = f'mem[{ea}]'
+
+            if opc==0x0:
+                out.append('    ac ^= 0xFF'); st['nz'] = True
+            elif opc==0x4:
+                out.append(f'    ac = {operand}'); st['nz'] = True
+            elif opc==0x5:
+                out.append(f'    ca = ac; cb = {operand}; ac = (ca+cb)&0xFF')
+                st['nz'] = st['cv'] = True
+            elif opc==0x6:
+                out.append(f'    ac |= {operand}'); st['nz'] = True
+            elif opc==0x7:
+                out.append(f'    ac &= {operand}'); st['nz'] = True
+            elif opc==0x1:
+                if mode==0x2:
+                    out.append(f'    t = mem[{ea}]; mem[t] = ac')
+                    out.append('    if owners[t]: drop(t)')
+                    rest = set().union(*later_bytes[i+1:]) if i+1 < len(instrs) else set()
+                    if rest:
+                        # escrita indireta sobre o restante do bloco: sai já
+                        out.append(f'    if t in {sorted(rest)!r}:')
+                        out.extend(writeback('        ', nxt, count))
+                else:
+                    out.append(f'    mem[{ea}] = ac')
+                    out.append(f'    if owners[{ea}]: drop({ea})')
+            elif opc==0xF:
+                out.extend(writeback('    ', nxt, count)); halts = True
+            elif opc==0xD:
+                out.extend(writeback('    ', 'cpu.rs', count))
+            elif opc==0xC:
+                target = f'mem[{ea}]' if mode==0x2 else str(ea)
+                out.append(f'    cpu.rs = {nxt}')
+                out.extend(writeback('    ', target, count))
+            elif opc in TERMINATORS:
+                target = f'mem[{ea}]' if mode==0x2 else str(ea)
+                if opc==0x8:
+                    out.extend(writeback('    ', target, count))
+                else:
+                    name = {0x9:'carry',0xA:'negative',0xB:'zero',0xE:'overflow'}[opc]
+                    out.extend(writeback('    ', f'{target} if {flag(name)} else {nxt}', count))
+
+        last = instrs[-1]
+        if last[1] not in TERMINATORS:
+            out.extend(writeback('    ', last[5], len(instrs)))
+        return '\n'.join(out)+'\n', halts
+
+    # ---------- Execução ----------
+
+    def run_blocks(self, max_steps=None):
+        """
+        Executa bloco a bloco a partir de PC até HLT.
+        Retorna o número de instruções executadas. Com `max_steps`,
+        para no primeiro limite de bloco em que o total for atingido.
+        """
+        blocks = self.blocks
+        steps = 0
+        while max_steps is None or steps < max_steps:
+            blk = blocks.get(self.pc)
+            if blk is None:
+                blk = self.compile_block(self.pc)
+                if blk is None:
+                    # instrução inválida: CPU.fetch gera o erro
+                    steps += 1
+                    if not self.fetch(): break
+                    continue
+            k = blk.fn()
+            steps += k
+            if blk.halts and k==blk.n: break
+        return steps
+
+
+if __name__=='__main__':
+    ref = steps_per_second(CPU)
+    fast = steps_per_second(BlockCPU, runner=lambda cpu: cpu.run_blocks())
+    print(f'CPU.fetch : {ref:12,.0f} instruções/s')
+    print(f'BlockCPU  : {fast:12,.0f} instruções/s')
+    print(f'Ganho     : {fast/ref:.2f}x')
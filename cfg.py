@@ -0,0 +1,337 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####      Grafo de fluxo de controle e análise estática      ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+import argparse
+import json
+import sys
+
+from engine import INSTR_SIZE, MNEMONICS
+
+# Tipos de aresta
+FALL, JUMP, BRANCH, CALL, RETURN, DYNAMIC = 'fall', 'jump', 'branch', 'call', 'return', 'dynamic'
+
+# Instruções que leem um operando em memória
+_READS = (0x4, 0x5, 0x6, 0x7)
+
+
+def signed8(v):
+    """Mesma conversão de CPU.signed8 (offset do modo relativo)."""
+    v &= 0xFF
+    return v if v < 0x80 else v-0x100
+
+
+class Instr:
+    """Instrução decodificada estaticamente."""
+    __slots__ = ('addr','byte','opc','mode','size','operand','target','error')
+
+    def __init__(self, mem, a):
+        self.addr = a
+        self.byte = b = mem[a]
+        self.opc = opc = b>>4
+        self.mode = mode = (b>>2)&3
+        self.size = INSTR_SIZE[opc]
+        self.operand = v = mem[(a+1)&0xFF] if self.size==2 else None
+        nxt = (a+self.size)&0xFF
+        # endereço efetivo estático (no indireto: o ponteiro)
+        if v is None or mode==0: self.target = None
+        elif mode==3: self.target = (nxt+signed8(v))&0xFF
+        else: self.target = v
+        self.error = None
+        if opc in (0x2, 0x3): self.error = f'opc desconhecido {opc}'
+        elif opc==0x1 and mode==0: self.error = 'STA modo inválido'
+        elif (0x8<=opc<=0xC or opc==0xE) and mode==0: self.error = 'Desvio modo inválido'
+
+    @property
+    def next(self):
+        return (self.addr+self.size)&0xFF
+
+    def text(self):
+        m = MNEMONICS.get(self.opc, '?')
+        if self.operand is None: return m
+        return f"{m} {'#' if self.mode==0 else ''}{self.operand:02X}{('', '', ',I', ',R')[self.mode]}"
+
+
+class Block:
+    """Bloco básico: instruções em sequência, uma entrada e uma saída."""
+    __slots__ = ('start','instrs','succ','pred','label','safe')
+
+    def __init__(self, start):
+        self.start = start
+        self.instrs = []
+        self.succ = []       # [(destino ou None, tipo)]
+        self.pred = set()
+        self.label = None
+        self.safe = True     # nenhum STA pode escrever nos bytes do bloco
+
+    def addrs(self):
+        """Endereços de todos os bytes do bloco (opcodes e operandos)."""
+        return [(i.addr+k)&0xFF for i in self.instrs for k in range(i.size)]
+
+    @property
+    def last(self):
+        return self.instrs[-1]
+
+
+class CFG:
+    """
+    Grafo de fluxo de controle de uma imagem de memória.
+
+    Parte de `entries` (padrão: endereço 0) e segue JMP/Jcc/JSR/RTS;
+    desvios relativos usam a mesma regra de signed8 da CPU. RTS liga-se
+    aos pontos de retorno de todos os JSR alcançados. Desvios indiretos
+    seguem o valor atual do ponteiro; se algum STA pode alterar o
+    ponteiro, a aresta é marcada como 'dynamic'.
+
+    `sections` (de assembler.Program ou objfile.ObjectFile) permite
+    apontar código inalcançável e execução que cai em dados; sem elas,
+    labels usados como operando de dados fazem esse papel.
+    """
+
+    def __init__(self, image, symbols=None, entries=None, sections=None):
+        self.mem = bytes(image)
+        self.symbols = dict(symbols or {})
+        self.entries = [e&0xFF for e in (entries if entries is not None else (0,))]
+        self.sections = [tuple(s) for s in sections] if sections is not None else None
+        self.names = {}
+        for name, a in self.symbols.items():
+            self.names.setdefault(a&0xFF, name)
+        self.instrs = {}
+        self.blocks = {}
+        self.writable = set()
+        self.all_writable = False
+        self._falls = set()
+        self.dynamic = False     # há desvio indireto com destino só em execução
+        # com seções, os dados são conhecidos antes da exploração e o
+        # fluxo linear para ao entrar neles; sem seções, dependem das
+        # instruções alcançadas e são calculados depois
+        self._data = self._code = None
+        if self.sections is not None: self._data, self._code = self._section_addrs()
+        self._explore()
+        self._build_blocks()
+        if self.sections is None: self._data = self._operand_addrs()
+        self._writes()
+
+    # ---------- Construção ----------
+
+    def _explore(self):
+        """Percorre as instruções alcançáveis e marca os líderes de bloco."""
+        mem = self.mem; instrs = self.instrs
+        leaders = set(self.entries)
+        self.returns = set()
+        work = list(self.entries)
+        while work:
+            a = work.pop()
+            while a not in instrs:
+                i = instrs[a] = Instr(mem, a)
+                succ = self._static_succ(i)
+                if i.opc==0xC and not i.error:
+                    # o retorno do JSR continua no endereço seguinte
+                    self.returns.add(i.next); succ = succ+[(i.next, RETURN)]
+                if len(succ)==1 and succ[0][1]==FALL:
+                    a = succ[0][0]
+                    if self._enters_data(i, a):
+                        # o bloco termina aqui; o destino não é decodificado
+                        self._falls.add((i.addr, a)); leaders.add(a); break
+                    continue
+                for t, _ in succ:
+                    leaders.add(t); work.append(t)
+                break
+        self._leaders = leaders
+
+    def _enters_data(self, i, a):
+        """True se o fluxo sai de `i` (fora dos dados) para uma instrução em `a` que toca dados."""
+        data = self._data
+        if not data or i.addr in data or (i.size==2 and (i.addr+1)&0xFF in data): return False
+        return a in data or (INSTR_SIZE[self.mem[a]>>4]==2 and (a+1)&0xFF in data)
+
+    def _static_succ(self, i):
+        """Sucessores de `i` ignorando RTS (resolvido depois)."""
+        if i.error or i.opc==0xF or i.opc==0xD: return []
+        if i.opc==0x8 or 0x9<=i.opc<=0xC or i.opc==0xE:
+            t = self.mem[i.target] if i.mode==2 else i.target
+            if i.opc==0x8: return [(t, JUMP)]
+            if i.opc==0xC: return [(t, CALL)]
+            return [(t, BRANCH), (i.next, FALL)]
+        return [(i.next, FALL)]
+
+    def _build_blocks(self):
+        instrs = self.instrs; leaders = self._leaders
+        for start in sorted(leaders):
+            if start not in instrs: continue
+            b = Block(start)
+            b.label = self.names.get(start)
+            a = start
+            while True:
+                i = instrs[a]
+                b.instrs.append(i)
+                if i.error or i.opc in (0x8,0x9,0xA,0xB,0xC,0xD,0xE,0xF): break
+                a = i.next
+                if a in leaders or a not in instrs or len(b.instrs) >= 256:
+                    b.succ.append((a, FALL)); break
+            i = b.last
+            if not i.error:
+                if i.opc==0xD:
+                    b.succ.extend((r, RETURN) for r in sorted(self.returns))
+                elif i.opc==0xC:
+                    b.succ.extend(self._static_succ(i))
+                    b.succ.append((i.next, RETURN))
+                elif i.opc!=0xF and i.opc in (0x8,0x9,0xA,0xB,0xE):
+                    b.succ.extend(self._static_succ(i))
+            self.blocks[start] = b
+        for b in self.blocks.values():
+            for t, _ in b.succ:
+                if t in self.blocks: self.blocks[t].pred.add(b.start)
+
+    def _writes(self):
+        """
+        Conjunto de endereços que algum STA alcançável pode escrever.
+        STA indireto escreve em mem[ponteiro]; se o próprio ponteiro é
+        gravável, qualquer endereço pode ser escrito. Um desvio indireto
+        com ponteiro gravável (aresta 'dynamic') pode levar a código não
+        explorado, cujos STAs não são conhecidos: nesse caso também
+        qualquer endereço pode ser escrito.
+        """
+        stas = [i for i in self.instrs.values() if i.opc==0x1 and not i.error]
+        w = {i.target for i in stas if i.mode!=2}
+        changed = True
+        while changed and not self.all_writable:
+            changed = False
+            for i in stas:
+                if i.mode!=2: continue
+                if i.target in w: self.all_writable = True; break
+                t = self.mem[i.target]
+                if t not in w: w.add(t); changed = True
+        for b in self.blocks.values():
+            # desvio indireto com ponteiro gravável: destino só em execução
+            i = b.last
+            if i.mode==2 and not i.error and i.opc in (0x8,0x9,0xA,0xB,0xC,0xE) \
+               and (self.all_writable or i.target in w):
+                b.succ = [(t, DYNAMIC if k in (JUMP, BRANCH, CALL) else k) for t, k in b.succ]
+                self.dynamic = True
+        if self.dynamic: self.all_writable = True
+        self.writable = set(range(256)) if self.all_writable else w
+        for b in self.blocks.values():
+            b.safe = not any(a in self.writable for a in b.addrs())
+
+    # ---------- Diagnósticos ----------
+
+    def _section_addrs(self):
+        data = set(); code = set()
+        for kind, start, size in self.sections:
+            dest = code if kind=='CODE' else data
+            dest.update((start+k)&0xFF for k in range(min(size, 256)))
+        return data-code, code
+
+    def _operand_addrs(self):
+        """Sem seções: endereços usados como operando de dados."""
+        return {i.target for i in self.instrs.values()
+                if i.opc in _READS+(0x1,) and i.mode in (1,3) and not i.error}
+
+    def _data_addrs(self):
+        return self._data, self._code
+
+    def unreachable(self):
+        """
+        Endereços de instruções de código nunca alcançadas: varredura
+        linear das seções CODE (ou, sem seções, labels não alcançados
+        que não são usados como dados). None (desconhecido) se há desvio
+        dinâmico: qualquer endereço pode ser destino.
+        """
+        if self.dynamic: return None
+        covered = {(i.addr+k)&0xFF for i in self.instrs.values() for k in range(i.size)}
+        data, code = self._data_addrs()
+        out = []
+        if code is not None:
+            for kind, start, size in self.sections:
+                if kind!='CODE': continue
+                a = start; end = start+size
+                while a < end:
+                    i = Instr(self.mem, a&0xFF)
+                    if i.addr not in covered: out.append(i.addr)
+                    a += i.size
+        else:
+            out = [a for a in self.names if a not in covered and a not in data]
+        return sorted(set(out))
+
+    def falls_into_data(self):
+        """Pares (origem, destino) em que o fluxo entra em bytes de dados."""
+        data, _ = self._data_addrs()
+        out = set(self._falls)
+        for b in self.blocks.values():
+            for t, kind in b.succ:
+                if t is not None and t in data: out.add((b.last.addr, t))
+        return sorted(out)
+
+    # ---------- Exportação ----------
+
+    def to_dict(self):
+        return {
+            'entries': self.entries,
+            'blocks': [{'start': b.start, 'label': b.label, 'safe': b.safe,
+                        'instrs': [[i.addr, i.text()] for i in b.instrs],
+                        'succ': [[t, k] for t, k in b.succ]}
+                       for b in sorted(self.blocks.values(), key=lambda b: b.start)],
+            'writable': sorted(self.writable),
+            'unreachable': self.unreachable(),
+            'falls_into_data': self.falls_into_data(),
+        }
+
+    def to_json(self, **kw):
+        return json.dumps(self.to_dict(), **kw)
+
+    def to_dot(self):
+        out = ['digraph cfg {', '  node [shape=box, fontname="monospace"];']
+        for b in sorted(self.blocks.values(), key=lambda b: b.start):
+            head = f'{b.label}:\\l' if b.label else ''
+            body = ''.join(f'{i.addr:02X}  {i.text()}\\l' for i in b.instrs)
+            style = '' if b.safe else ', style=dashed'
+            out.append(f'  b{b.start:02X} [label="{head}{body}"{style}];')
+        for b in self.blocks.values():
+            for t, k in b.succ:
+                if t is None or t not in self.blocks: continue
+                out.append(f'  b{b.start:02X} -> b{t:02X} [label="{k}"];')
+        out.append('}')
+        return '\n'.join(out)+'\n'
+
+
+def from_cpu(cpu, entries=None):
+    """CFG da memória atual de `cpu`, com seus símbolos."""
+    return CFG(cpu.dump_image(), cpu.symbols, entries)
+
+
+def from_source(src, entries=None):
+    """Monta `src` e constrói o CFG, com as seções da montagem."""
+    from assembler import assemble
+    prog = assemble(src)
+    return CFG(prog.image, prog.symbols, entries, prog.sections)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Grafo de fluxo de controle de um programa CLEÓPATRA.')
+    ap.add_argument('source', help='arquivo .asm')
+    ap.add_argument('--format', choices=['dot','json','text'], default='text')
+    ap.add_argument('--entry', type=lambda s: int(s, 16), action='append',
+                    help='endereço de entrada em hexa (padrão: 00)')
+    args = ap.parse_args(argv)
+    with open(args.source, encoding='utf-8') as f:
+        g = from_source(f.read(), args.entry)
+    if args.format=='dot': sys.stdout.write(g.to_dot())
+    elif args.format=='json': print(g.to_json(indent=2))
+    else:
+        for b in sorted(g.blocks.values(), key=lambda b: b.start):
+            succ = ', '.join(f'{k} {t:02X}' if t is not None else k for t, k in b.succ)
+            print(f"{b.start:02X} {b.label or '':10} {len(b.instrs):3} instr "
+                  f"{'seguro' if b.safe else 'gravável':8} -> {succ}")
+        dead = g.unreachable()
+        print('inalcançável:', 'desconhecido (desvio dinâmico)' if dead is None
+              else ' '.join(f'{a:02X}' for a in dead) or '-')
+        print('cai em dados:', ' '.join(f'{a:02X}->{t:02X}' for a, t in g.falls_into_data()) or '-')
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
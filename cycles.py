@@ -0,0 +1,139 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####    Detecção de não-terminação por repetição de estado   ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+import random
+import time
+
+from main import CPU
+
+# Tabelas de Zobrist: um valor aleatório de 64 bits por (endereço, byte)
+# e por valor de cada registrador. O hash do estado é o XOR de todos.
+_rng = random.Random(0xC1E0)
+_Z_MEM = [[_rng.getrandbits(64) for _ in range(256)] for _ in range(256)]
+_Z_AC = [_rng.getrandbits(64) for _ in range(256)]
+_Z_PC = [_rng.getrandbits(64) for _ in range(256)]
+_Z_RS = [_rng.getrandbits(64) for _ in range(256)]
+_Z_FL = [_rng.getrandbits(64) for _ in range(16)]
+
+# Intervalo (em instruções) entre verificações do relógio
+_CLOCK_CHECK = 1024
+
+
+class CycleCPU(CPU):
+    """
+    CPU que mantém um hash incremental do estado completo da máquina
+    (256 bytes de memória + AC, PC, RS e os quatro flags) e detecta
+    laços infinitos pelo algoritmo de Brent: como o estado é finito, um
+    programa que nunca executa HLT acaba repetindo um estado exatamente.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.rehash()
+
+    # ---------- Hash incremental ----------
+
+    def rehash(self):
+        """Recalcula do zero o hash da memória."""
+        h = 0
+        for a, v in enumerate(self.memory): h ^= _Z_MEM[a][v]
+        self.mem_hash = h
+
+    def store(self, addr, val):
+        z = _Z_MEM[addr]
+        self.mem_hash ^= z[self.memory[addr]]^z[val]
+        self.memory[addr] = val
+
+    def state_hash(self):
+        """Hash de 64 bits do estado completo."""
+        fl = self.carry | self.overflow<<1 | self.negative<<2 | self.zero<<3
+        return self.mem_hash^_Z_AC[self.ac]^_Z_PC[self.pc]^_Z_RS[self.rs]^_Z_FL[fl]
+
+    def state(self):
+        """Estado completo (para confirmar colisões de hash)."""
+        return (self.pc, self.ac, self.rs, self.carry, self.overflow,
+                self.negative, self.zero, self.dump_image())
+
+    def assemble(self, src):
+        r = super().assemble(src)
+        self.rehash()
+        return r
+
+    def load_image(self, data, origin=0):
+        super().load_image(data, origin)
+        self.rehash()
+
+    def reset(self):
+        super().reset()
+        self.rehash()
+
+    # ---------- Execução com detecção de laço ----------
+
+    def run_detect(self, max_steps=1000000, timeout=None):
+        """
+        Executa a partir do PC atual até HLT, erro, limite de passos ou
+        repetição comprovada de estado. Guarda apenas um estado salvo
+        (Brent). Retorna um dicionário com:
+          status: 'halt' | 'nonterminating' | 'budget' | 'timeout' | 'error'
+          steps, cycle_length, pc_range (min, max), cycle_pcs, error
+        """
+        res = {'status': None, 'steps': 0, 'cycle_length': None,
+               'pc_range': None, 'cycle_pcs': None, 'error': None}
+        deadline = time.monotonic()+timeout if timeout is not None else None
+        fetch = self.fetch
+        saved_hash = self.state_hash(); saved = self.state()
+        power = lam = 1
+        steps = 0
+        try:
+            while True:
+                if steps >= max_steps:
+                    res['status'] = 'budget'; break
+                if deadline is not None and steps % _CLOCK_CHECK == 0 and time.monotonic() > deadline:
+                    res['status'] = 'timeout'; break
+                steps += 1
+                if not fetch():
+                    res['status'] = 'halt'; break
+                h = self.state_hash()
+                if h == saved_hash and self.state() == saved:
+                    res['status'] = 'nonterminating'; break
+                if power == lam:
+                    saved_hash = h; saved = self.state()
+                    power <<= 1; lam = 0
+                lam += 1
+        except Exception as e:
+            res.update(status='error', error=str(e))
+        res['steps'] = steps
+        if res['status'] == 'nonterminating':
+            # percorre o ciclo uma vez (volta ao mesmo estado) coletando os PCs
+            pcs = set()
+            for _ in range(lam):
+                pcs.add(self.pc); fetch()
+            res.update(cycle_length=lam, pc_range=(min(pcs), max(pcs)), cycle_pcs=sorted(pcs))
+        return res
+
+
+if __name__=='__main__':
+    asm = """
+; contador módulo 16: o overflow esperado por JV nunca acontece
+.CODE #00
+INICIO: LDA X
+        ADD #1
+        AND #0Fh
+        STA X
+        JV FIM
+        JMP INICIO
+FIM:    HLT
+.ENDCODE
+.DATA #20
+X: DB 0
+.ENDDATA
+"""
+    cpu = CycleCPU()
+    cpu.assemble(asm)
+    r = cpu.run_detect(10**6)
+    print(r['status'], f"após {r['steps']} passos; ciclo de {r['cycle_length']} instruções,",
+          'PCs %02X..%02X' % r['pc_range'])
@@ -0,0 +1,268 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####     Dispositivos de E/S mapeados em memória (portas)    ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+import time
+from itertools import islice
+
+from engine import PredecodedCPU, INSTR_SIZE
+
+# Tamanho padrão dos blocos de transferência com o hospedeiro
+CHUNK = 4096
+
+
+class InputPort:
+    """
+    Porta de entrada. `source` é um buffer já preenchido (bytes,
+    bytearray, lista de ints) ou um iterável de ints, consumido em
+    blocos de `chunk` valores. Esgotada a entrada, a leitura devolve
+    `eof` ou, se eof for None, gera erro sem consumir nada (feed() e
+    um novo run() continuam do mesmo LDA).
+    """
+
+    def __init__(self, source=b'', eof=None, chunk=CHUNK):
+        self.eof = eof
+        self.chunk = chunk
+        self.pos = 0
+        self.count = 0       # valores já entregues
+        if isinstance(source, (bytes, bytearray, memoryview, list, tuple)):
+            self.buf = bytes(v&0xFF for v in source) if isinstance(source, (list, tuple)) else bytes(source)
+            self.it = None
+        else:
+            self.buf = b''
+            self.it = iter(source)
+
+    def feed(self, data):
+        """Acrescenta valores ao fim do buffer."""
+        self.buf = self.buf[self.pos:]+bytes(v&0xFF for v in data); self.pos = 0
+
+    def _refill(self):
+        if self.it is None: return False
+        self.buf = bytes(v&0xFF for v in islice(self.it, self.chunk)); self.pos = 0
+        if not self.buf: self.it = None
+        return bool(self.buf)
+
+    def read(self):
+        pos = self.pos
+        if pos >= len(self.buf):
+            if not self._refill():
+                if self.eof is None: raise Exception('Porta de entrada sem dados')
+                return self.eof
+            pos = 0
+        self.pos = pos+1; self.count += 1
+        return self.buf[pos]
+
+
+class OutputPort:
+    """
+    Porta de saída. Os bytes escritos vão para `buffer`; com `sink`
+    (ex.: file.write), o buffer é entregue em blocos de `chunk` bytes e
+    no flush() ao fim de cada run(). Sem sink, tudo fica em `buffer`.
+    """
+
+    def __init__(self, sink=None, chunk=CHUNK):
+        self.sink = sink
+        self.chunk = chunk if sink is not None else float('inf')
+        self.buffer = bytearray()
+        self.count = 0       # bytes já entregues ao sink
+
+    def write(self, v):
+        buf = self.buffer
+        buf.append(v)
+        if len(buf) >= self.chunk: self.flush()
+
+    def flush(self):
+        if self.sink is not None and self.buffer:
+            self.sink(bytes(self.buffer))
+            self.count += len(self.buffer)
+            self.buffer.clear()
+
+    def getvalue(self):
+        """Bytes ainda no buffer (toda a saída, quando não há sink)."""
+        return bytes(self.buffer)
+
+
+# Operações de leitura de operando: aplicam o valor lido ao AC e
+# registram os flags como os handlers de engine
+def _load(cpu, v):
+    cpu.ac = v; cpu._nz = v
+
+def _add(cpu, v):
+    ac = cpu.ac; r = (ac+v)&0xFF
+    cpu._ca = ac; cpu._cb = v
+    cpu.ac = r; cpu._nz = r
+
+def _or(cpu, v):
+    r = cpu.ac|v
+    cpu.ac = r; cpu._nz = r
+
+def _and(cpu, v):
+    r = cpu.ac&v
+    cpu.ac = r; cpu._nz = r
+
+_READ_OPS = {0x4: _load, 0x5: _add, 0x6: _or, 0x7: _and}
+
+
+class IOCPU(PredecodedCPU):
+    """
+    PredecodedCPU com portas de E/S mapeadas em endereços da memória.
+    Leituras de operando (LDA, ADD, OR, AND) de um endereço com porta
+    de entrada consomem um valor da porta; STA em um endereço com porta
+    de saída envia o AC para a porta (a memória não muda). Um endereço
+    pode ter as duas portas. Busca de instrução e ponteiros do modo
+    indireto leem sempre a memória.
+
+    O mapeamento é resolvido na decodificação: nos modos direto e
+    relativo o endereço é fixo, então só as instruções que tocam uma
+    porta ganham handler próprio e as demais usam o handler comum, sem
+    custo extra. No indireto, o teste da porta só é incluído quando há
+    alguma porta mapeada. Mapear ou desmapear descarta a tabela.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.inputs = [None]*256
+        self.outputs = [None]*256
+
+    # ---------- Mapeamento ----------
+
+    def _addr(self, addr):
+        if isinstance(addr, str):
+            if addr not in self.symbols: raise Exception(f'Label desconhecido {addr}')
+            addr = self.symbols[addr]
+        return addr&0xFF
+
+    def map_input(self, addr, port):
+        """Liga `port` (InputPort ou fonte aceita por InputPort) a `addr` (número ou label)."""
+        if not isinstance(port, InputPort): port = InputPort(port)
+        self.inputs[self._addr(addr)] = port
+        self.invalidate_all()
+        return port
+
+    def map_output(self, addr, port=None):
+        """Liga `port` (OutputPort, sink ou None) a `addr` (número ou label)."""
+        if not isinstance(port, OutputPort): port = OutputPort(port)
+        self.outputs[self._addr(addr)] = port
+        self.invalidate_all()
+        return port
+
+    def unmap(self, addr):
+        a = self._addr(addr)
+        self.inputs[a] = self.outputs[a] = None
+        self.invalidate_all()
+
+    def flush(self):
+        """Entrega aos sinks o que está nos buffers de saída."""
+        for p in set(self.outputs):
+            if p is not None: p.flush()
+
+    # ---------- Handlers ----------
+
+    def build_handler(self, a):
+        base = super().build_handler(a)
+        mem = self.memory
+        opc, mode = self.decode(mem[a])
+        if mode==0x0 or (opc!=0x1 and opc not in _READ_OPS): return base
+        ports = self.outputs if opc==0x1 else self.inputs
+        if mode==0x2:
+            if not any(ports): return base
+            return self._build_indirect(base, opc, ports, mem[(a+1)&0xFF], (a+2)&0xFF)
+        nxt = (a+INSTR_SIZE[opc])&0xFF
+        v = mem[(a+1)&0xFF]
+        ea = (nxt+self.signed8(v))&0xFF if mode==0x3 else v
+        port = ports[ea]
+        if port is None: return base
+        cpu = self
+        if opc==0x1:
+            write = port.write
+            def h():
+                write(cpu.ac); cpu.pc = nxt
+                return True
+        else:
+            read = port.read; op = _READ_OPS[opc]
+            def h():
+                op(cpu, read()); cpu.pc = nxt
+                return True
+        return h
+
+    def _build_indirect(self, base, opc, ports, ptr, nxt):
+        mem = self.memory; cpu = self
+        if opc==0x1:
+            def h():
+                p = ports[mem[ptr]]
+                if p is None: return base()
+                p.write(cpu.ac); cpu.pc = nxt
+                return True
+        else:
+            op = _READ_OPS[opc]
+            def h():
+                p = ports[mem[ptr]]
+                if p is None: return base()
+                op(cpu, p.read()); cpu.pc = nxt
+                return True
+        return h
+
+    # ---------- Execução ----------
+
+    def run(self, *args, **kw):
+        """CPU.run seguido de flush() das portas de saída."""
+        try:
+            return super().run(*args, **kw)
+        finally:
+            self.flush()
+
+
+# Dobra cada valor lido da porta IN e escreve em OUT, até ler 0
+STREAM_ASM = """
+.CODE #00
+LOOP:  LDA IN
+       JZ FIM
+       STA T
+       ADD T
+       STA OUT
+       JMP LOOP
+FIM:   HLT
+.ENDCODE
+.DATA #F0
+IN:    DB #00
+OUT:   DB #00
+T:     DB #00
+.ENDDATA
+"""
+
+if __name__=='__main__':
+    import random
+    rng = random.Random(0)
+    values = [rng.randrange(1, 256) for _ in range(100000)]
+    expected = bytes((2*v)&0xFF for v in values)
+
+    # antes: uma execução por valor, reescrevendo a seção de dados
+    cpu = PredecodedCPU()
+    cpu.assemble(STREAM_ASM.replace('JMP LOOP', 'HLT'))
+    image = cpu.dump_image()
+    t0 = time.perf_counter()
+    out = bytearray()
+    for v in values[:10000]:
+        cpu.load_image(image); cpu.pc = 0
+        cpu.memory[cpu.symbols['IN']] = v
+        while cpu.fetch(): pass
+        out.append(cpu.memory[cpu.symbols['OUT']])
+    per_run = (time.perf_counter()-t0)/10000
+    assert bytes(out)==expected[:10000]
+
+    # agora: uma única execução consumindo todo o fluxo
+    cpu = IOCPU()
+    cpu.assemble(STREAM_ASM)
+    cpu.map_input('IN', InputPort(iter(values), eof=0))
+    chunks = []
+    cpu.map_output('OUT', chunks.append)
+    t0 = time.perf_counter()
+    res = cpu.run()
+    dt = time.perf_counter()-t0
+    assert res['status']=='halt' and b''.join(chunks)==expected
+    print(f'uma execução por valor : {per_run*1e6:8.1f} µs/valor')
+    print(f'fluxo em uma execução  : {dt/len(values)*1e6:8.1f} µs/valor  '
+          f'({res["steps"]} instruções, {len(chunks)} blocos de saída)')
@@ -0,0 +1,549 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####          Motor de execução pré-decodificado (tabela)    ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+import time
+
+from main import CPU
+
+# Tamanho (em bytes) de cada instrução, indexado pelo opcode.
+# NOT, RTS e HLT não têm operando; as demais ocupam 2 bytes.
+INSTR_SIZE = [1,2,2,2,2,2,2,2,2,2,2,2,2,1,2,1]
+
+MNEMONICS = {
+    0x0:'NOT',0x1:'STA',0x4:'LDA',0x5:'ADD',0x6:'OR',0x7:'AND',
+    0x8:'JMP',0x9:'JC',0xA:'JN',0xB:'JZ',0xC:'JSR',0xD:'RTS',0xE:'JV',0xF:'HLT'
+}
+
+
+class PredecodedCPU(CPU):
+    """
+    CPU com decodificação antecipada: cada endereço da memória recebe
+    uma função especializada (opcode + modo + operando já resolvidos).
+    Uma entrada só é invalidada quando um STA escreve no byte de opcode
+    ou no byte de operando daquela instrução.
+
+    Escritas feitas diretamente em `memory` por fora do simulador
+    devem ser seguidas de `invalidate(addr)` ou `invalidate_all()`.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # Tabela de handlers (None = ainda não decodificado)
+        self.table = [None]*256
+
+    # ---------- Gerenciamento da tabela ----------
+
+    def invalidate(self, addr):
+        """Descarta as entradas que dependem do byte em `addr`."""
+        addr &= 0xFF
+        self.table[addr] = None
+        self.table[(addr-1)&0xFF] = None
+
+    def invalidate_all(self):
+        """Descarta toda a tabela (ex.: após recarregar a memória)."""
+        self.table[:] = [None]*256
+
+    def predecode(self):
+        """Decodifica antecipadamente os 256 endereços."""
+        table = self.table
+        for a in range(256):
+            table[a] = self.build_handler(a)
+
+    def assemble(self, src):
+        r = super().assemble(src)
+        self.invalidate_all()
+        return r
+
+    def reset(self):
+        super().reset()
+        self.invalidate_all()
+
+    def load_image(self, data, origin=0):
+        super().load_image(data, origin)
+        self.invalidate_all()
+
+    # ---------- Execução ----------
+
+    def fetch(self):
+        """
+        Executa a instrução em PC usando a tabela pré-decodificada.
+        Mesmo contrato de CPU.fetch: retorna False em HLT.
+        """
+        h = self.table[self.pc]
+        if h is None:
+            h = self.table[self.pc] = self.build_handler(self.pc)
+        return h()
+
+    def build_handler(self, a):
+        """
+        Cria o handler da instrução no endereço `a`.
+        O operando imediato e os endereços diretos/relativos ficam
+        fixos na closure; apenas o modo indireto lê ponteiros em tempo
+        de execução.
+        """
+        mem = self.memory
+        b = mem[a]
+        opc, mode = self.decode(b)
+        nxt = (a+INSTR_SIZE[opc])&0xFF
+        v = mem[(a+1)&0xFF]
+        # endereço efetivo constante (direto ou relativo) ou ponteiro (indireto)
+        if mode==0x3:
+            ea = (nxt+self.signed8(v))&0xFF
+        else:
+            ea = v
+        return _BUILDERS[opc](self, a, mode, v, ea, nxt)
+
+
+# ---------- Fábricas de handlers ----------
+# Cada fábrica recebe (cpu, endereço, modo, byte de operando,
+# endereço efetivo, próximo PC) e devolve uma closure sem argumentos.
+
+def _fail(cpu, a, msg):
+    def h():
+        # mesmo estado de PC que CPU.fetch deixaria ao falhar
+        cpu.pc = (a+1)&0xFF
+        raise Exception(msg)
+    return h
+
+def _build_hlt(cpu, a, mode, v, ea, nxt):
+    def h():
+        cpu.pc = nxt
+        return False
+    return h
+
+def _build_not(cpu, a, mode, v, ea, nxt):
+    def h():
+        r = cpu.ac ^ 0xFF
+        cpu.ac = r; cpu.pc = nxt; cpu._nz = r
+        return True
+    return h
+
+def _build_sta(cpu, a, mode, v, ea, nxt):
+    mem = cpu.memory; table = cpu.table
+    if mode==0x0:
+        return _fail(cpu, a, 'STA modo inválido')
+    if mode==0x2:
+        def h():
+            t = mem[ea]
+            mem[t] = cpu.ac; cpu.pc = nxt
+            table[t] = None; table[(t-1)&0xFF] = None
+            return True
+        return h
+    prev = (ea-1)&0xFF
+    def h():
+        mem[ea] = cpu.ac; cpu.pc = nxt
+        table[ea] = None; table[prev] = None
+        return True
+    return h
+
+def _build_lda(cpu, a, mode, v, ea, nxt):
+    mem = cpu.memory
+    if mode==0x0:
+        def h():
+            cpu.ac = v; cpu.pc = nxt; cpu._nz = v
+            return True
+    elif mode==0x2:
+        def h():
+            r = mem[mem[ea]]
+            cpu.ac = r; cpu.pc = nxt; cpu._nz = r
+            return True
+    else:
+        def h():
+            r = mem[ea]
+            cpu.ac = r; cpu.pc = nxt; cpu._nz = r
+            return True
+    return h
+
+def _build_add(cpu, a, mode, v, ea, nxt):
+    mem = cpu.memory
+    if mode==0x0:
+        def h():
+            ac = cpu.ac; r = (ac+v)&0xFF
+            cpu._ca = ac; cpu._cb = v
+            cpu.ac = r; cpu.pc = nxt; cpu._nz = r
+            return True
+    elif mode==0x2:
+        def h():
+            op = mem[mem[ea]]
+            ac = cpu.ac; r = (ac+op)&0xFF
+            cpu._ca = ac; cpu._cb = op
+            cpu.ac = r; cpu.pc = nxt; cpu._nz = r
+            return True
+    else:
+        def h():
+            op = mem[ea]
+            ac = cpu.ac; r = (ac+op)&0xFF
+            cpu._ca = ac; cpu._cb = op
+            cpu.ac = r; cpu.pc = nxt; cpu._nz = r
+            return True
+    return h
+
+def _make_logic(fn):
+    def build(cpu, a, mode, v, ea, nxt):
+        mem = cpu.memory
+        if mode==0x0:
+            def h():
+                r = fn(cpu.ac, v)
+                cpu.ac = r; cpu.pc = nxt; cpu._nz = r
+                return True
+        elif mode==0x2:
+            def h():
+                r = fn(cpu.ac, mem[mem[ea]])
+                cpu.ac = r; cpu.pc = nxt; cpu._nz = r
+                return True
+        else:
+            def h():
+                r = fn(cpu.ac, mem[ea])
+                cpu.ac = r; cpu.pc = nxt; cpu._nz = r
+                return True
+        return h
+    return build
+
+# Leitura de cada flag: as propriedades de CPU, que calculam N/Z/C/V a
+# partir da última operação registrada
+_FLAG = {name: getattr(CPU, name).fget for name in ('carry', 'negative', 'zero', 'overflow')}
+
+def _make_jump(flag):
+    """Fábrica de desvios; `flag` é o nome do flag testado (None = JMP)."""
+    test = _FLAG.get(flag)
+    def build(cpu, a, mode, v, ea, nxt):
+        mem = cpu.memory
+        if mode==0x0:
+            return _fail(cpu, a, 'Desvio modo inválido')
+        if flag is None:
+            if mode==0x2:
+                def h():
+                    cpu.pc = mem[ea]
+                    return True
+            else:
+                def h():
+                    cpu.pc = ea
+                    return True
+        elif mode==0x2:
+            def h():
+                cpu.pc = mem[ea] if test(cpu) else nxt
+                return True
+        else:
+            def h():
+                cpu.pc = ea if test(cpu) else nxt
+                return True
+        return h
+    return build
+
+def _build_jsr(cpu, a, mode, v, ea, nxt):
+    mem = cpu.memory
+    if mode==0x0:
+        return _fail(cpu, a, 'Desvio modo inválido')
+    if mode==0x2:
+        def h():
+            cpu.rs = nxt; cpu.pc = mem[ea]
+            return True
+    else:
+        def h():
+            cpu.rs = nxt; cpu.pc = ea
+            return True
+    return h
+
+def _build_rts(cpu, a, mode, v, ea, nxt):
+    def h():
+        cpu.pc = cpu.rs
+        return True
+    return h
+
+def _make_unknown(opc):
+    def build(cpu, a, mode, v, ea, nxt):
+        return _fail(cpu, a, f'opc desconhecido {opc}')
+    return build
+
+_BUILDERS = [
+    _build_not, _build_sta, _make_unknown(0x2), _make_unknown(0x3),
+    _build_lda, _build_add,
+    _make_logic(lambda x, y: x|y), _make_logic(lambda x, y: x&y),
+    _make_jump(None), _make_jump('carry'), _make_jump('negative'), _make_jump('zero'),
+    _build_jsr, _build_rts, _make_jump('overflow'), _build_hlt,
+]
+
+
+# ---------- Superinstruções ----------
+
+# Jcc -> flag testado
+_COND = {0x9:'carry', 0xA:'negative', 0xB:'zero', 0xE:'overflow'}
+
+# Instruções de ULA fundíveis: LDA, ADD, OR, AND
+_ALU = (0x4, 0x5, 0x6, 0x7)
+
+# Maior nº de instruções em uma superinstrução
+MAX_FUSE = 3
+
+
+class FusedCPU(PredecodedCPU):
+    """
+    PredecodedCPU com uma etapa peephole que troca sequências comuns
+    por um único handler (superinstrução):
+
+      LDA x / ADD y / STA z          soma e armazena
+      LDA x / NOT / ADD y            negação (LDA x / NOT / ADD #1)
+      [LDA x /] ULA y / Jcc t        compara e desvia (ULA = LDA, ADD, OR, AND)
+
+    Os flags finais são exatamente os da sequência separada. Só são
+    fundidos operandos imediatos, diretos e relativos; o operando é
+    lido da memória na execução (no imediato, do próprio byte de
+    operando). Um desvio para o meio da sequência cai no handler
+    individual daquele endereço; um STA (ou invalidate) em qualquer
+    byte da sequência descarta a superinstrução.
+
+    Um fetch() pode executar até MAX_FUSE instruções; `extra_steps`
+    acumula as instruções além da primeira. run() conta passos exatos
+    e, com breakpoints ou watchpoints, executa sem fusão.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.fuse = True
+        self.extra_steps = 0
+        # endereço -> inícios de superinstruções que cobrem o byte
+        # (além do 1º byte e do operando, já tratados pela tabela)
+        self.cover = [set() for _ in range(256)]
+
+    def invalidate(self, addr):
+        super().invalidate(addr)
+        self.unfuse(addr&0xFF)
+
+    def invalidate_all(self):
+        super().invalidate_all()
+        for c in self.cover: c.clear()
+
+    def unfuse(self, t):
+        """Descarta as superinstruções que cobrem o byte `t`."""
+        table = self.table
+        for s in self.cover[t]: table[s] = None
+        self.cover[t].clear()
+
+    # ---------- Construção ----------
+
+    def _decode_at(self, a):
+        """(opc, modo, fonte do operando, próximo) da instrução em `a`, ou None se não fundível."""
+        mem = self.memory
+        opc, mode = self.decode(mem[a])
+        nxt = (a+INSTR_SIZE[opc])&0xFF
+        if opc==0x0: return opc, mode, None, nxt
+        if opc in _ALU or opc==0x1 or opc in _COND:
+            if mode==0x2: return None
+            if mode==0x0 and opc!=0x1 and opc not in _COND: src = (a+1)&0xFF
+            elif mode==0x0: return None
+            elif mode==0x3: src = (nxt+self.signed8(mem[(a+1)&0xFF]))&0xFF
+            else: src = mem[(a+1)&0xFF]
+            return opc, mode, src, nxt
+        return None
+
+    def build_handler(self, a):
+        if self.fuse:
+            h = self._fuse(a)
+            if h is not None: return h
+        return self._build_single(a)
+
+    def _build_single(self, a):
+        """Handler de uma única instrução (sem fusão)."""
+        opc, mode = self.decode(self.memory[a])
+        if opc==0x1 and mode!=0x0:
+            return self._build_sta(a, mode)
+        return PredecodedCPU.build_handler(self, a)
+
+    def _build_sta(self, a, mode):
+        # como _build_sta, mais o descarte das superinstruções
+        cpu = self; mem = self.memory; table = self.table
+        cover = self.cover; unfuse = self.unfuse
+        nxt = (a+2)&0xFF; v = mem[(a+1)&0xFF]
+        ea = (nxt+self.signed8(v))&0xFF if mode==0x3 else v
+        if mode==0x2:
+            def h():
+                t = mem[ea]
+                mem[t] = cpu.ac; cpu.pc = nxt
+                table[t] = None; table[(t-1)&0xFF] = None
+                if cover[t]: unfuse(t)
+                return True
+            return h
+        prev = (ea-1)&0xFF
+        def h():
+            mem[ea] = cpu.ac; cpu.pc = nxt
+            table[ea] = None; table[prev] = None
+            if cover[ea]: unfuse(ea)
+            return True
+        return h
+
+    def _fuse(self, a):
+        i1 = self._decode_at(a)
+        if i1 is None: return None
+        i2 = self._decode_at(i1[3])
+        if i2 is None: return None
+        i3 = self._decode_at(i2[3])
+        seq = [i1, i2] + ([i3] if i3 is not None else [])
+        ops = [i[0] for i in seq]
+        h = None
+        if ops[:3]==[0x4, 0x5, 0x1]:
+            h = self._fuse_lda_add_sta(i1[2], i2[2], i3[2], i3[3]); n = 3
+        elif ops[:3]==[0x4, 0x0, 0x5]:
+            h = self._fuse_lda_not_add(i1[2], i3[2], i3[3]); n = 3
+        elif len(ops)==3 and ops[0]==0x4 and ops[1] in _ALU and ops[2] in _COND:
+            h = self._fuse_alu_jcc(i1[2], ops[1], i2[2], _COND[ops[2]], i3[2], i3[3]); n = 3
+        elif ops[0] in _ALU and ops[1] in _COND:
+            h = self._fuse_alu_jcc(None, ops[0], i1[2], _COND[ops[1]], i2[2], i2[3]); n = 2
+        if h is None: return None
+        # bytes cobertos além do 1º byte e do operando da 1ª instrução
+        end = seq[n-1][3]; t = (a+2)&0xFF
+        while t != end:
+            self.cover[t].add(a); t = (t+1)&0xFF
+        return h
+
+    def _fuse_lda_add_sta(self, x, y, z, nxt):
+        cpu = self; mem = self.memory; table = self.table
+        cover = self.cover; unfuse = self.unfuse
+        zp = (z-1)&0xFF
+        def h():
+            ac = mem[x]; op = mem[y]; r = (ac+op)&0xFF
+            cpu._ca = ac; cpu._cb = op
+            cpu.ac = r; cpu._nz = r
+            mem[z] = r; cpu.pc = nxt
+            table[z] = None; table[zp] = None
+            if cover[z]: unfuse(z)
+            cpu.extra_steps += 2
+            return True
+        return h
+
+    def _fuse_lda_not_add(self, x, y, nxt):
+        cpu = self; mem = self.memory
+        def h():
+            ac = mem[x]^0xFF; op = mem[y]; r = (ac+op)&0xFF
+            cpu._ca = ac; cpu._cb = op
+            cpu.ac = r; cpu._nz = r
+            cpu.pc = nxt
+            cpu.extra_steps += 2
+            return True
+        return h
+
+    def _fuse_alu_jcc(self, x, opc, y, flag, t, nxt):
+        cpu = self; mem = self.memory
+        extra = 1 if x is None else 2
+        test = _FLAG[flag]
+        if opc==0x5:
+            def h():
+                ac = cpu.ac if x is None else mem[x]
+                op = mem[y]; r = (ac+op)&0xFF
+                cpu._ca = ac; cpu._cb = op
+                cpu.ac = r; cpu._nz = r
+                cpu.pc = t if test(cpu) else nxt
+                cpu.extra_steps += extra
+                return True
+            return h
+        if opc==0x4: fn = lambda ac, op: op
+        elif opc==0x6: fn = lambda ac, op: ac|op
+        else: fn = lambda ac, op: ac&op
+        def h():
+            r = fn(cpu.ac if x is None else mem[x], mem[y])
+            cpu.ac = r; cpu._nz = r
+            cpu.pc = t if test(cpu) else nxt
+            cpu.extra_steps += extra
+            return True
+        return h
+
+    # ---------- Execução ----------
+
+    def run(self, max_steps=None, breakpoints=(), watch_reads=(), watch_writes=()):
+        if breakpoints or watch_reads or watch_writes:
+            # paradas no meio de uma sequência exigem instruções separadas
+            self.fuse = False; self.invalidate_all()
+            try:
+                return super().run(max_steps, breakpoints, watch_reads, watch_writes)
+            finally:
+                self.fuse = True; self.invalidate_all()
+        res = {'status':None,'steps':0,'pc':None,'addr':None,
+               'access':None,'watch':None,'error':None}
+        limit = max_steps if max_steps is not None else float('inf')
+        fetch = self.fetch
+        base = self.extra_steps
+        calls = 0
+        a = self.pc
+        try:
+            while True:
+                left = limit-calls-(self.extra_steps-base)
+                if left <= 0: res['status']='budget'; break
+                a = self.pc
+                calls += 1
+                if left < MAX_FUSE:
+                    # perto do limite: uma instrução por vez, sem fusão
+                    ok = self._build_single(a)()
+                else:
+                    ok = fetch()
+                if not ok: res['status']='halt'; break
+        except Exception as e:
+            res['status']='error'; res['error']=str(e)
+        if res['status']!='budget': res['addr']=a
+        res['steps']=calls+self.extra_steps-base; res['pc']=self.pc
+        return res
+
+
+# ---------- Comparação de desempenho ----------
+
+BENCH_ASM = """
+; laço de contagem: soma VALOR em SOMA até o contador zerar
+.CODE #00
+LOOP:  LDA CONT
+       ADD #FFh
+       STA CONT
+       JZ FIM
+       LDA SOMA
+       ADD VALOR
+       STA SOMA
+       JC VAI
+       JMP LOOP
+VAI:   LDA ALTO
+       ADD #1
+       STA ALTO
+       JMP LOOP
+FIM:   HLT
+.ENDCODE
+.DATA #40
+CONT: DB #FF
+SOMA: DB #00
+ALTO: DB #00
+VALOR: DB #07
+.ENDDATA
+"""
+
+def steps_per_second(cpu_class, src=BENCH_ASM, repeat=200, runner=None):
+    """
+    Executa `src` `repeat` vezes e retorna passos/s.
+    A montagem é feita uma vez; cada repetição restaura a imagem.
+    `runner(cpu)` executa até HLT e retorna o nº de passos
+    (padrão: laço de fetch()).
+    """
+    cpu = cpu_class()
+    cpu.assemble(src)
+    image = cpu.dump_image()
+    if runner is None:
+        def runner(cpu):
+            n = 0
+            while True:
+                n += 1
+                if not cpu.fetch(): return n
+    steps = 0
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        cpu.load_image(image)
+        cpu.pc = 0
+        steps += runner(cpu)
+    dt = time.perf_counter()-t0
+    return steps/dt
+
+if __name__=='__main__':
+    ref = steps_per_second(CPU)
+    fast = steps_per_second(PredecodedCPU)
+    fused = steps_per_second(FusedCPU, runner=lambda cpu: cpu.run()['steps'])
+    print(f'CPU.fetch         : {ref:12,.0f} passos/s')
+    print(f'PredecodedCPU     : {fast:12,.0f} passos/s')
+    print(f'FusedCPU          : {fused:12,.0f} passos/s')
+    print(f'Ganho             : {fast/ref:.2f}x / {fused/ref:.2f}x')
@@ -0,0 +1,578 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####      Fuzzing diferencial entre montadores e motores     ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from main import CPU
+import main2
+from assembler import _LINE, assemble
+from blocks import BlockCPU
+from cycles import CycleCPU
+from engine import PredecodedCPU, FusedCPU
+from incremental import AssemblySession
+from memo import MemoCPU
+from profiler import ProfilingCPU
+from timetravel import TimeTravelCPU
+try:
+    import vector
+except ImportError:    # sem NumPy: o motor vetorial fica de fora
+    vector = None
+
+# Opcodes que cada motor passo a passo implementa. main2.CPU só tem
+# NOT, STA, LDA, ADD e HLT (e falha nos opcodes 2 e 3, como os demais);
+# ao chegar a outro opcode, o motor sai da comparação daquele programa.
+_FULL_ISA = frozenset(range(16))
+_MAIN2_ISA = frozenset((0x0, 0x1, 0x2, 0x3, 0x4, 0x5, 0xF))
+
+# Motores comparados instrução a instrução com 'ref' (via fetch())
+STEP_ENGINES = {
+    'ref': (CPU, _FULL_ISA),
+    'main2': (main2.CPU, _MAIN2_ISA),
+    'predecoded': (PredecodedCPU, _FULL_ISA),
+    'profiling': (ProfilingCPU, _FULL_ISA),
+    'timetravel': (TimeTravelCPU, _FULL_ISA),
+    'cycle': (CycleCPU, _FULL_ISA),
+}
+
+REGS = ('ac', 'pc', 'rs', 'carry', 'overflow', 'negative', 'zero')
+
+DEFAULT_MAX_STEPS = 256
+DEFAULT_BATCH = 256
+SHRINK_BUDGET = 2000      # execuções de teste por redução
+
+
+def _regs(cpu):
+    return (cpu.ac, cpu.pc, cpu.rs, cpu.carry, cpu.overflow, cpu.negative, cpu.zero)
+
+
+def _load(cpu, image):
+    if hasattr(cpu, 'reset'): cpu.reset()
+    else:   # main2.CPU não tem reset()
+        cpu.ac = cpu.pc = cpu.rs = 0
+        cpu.carry = cpu.overflow = cpu.negative = cpu.zero = 0
+    cpu.load_image(image)
+
+
+def _final(status, steps, cpu):
+    return {'status': status, 'steps': steps, 'regs': _regs(cpu), 'memory': bytes(cpu.memory)}
+
+
+# Instâncias reaproveitadas entre programas (uma por processo)
+_instances = {}
+
+
+def _instance(name, cls):
+    cpu = _instances.get(name)
+    if cpu is None: cpu = _instances[name] = cls()
+    return cpu
+
+
+# ---------- Motores de execução completa ----------
+# Recebem as imagens de um lote e retornam o estado final de cada uma.
+
+def _runner(name, cls):
+    """Motor cujo run() conta passos exatos (FusedCPU, MemoCPU)."""
+    def run(images, max_steps):
+        cpu = _instance(name, cls)
+        out = []
+        for image in images:
+            _load(cpu, image)
+            res = cpu.run(max_steps)
+            out.append(_final(res['status'], res['steps'], cpu))
+        return out
+    return run
+
+
+def _run_blocks(images, max_steps):
+    cpu = _instance('blocks', BlockCPU)
+    out = []
+    for image in images:
+        _load(cpu, image)
+        try:
+            steps = cpu.run_blocks(max_steps)
+        except Exception:
+            out.append({'status': 'error', 'steps': None, 'regs': None, 'memory': None}); continue
+        # run_blocks só para em limite de bloco: 'limit' = atingiu
+        # max_steps (ou passou dele), com ou sem HLT no fim
+        out.append(_final('halt' if steps < max_steps else 'limit', steps, cpu))
+    return out
+
+
+def _run_vector(images, max_steps):
+    vc = vector.VectorCPU(vector.np.frombuffer(b''.join(images), dtype=vector.np.uint8))
+    vc.run(max_steps)
+    names = {vector.RUNNING: 'budget', vector.HALTED: 'halt', vector.ERROR: 'error'}
+    out = []
+    for i in range(len(images)):
+        s = vc.lane(i)
+        out.append({'status': names[s['status']], 'steps': s['steps'],
+                    'regs': (s['ac'], s['pc'], s['rs'], s['c'], s['v'], s['n'], s['z']),
+                    'memory': vc.lane_memory(i)})
+    return out
+
+
+RUN_ENGINES = {'fused': _runner('fused', FusedCPU), 'memo': _runner('memo', MemoCPU),
+               'blocks': _run_blocks}
+if vector is not None: RUN_ENGINES['vector'] = _run_vector
+
+ENGINES = list(STEP_ENGINES)+list(RUN_ENGINES)
+
+
+# ---------- Montadores ----------
+# Montam `src` sobre a memória inicial `base`: (imagem, símbolos).
+
+def _asm_ref(src, base):
+    cpu = CPU(); cpu.load_image(base); cpu.assemble(src)
+    return cpu.dump_image(), cpu.symbols
+
+
+def _asm_single(src, base):
+    cpu = CPU(); cpu.load_image(base); assemble(src).load(cpu)
+    return cpu.dump_image(), cpu.symbols
+
+
+def _asm_incremental(src, base):
+    s = AssemblySession(base); s.update(src)
+    return bytes(s.image), s.symbols
+
+
+def _asm_main2(src, base):
+    cpu = main2.CPU(); cpu.load_image(base); cpu.assemble(src)
+    return cpu.dump_image(), cpu.symbols
+
+
+ASSEMBLERS = {'ref': _asm_ref, 'assembler': _asm_single,
+              'incremental': _asm_incremental, 'main2': _asm_main2}
+
+# Montadores que prometem as mesmas mensagens de erro de CPU.assemble
+_EXACT_ERRORS = frozenset(('assembler', 'incremental'))
+
+
+# ---------- Geração de programas ----------
+
+_ALU = ('LDA', 'ADD', 'OR', 'AND')
+_JUMPS = ('JMP', 'JC', 'JN', 'JZ', 'JV', 'JSR')
+_MNEMS = _ALU*3+('STA',)*3+_JUMPS+('NOT', 'NOT', 'RTS', 'HLT')
+
+
+def _number(rng, v):
+    """`v` num dos formatos aceitos por parse_value (inclusive os ambíguos)."""
+    k = rng.randrange(6)
+    if k==0: return f'{v:02X}h'
+    if k==1: return f'{v:b}b'
+    if k==2: return f'0x{v:02X}'
+    if k==3: return f'{v:X}'
+    return str(v)
+
+
+def generate(rng, max_lines=32):
+    """
+    Programa aleatório válido: (fonte, memória inicial de 256 bytes).
+    Código em 00 com labels L<n>, dados em .DATA com labels V<n> (nomes
+    que não se confundem com números hexa), operandos em todos os modos
+    e formatos numéricos; a memória inicial é zerada ou aleatória, e o
+    programa pode executar dados ou sair do código.
+    """
+    n = rng.randint(1, max_lines)
+    ncode = rng.randint(0, min(n, 6))
+    code_at = dict(zip(rng.sample(range(n), ncode), range(ncode)))
+    ndata = rng.randint(0, 6)
+    code = [f'L{k}' for k in range(ncode)]
+    data = [f'V{k}' for k in range(ndata)]
+
+    def operand(m):
+        r = rng.random()
+        if m in _JUMPS:
+            if code and r < 0.6: tok = rng.choice(code)
+            elif r < 0.8: return f'{rng.randint(-24, 24)},R'
+            else: tok = _number(rng, rng.randrange(256))
+            return tok+(',I' if rng.random() < 0.1 else '')
+        if m!='STA' and r < 0.3: return '#'+_number(rng, rng.randrange(256))
+        if r < 0.4: return f'{rng.randint(-40, 40)},R'
+        tok = rng.choice(data) if data and r < 0.8 else _number(rng, rng.randrange(256))
+        return tok+(',I' if rng.random() < 0.15 else '')
+
+    lines = ['.CODE #00']
+    for i in range(n):
+        m = rng.choice(_MNEMS)
+        text = m if m in ('NOT', 'RTS', 'HLT') else f'{m} {operand(m)}'
+        if i in code_at: text = f'L{code_at[i]}: {text}'
+        lines.append(text)
+    if rng.random() < 0.8: lines.append('HLT')
+    if data:
+        lines.append('.ENDCODE')
+        lines.append(f'.DATA #{rng.randrange(0x60, 0x100-ndata):02X}')
+        for name in data: lines.append(f'{name}: DB {_number(rng, rng.randrange(256))}')
+        lines.append('.ENDDATA')
+    base = bytes(256) if rng.random() < 0.5 else rng.randbytes(256)
+    return '\n'.join(lines)+'\n', base
+
+
+def program(seed, i):
+    """Programa `i` da semente `seed` (reprodutível em qualquer processo)."""
+    return generate(random.Random(f'{seed}:{i}'))
+
+
+# ---------- Comparação ----------
+
+def _mismatch(kind, engine, field, step, expected, got):
+    return {'kind': kind, 'engine': engine, 'field': field, 'step': step,
+            'expected': expected, 'got': got}
+
+
+def signature(m):
+    """
+    Identidade de uma divergência (o que a redução preserva): status
+    inclui os dois valores e erro de montagem, de que lado ele ocorreu.
+    """
+    field = m['field']
+    if field=='status': field = f"status {m['expected']}/{m['got']}"
+    elif field=='error': field = 'error' if m['expected'] is not None else 'error extra'
+    return (m['kind'], m['engine'], field)
+
+
+def _diff_state(regs, mem, cpu_regs, cpu_mem):
+    """(campo, esperado, obtido) da 1ª diferença de estado, ou None."""
+    if regs != cpu_regs:
+        k = next(k for k in range(len(REGS)) if regs[k]!=cpu_regs[k])
+        return REGS[k], regs[k], cpu_regs[k]
+    if mem != cpu_mem:
+        a = next(a for a in range(256) if mem[a]!=cpu_mem[a])
+        return 'memory', f'{a:02X}={mem[a]:02X}', f'{a:02X}={cpu_mem[a]:02X}'
+    return None
+
+
+def check_assembly(src, base, assemblers):
+    """Monta `src` com cada montador; retorna (imagem de 'ref' ou None, divergências)."""
+    try:
+        image, symbols = _asm_ref(src, base)
+        err = None
+    except Exception as e:
+        image = symbols = None; err = str(e)
+    out = []
+    for name in assemblers:
+        if name=='ref': continue
+        try:
+            got, got_sym = ASSEMBLERS[name](src, base)
+            got_err = None
+        except Exception as e:
+            got_err = str(e)
+        if (err is None) != (got_err is None) or (err and name in _EXACT_ERRORS and err!=got_err):
+            out.append(_mismatch('asm', name, 'error', None, err, got_err))
+        elif err is None:
+            if got != image:
+                a = next(a for a in range(256) if got[a]!=image[a])
+                out.append(_mismatch('asm', name, 'image', None,
+                                     f'{a:02X}={image[a]:02X}', f'{a:02X}={got[a]:02X}'))
+            elif got_sym != symbols:
+                s = next(s for s in sorted(set(symbols)|set(got_sym)) if symbols.get(s)!=got_sym.get(s))
+                out.append(_mismatch('asm', name, 'symbols', None,
+                                     f'{s}={symbols.get(s)}', f'{s}={got_sym.get(s)}'))
+    return image, out
+
+
+def check_steps(image, engines, max_steps):
+    """
+    Executa `image` em 'ref' e nos motores passo a passo de `engines`,
+    comparando status, registradores, flags e memória após cada
+    instrução. Um motor sai da comparação na 1ª divergência.
+    Retorna (estado final de 'ref', divergências).
+    """
+    ref = _instance('ref', CPU)
+    _load(ref, image)
+    live = []
+    for name in engines:
+        if name!='ref' and name in STEP_ENGINES:
+            cls, isa = STEP_ENGINES[name]
+            cpu = _instance(name, cls)
+            _load(cpu, image)
+            live.append((name, cpu, isa))
+    out = []
+    rmem = ref.memory
+    status = 'budget'
+    steps = 0
+    while steps < max_steps:
+        opc = rmem[ref.pc]>>4
+        steps += 1
+        try: r = 'run' if ref.fetch() else 'halt'
+        except Exception: r = 'error'
+        if live:
+            regs = _regs(ref)
+            keep = []
+            for t in live:
+                name, cpu, isa = t
+                if opc not in isa: continue
+                try: o = 'run' if cpu.fetch() else 'halt'
+                except Exception: o = 'error'
+                if o!=r:
+                    out.append(_mismatch('exec', name, 'status', steps, r, o)); continue
+                if r!='error':
+                    d = _diff_state(regs, rmem, _regs(cpu), cpu.memory)
+                    if d is not None:
+                        out.append(_mismatch('exec', name, d[0], steps, d[1], d[2])); continue
+                keep.append(t)
+            live = keep
+        if r!='run':
+            status = r; break
+    return _final(status, steps, ref), out
+
+
+def _check_final(name, ref, got, max_steps):
+    """Compara o estado final de um motor de execução completa com o de 'ref'."""
+    st = got['status']
+    if st=='limit':
+        if ref['status']=='error' or ref['steps'] < max_steps:
+            return _mismatch('exec', name, 'status', None, ref['status'], st)
+        if got['steps']!=ref['steps']: return None   # passou do limite: sem estado comparável
+    elif st!=ref['status']:
+        return _mismatch('exec', name, 'status', None, ref['status'], st)
+    elif got['steps'] is not None and got['steps']!=ref['steps']:
+        return _mismatch('exec', name, 'steps', None, ref['steps'], got['steps'])
+    if ref['status']=='error': return None
+    d = _diff_state(ref['regs'], ref['memory'], got['regs'], got['memory'])
+    if d is None: return None
+    return _mismatch('exec', name, d[0], ref['steps'], d[1], d[2])
+
+
+def check(progs, engines=ENGINES, assemblers=tuple(ASSEMBLERS), max_steps=DEFAULT_MAX_STEPS):
+    """
+    Verifica uma lista de programas (fonte, memória inicial). Retorna
+    (divergências de cada programa, total de instruções executadas por 'ref').
+    Os motores de execução completa recebem o lote inteiro de uma vez
+    (o vetorial executa todos os programas em vias paralelas).
+    """
+    results = []
+    images = []; finals = []; where = []
+    total = 0
+    for k, (src, base) in enumerate(progs):
+        image, ms = check_assembly(src, base, assemblers)
+        if image is not None:
+            final, more = check_steps(image, engines, max_steps)
+            ms += more
+            total += final['steps']
+            images.append(image); finals.append(final); where.append(k)
+        results.append(ms)
+    for name in engines:
+        if name not in RUN_ENGINES or not images: continue
+        for k, ref, got in zip(where, finals, RUN_ENGINES[name](images, max_steps)):
+            m = _check_final(name, ref, got, max_steps)
+            if m is not None: results[k].append(m)
+    return results, total
+
+
+# ---------- Redução ----------
+
+def _simplify(line):
+    """Variações mais simples de uma linha (sem label, operando zero)."""
+    label, instr, op = _LINE.match(line.split(';',1)[0]).group('label', 'instr', 'op')
+    if instr is None: return []
+    out = []
+    if label is not None:
+        out.append(f'{instr} {op}' if op else instr)
+    if op and not instr.startswith('.') and instr!='ORG':
+        pre = '#' if op.startswith('#') else ''
+        suf = op[-2:] if op[-2:].upper() in (',I', ',R') else ''
+        zero = f'{pre}0{suf}'
+        if op!=zero:
+            out.append(f'{label}: {instr} {zero}' if label is not None else f'{instr} {zero}')
+    return out
+
+
+def shrink(src, base, sig, engines=ENGINES, assemblers=tuple(ASSEMBLERS),
+           max_steps=DEFAULT_MAX_STEPS, budget=SHRINK_BUDGET):
+    """
+    Reduz um programa que produz a divergência `sig` enquanto ela se
+    mantiver: zera trechos da memória inicial, remove trechos de linhas
+    (metades, quartos, ... até linhas isoladas) e simplifica linhas.
+    Repete até não haver progresso ou esgotar `budget` execuções.
+    Retorna (fonte, memória inicial) reduzidos.
+    """
+    lines = src.splitlines()
+    base = bytes(base)
+    tries = 0
+
+    def still(ls, b):
+        nonlocal tries
+        if tries >= budget: return False
+        tries += 1
+        ms = check([('\n'.join(ls)+'\n', b)], engines, assemblers, max_steps)[0][0]
+        return any(signature(m)==sig for m in ms)
+
+    progress = True
+    while progress and tries < budget:
+        progress = False
+        size = 128
+        while size:
+            for start in range(0, 256, size):
+                if not any(base[start:start+size]): continue
+                cand = base[:start]+bytes(size)+base[start+size:]
+                if still(lines, cand): base = cand; progress = True
+            size //= 2
+        size = max(1, len(lines)//2)
+        while size:
+            i = 0
+            while i < len(lines):
+                cand = lines[:i]+lines[i+size:]
+                if cand and still(cand, base): lines = cand; progress = True
+                else: i += size
+            size //= 2
+        for i in range(len(lines)):
+            for alt in _simplify(lines[i]):
+                cand = lines[:i]+[alt]+lines[i+1:]
+                if still(cand, base): lines = cand; progress = True; break
+    return '\n'.join(lines)+'\n', base
+
+
+# ---------- Processos trabalhadores ----------
+
+def fuzz_batch(seed, start, count, engines, assemblers, max_steps):
+    """Verifica os programas [start, start+count) da semente; divergências com 'program'."""
+    ids = range(start, start+count)
+    results, steps = check([program(seed, i) for i in ids], engines, assemblers, max_steps)
+    found = []
+    for i, ms in zip(ids, results):
+        for m in ms:
+            m['program'] = f'{seed}:{i}'
+            found.append(m)
+    return count, steps, found
+
+
+def shrink_job(m, engines, assemblers, max_steps):
+    """Regera o programa de `m` e o reduz; retorna `m` com 'src' e 'base' (hexa)."""
+    seed, i = m['program'].rsplit(':', 1)
+    src, base = program(seed, int(i))
+    src, base = shrink(src, base, signature(m), engines, assemblers, max_steps)
+    m = dict(m)
+    ms = check([(src, base)], engines, assemblers, max_steps)[0][0]
+    m.update(next(x for x in ms if signature(x)==signature(m)))
+    m['src'] = src
+    m['base'] = base.hex()
+    return m
+
+
+def fuzz(seed=0, count=None, duration=None, workers=None, engines=ENGINES,
+         assemblers=tuple(ASSEMBLERS), max_steps=DEFAULT_MAX_STEPS,
+         batch=DEFAULT_BATCH, do_shrink=True, progress=None):
+    """
+    Gera e verifica programas em um ProcessPoolExecutor até `count`
+    programas ou `duration` segundos. Cada divergência nova (por
+    assinatura) é reduzida uma vez, também no pool.
+    Retorna (estatísticas, {assinatura: divergência reduzida}, contagens).
+    """
+    workers = workers or os.cpu_count() or 1
+    t0 = time.monotonic()
+    stats = {'programs': 0, 'steps': 0}
+    first = {}; counts = {}
+    next_id = 0
+    with ProcessPoolExecutor(workers) as ex:
+        pending = set()
+        shrinking = set()
+
+        def more():
+            if duration is not None and time.monotonic()-t0 >= duration: return False
+            return count is None or next_id < count
+
+        while True:
+            while len(pending) < 2*workers and more():
+                n = batch if count is None else min(batch, count-next_id)
+                pending.add(ex.submit(fuzz_batch, seed, next_id, n, engines, assemblers, max_steps))
+                next_id += n
+            if not pending and not shrinking: break
+            done, _ = wait(pending | shrinking, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut in shrinking:
+                    shrinking.discard(fut)
+                    m = fut.result()
+                    first[signature(m)] = m
+                    continue
+                pending.discard(fut)
+                n, steps, found = fut.result()
+                stats['programs'] += n; stats['steps'] += steps
+                for m in found:
+                    sig = signature(m)
+                    counts[sig] = counts.get(sig, 0)+1
+                    if sig in first: continue
+                    first[sig] = m
+                    if do_shrink:
+                        shrinking.add(ex.submit(shrink_job, m, engines, assemblers, max_steps))
+            if progress is not None: progress(stats, time.monotonic()-t0, len(counts))
+    stats['seconds'] = time.monotonic()-t0
+    stats['programs_per_hour'] = stats['programs']*3600/stats['seconds'] if stats['seconds'] else 0.0
+    return stats, first, counts
+
+
+def _describe(m):
+    step = f" passo {m['step']}" if m.get('step') is not None else ''
+    return (f"[{m['kind']}] {m['engine']}: {m['field']}{step} "
+            f"esperado {m['expected']} obtido {m['got']}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Fuzzing diferencial entre montadores e motores CLEÓPATRA.')
+    ap.add_argument('-n', '--count', type=int, help='número de programas')
+    ap.add_argument('-t', '--duration', type=float, help='segundos de execução')
+    ap.add_argument('-j', '--workers', type=int, default=None, help='processos trabalhadores')
+    ap.add_argument('-s', '--seed', default='0', help='semente (programa i = semente:i)')
+    ap.add_argument('--engines', default=','.join(ENGINES),
+                    help=f'motores separados por vírgula (disponíveis: {",".join(ENGINES)})')
+    ap.add_argument('--assemblers', default=','.join(ASSEMBLERS),
+                    help=f'montadores separados por vírgula (disponíveis: {",".join(ASSEMBLERS)})')
+    ap.add_argument('--max-steps', type=int, default=DEFAULT_MAX_STEPS, help='limite por programa')
+    ap.add_argument('--batch', type=int, default=DEFAULT_BATCH, help='programas por tarefa')
+    ap.add_argument('--no-shrink', action='store_true', help='não reduz as divergências')
+    ap.add_argument('--replay', metavar='SEMENTE:I', help='mostra e verifica um único programa')
+    ap.add_argument('-o', '--output', help='grava as divergências (JSON lines)')
+    args = ap.parse_args(argv)
+    engines = [e for e in args.engines.split(',') if e]
+    assemblers = [a for a in args.assemblers.split(',') if a]
+    for e in engines:
+        if e not in ENGINES: ap.error(f'motor desconhecido: {e}')
+    for a in assemblers:
+        if a not in ASSEMBLERS: ap.error(f'montador desconhecido: {a}')
+
+    if args.replay:
+        seed, i = args.replay.rsplit(':', 1)
+        src, base = program(seed, int(i))
+        sys.stdout.write(src)
+        print(f'; memória inicial: {base.hex()}')
+        ms = check([(src, base)], engines, assemblers, args.max_steps)[0][0]
+        for m in ms: print(_describe(m))
+        return 1 if ms else 0
+
+    if args.count is None and args.duration is None: args.count = 10000
+
+    def progress(stats, elapsed, kinds):
+        if elapsed:
+            print(f"\r{stats['programs']:10,} programas  {stats['programs']*3600/elapsed:14,.0f}/h  "
+                  f"{kinds} divergência(s)", end='', file=sys.stderr, flush=True)
+
+    stats, first, counts = fuzz(args.seed, args.count, args.duration, args.workers, engines,
+                                assemblers, args.max_steps, args.batch, not args.no_shrink, progress)
+    print(file=sys.stderr)
+    print(f"{stats['programs']:,} programas, {stats['steps']:,} instruções em "
+          f"{stats['seconds']:.1f} s ({stats['programs_per_hour']:,.0f} programas/h)")
+    for sig, m in sorted(first.items()):
+        print(f'\n{_describe(m)}  ({counts[sig]} programa(s), ex.: {m["program"]})')
+        if 'src' in m:
+            for line in m['src'].splitlines(): print(f'    {line}')
+            if any(bytes.fromhex(m['base'])):
+                print(f"    ; memória inicial: {m['base']}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for sig, m in sorted(first.items()):
+                f.write(json.dumps(dict(m, count=counts[sig]))+'\n')
+    return 1 if first else 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
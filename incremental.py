@@ -0,0 +1,226 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####        Remontagem incremental para edição ao vivo       ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+from functools import lru_cache
+
+from assembler import _LINE, _BAD, OPCODES, classify, operand_mode, assemble
+
+# Tipos de linha
+_NONE, _SECT, _DB, _INS = range(4)
+
+
+@lru_cache(maxsize=16384)
+def parse_line(text):
+    """
+    Análise de uma linha, independente das demais (e por isso em cache):
+    (label, tipo, a, b), onde conforme o tipo
+      _NONE: linha vazia, só label ou .ENDDATA
+      _SECT: a = novo endereço (None = mantém, _BAD = inválido),
+             b = novo modo .CODE (True/False, None = mantém)
+      _DB:   a = valor (int, _BAD ou nome de símbolo)
+      _INS:  a = opcode (None = inválido), b = (1º byte, operando ou None, tamanho)
+    """
+    m = _LINE.match(text.split(';',1)[0])
+    label, instr, op = m.group('label', 'instr', 'op')
+    if instr is None: return label, _NONE, None, None
+    if instr in ('.CODE', '.DATA', 'ORG'):
+        if instr=='ORG' and not op:
+            return label, _INS, None, (0, None, 1)
+        addr = None
+        if op:
+            try: addr = int(op[1:],16)
+            except ValueError: addr = _BAD
+        return label, _SECT, addr, None if instr=='ORG' else instr=='.CODE'
+    if instr=='.ENDCODE': return label, _SECT, None, False
+    if instr=='.ENDDATA': return label, _NONE, None, None
+    if instr=='DB':
+        return label, _DB, classify(op) if op is not None else _BAD, None
+    opc = OPCODES.get(instr)
+    if op is None:
+        return label, _INS, opc, ((opc or 0)<<4, None, 1)
+    mode, tok = operand_mode(op)
+    val = classify(tok)
+    return label, _INS, opc, (((opc or 0)<<4)|(mode<<2), 0 if val is _BAD else val, 2)
+
+
+class _Line:
+    __slots__ = ('text','rec','idx','addr','mode','out','writes','err')
+
+    def __init__(self, text):
+        self.text = text
+        self.rec = parse_line(text)
+        self.idx = 0
+        self.addr = None      # endereço e modo .CODE no início da linha
+        self.mode = None
+        self.out = None       # (endereço, modo) após a linha
+        self.writes = ()      # ((endereço 0..255, valor int ou símbolo), ...)
+        self.err = False
+
+
+class AssemblySession:
+    """
+    Sessão de montagem incremental. Guarda a análise de cada linha, o
+    endereço de início de cada linha, quem escreve cada byte e quem
+    referencia cada símbolo. A cada edição:
+
+    - só as linhas alteradas são analisadas de novo;
+    - endereços são recalculados a partir da 1ª linha alterada e só até
+      o ponto em que voltam a coincidir com os anteriores;
+    - só os bytes escritos pelas linhas afetadas, ou com operandos cujos
+      labels mudaram de endereço, são recalculados.
+
+    update() retorna a diferença [(endereço, antigo, novo), ...] em
+    relação à última montagem válida. O resultado é o mesmo de
+    CPU.assemble sobre a memória inicial `base`; com erro no fonte, a
+    mesma exceção de CPU.assemble é levantada e a diferença fica
+    acumulada para a próxima montagem válida.
+    """
+
+    def __init__(self, base=None):
+        self.base = bytes(base) if base is not None else bytes(256)
+        self.image = bytearray(self.base)   # última montagem válida
+        self.lines = []
+        self.symbols = {}
+        self._cells = [set() for _ in range(256)]   # escritores de cada byte
+        self._defs = {}        # símbolo -> linhas que o definem
+        self._refs = {}        # símbolo -> linhas que o usam como operando
+        self._bad = set()      # linhas com erro
+        self._symdb = set()    # DBs simbólicos (erro se o símbolo não existir)
+        self._pending = set()  # bytes a comparar na próxima montagem válida
+        self.reparsed = 0      # estatísticas da última edição
+        self.replaced = 0
+
+    # ---------- Edição ----------
+
+    def update(self, src):
+        """Aplica o fonte completo `src`, editando só as linhas que mudaram."""
+        new = src.splitlines()
+        old = [l.text for l in self.lines]
+        n = min(len(old), len(new))
+        i = 0
+        while i < n and old[i]==new[i]: i += 1
+        j = 0
+        while j < n-i and old[-1-j]==new[-1-j]: j += 1
+        return self.edit(i, len(old)-j, new[i:len(new)-j])
+
+    def edit(self, start, end, texts):
+        """Substitui as linhas [start, end) (base 0) por `texts`; retorna a diferença."""
+        lines = self.lines
+        dirty_names = set()
+        for l in lines[start:end]:
+            self._unplace(l, dirty_names)
+        new = [_Line(t) for t in texts]
+        lines[start:end] = new
+        for i in range(start, len(lines)): lines[i].idx = i
+        self.reparsed = len(new)
+
+        state = lines[start-1].out if start > 0 else (0, False)
+        self.replaced = 0
+        for i in range(start, len(lines)):
+            l = lines[i]
+            if i >= start+len(new) and (l.addr, l.mode)==state: break
+            if l.addr is not None: self._unplace(l, dirty_names)
+            self._place(l, state, dirty_names)
+            self.replaced += 1
+            state = l.out
+        # símbolos que mudaram de valor: reavalia os bytes que os usam
+        for name in dirty_names:
+            defs = self._defs.get(name)
+            val = max(defs, key=lambda l: l.idx).addr if defs else None
+            if self.symbols.get(name)==val and (val is not None or name not in self.symbols):
+                continue
+            if val is None: self.symbols.pop(name, None)
+            else: self.symbols[name] = val
+            for l in self._refs.get(name, ()):
+                for a, _ in l.writes: self._pending.add(a)
+        if self._bad or any(l.rec[2] not in self.symbols for l in self._symdb):
+            assemble(self.source())   # levanta a mesma exceção de CPU.assemble
+        return self._commit()
+
+    def _unplace(self, l, dirty_names):
+        cells = self._cells
+        for a, v in l.writes:
+            cells[a].discard(l); self._pending.add(a)
+            if type(v) is str: self._refs[v].discard(l)
+        label = l.rec[0]
+        if label is not None:
+            self._defs[label].discard(l)
+            dirty_names.add(label)
+        self._bad.discard(l); self._symdb.discard(l)
+        l.writes = (); l.err = False
+
+    def _place(self, l, state, dirty_names):
+        addr, mode = state
+        l.addr, l.mode = addr, mode
+        label, kind, a, b = l.rec
+        if label is not None:
+            self._defs.setdefault(label, set()).add(l)
+            dirty_names.add(label)
+        err = False
+        writes = ()
+        if kind==_SECT:
+            if a is _BAD: err = True
+            elif a is not None: addr = a
+            if b is not None: mode = b
+        elif kind==_DB:
+            if a is _BAD or not -256 <= addr <= 0xFF: err = True
+            else: writes = ((addr&0xFF, a),)
+            if type(a) is str: self._symdb.add(l)
+            addr = (addr+1)&0xFF
+        elif kind==_INS:
+            first, val, size = b
+            if not mode or a is None or not -256 <= addr <= 0xFF: err = True
+            elif val is None: writes = ((addr&0xFF, first),)
+            else: writes = ((addr&0xFF, first), ((addr+1)&0xFF, val))
+            addr = (addr+size)&0xFF
+        l.out = (addr, mode)
+        l.writes = writes
+        l.err = err
+        if err: self._bad.add(l)
+        cells = self._cells
+        for c, v in writes:
+            cells[c].add(l); self._pending.add(c)
+            if type(v) is str: self._refs.setdefault(v, set()).add(l)
+
+    def _commit(self):
+        diff = []
+        image = self.image; cells = self._cells; symbols = self.symbols
+        for c in sorted(self._pending):
+            ws = cells[c]
+            if ws:
+                w = max(ws, key=lambda l: l.idx)
+                v = next(v for a, v in w.writes if a==c)
+                if type(v) is str: v = symbols.get(v, 0)
+                v &= 0xFF
+            else:
+                v = self.base[c]
+            if image[c]!=v:
+                diff.append((c, image[c], v))
+                image[c] = v
+        self._pending.clear()
+        return diff
+
+    # ---------- Consultas ----------
+
+    def source(self):
+        return '\n'.join(l.text for l in self.lines)
+
+    def line_map(self):
+        """Mapa linha (base 1) -> endereço, como CPU.line_map."""
+        return {l.idx+1: l.addr for l in self.lines if l.writes}
+
+    def load(self, cpu, diff=None):
+        """
+        Aplica em `cpu` a diferença `diff` (ou a imagem inteira, se None),
+        por load_image, junto com símbolos e mapa de linhas.
+        """
+        if diff is None:
+            cpu.load_image(self.image)
+        else:
+            for a, _, v in diff: cpu.load_image(bytes((v,)), a)
+        cpu.symbols = dict(self.symbols)
+        cpu.line_map = self.line_map()
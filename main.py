@@ -5,21 +5,95 @@
 #### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
 #################################################################
 
+import io
+
 class CPU:
     def __init__(self):
-        # Memória de 256 posições (endereçamento de 8 bits)
-        self.memory = [0]*256
+        # Memória de 256 posições (endereçamento de 8 bits), em um
+        # bytearray exposto sem cópia através de um memoryview
+        self.memory = bytearray(256)
+        self.view = memoryview(self.memory)
         # Registradores principais
         self.ac = 0   # Acumulador
         self.pc = 0   # Program Counter
         self.rs = 0   # Return Stack (para chamadas JSR/RTS)
-        # Flags de status
-        self.carry = 0
-        self.overflow = 0
-        self.negative = 0
-        self.zero = 0
+        # Flags de status, avaliados sob demanda (ver propriedades abaixo)
+        self._reset_flags()
         # Tabela de símbolos (para labels da montagem)
         self.symbols = {}
+        # Mapa linha do fonte -> endereço do primeiro byte gerado
+        self.line_map = {}
+
+    def reset(self):
+        """
+        Volta a CPU ao estado inicial (memória zerada, registradores,
+        flags e tabela de símbolos limpos), reaproveitando a instância.
+        """
+        self.memory[:] = bytes(256)
+        self.ac = self.pc = self.rs = 0
+        self._reset_flags()
+        self.symbols = {}
+        self.line_map = {}
+
+    # ---------- Flags (avaliação preguiçosa) ----------
+    #
+    # LDA, NOT, OR, AND e ADD só registram o resultado (_nz) e, no ADD,
+    # os operandos (_ca, _cb); N/Z/C/V são calculados quando lidos (Jcc,
+    # linha de status, snapshots, hash de estado). None indica que o
+    # valor está materializado em _n/_z ou _c/_v (zerados no início ou
+    # gravados por atribuição direta ao flag).
+
+    def _reset_flags(self):
+        self._nz = None; self._n = 0; self._z = 0
+        self._ca = None; self._cb = 0; self._c = 0; self._v = 0
+
+    @property
+    def negative(self):
+        r = self._nz
+        return self._n if r is None else r>>7
+
+    @negative.setter
+    def negative(self, f):
+        r = self._nz
+        if r is not None: self._z = 0 if r else 1; self._nz = None
+        self._n = f
+
+    @property
+    def zero(self):
+        r = self._nz
+        return self._z if r is None else (0 if r else 1)
+
+    @zero.setter
+    def zero(self, f):
+        r = self._nz
+        if r is not None: self._n = r>>7; self._nz = None
+        self._z = f
+
+    @property
+    def carry(self):
+        a = self._ca
+        return self._c if a is None else (a+self._cb)>>8
+
+    @carry.setter
+    def carry(self, f):
+        a = self._ca
+        if a is not None:
+            b = self._cb; r = (a+b)&0xFF
+            self._v = ((a^r)&(b^r))>>7; self._ca = None
+        self._c = f
+
+    @property
+    def overflow(self):
+        a = self._ca
+        if a is None: return self._v
+        b = self._cb; r = (a+b)&0xFF
+        return ((a^r)&(b^r))>>7
+
+    @overflow.setter
+    def overflow(self, f):
+        a = self._ca
+        if a is not None: self._c = (a+self._cb)>>8; self._ca = None
+        self._v = f
 
     # ---------- Funções auxiliares ----------
 
@@ -102,6 +176,7 @@ class CPU:
         """
         addr = 0
         self.symbols = {}
+        self.line_map = {}
         lines = src.splitlines()
         mode_code = False
         mode_data = False
@@ -162,7 +237,8 @@ class CPU:
                 # grava dado literal em memória
                 val = self.parse_value(op)
                 if val is None: raise Exception(f'Linha {ln}: valor DB inválido {op}')
-                self.memory[addr]=val; addr=(addr+1)&0xFF; continue
+                self.line_map[ln]=addr
+                self.memory[addr]=val&0xFF; addr=(addr+1)&0xFF; continue
             if not mode_code: raise Exception(f'Linha {ln}: instrução fora de .CODE')
 
             # monta instrução
@@ -171,6 +247,7 @@ class CPU:
             mode = self.get_mode(op)
             mode_bits = (mode if mode is not None else 0)&0x03
             first = ((opc&0x0F)<<4) | (mode_bits<<2)
+            self.line_map[ln]=addr
             self.memory[addr]=first; addr=(addr+1)&0xFF
             if op is not None:
                 tok = op
@@ -178,7 +255,7 @@ class CPU:
                     tok=tok[:-2]
                 val = self.parse_value(tok)
                 if val is None: val = 0
-                self.memory[addr]=val; addr=(addr+1)&0xFF
+                self.memory[addr]=val&0xFF; addr=(addr+1)&0xFF
         return True
 
     # ---------- Execução ----------
@@ -196,6 +273,86 @@ class CPU:
         opc,mode = self.decode(instr)
         return self.execute(opc,mode)
 
+    def run(self, max_steps=None, breakpoints=(), watch_reads=(), watch_writes=()):
+        """
+        Executa a partir do PC atual até HLT, erro, limite de passos,
+        breakpoint ou watchpoint. Endereços podem ser números ou labels.
+        - breakpoint: para antes de executar a instrução no endereço
+          (exceto a primeira da chamada, para que run() possa continuar);
+        - watchpoint: para logo após a instrução que leu/escreveu o
+          endereço (operandos e ponteiros; a busca da instrução não conta).
+        Breakpoints e watchpoints são testados em bitmaps de 256 posições;
+        sem nenhum, o laço é só fetch() e contagem de passos.
+        Retorna um dicionário:
+          status: 'halt' | 'budget' | 'breakpoint' | 'watchpoint' | 'error'
+          steps, pc, addr (instrução que parou), access ('read'/'write'),
+          watch (endereço vigiado), error
+        """
+        bp = self._bitmap(breakpoints)
+        wr = self._bitmap(watch_reads)
+        ww = self._bitmap(watch_writes)
+        res = {'status':None,'steps':0,'pc':None,'addr':None,
+               'access':None,'watch':None,'error':None}
+        limit = max_steps if max_steps is not None else float('inf')
+        fetch = self.fetch
+        steps = 0
+        a = self.pc
+        try:
+            if bp is None and wr is None and ww is None:
+                while steps < limit:
+                    a = self.pc
+                    steps += 1
+                    if not fetch(): res['status']='halt'; break
+                else: res['status']='budget'
+            else:
+                watching = wr is not None or ww is not None
+                while steps < limit:
+                    a = self.pc
+                    if bp is not None and bp[a] and steps:
+                        res['status']='breakpoint'; break
+                    if watching:
+                        reads, writes = self._accesses(a)
+                        hit = next((('read',x) for x in reads if wr is not None and wr[x]), None) \
+                           or next((('write',x) for x in writes if ww is not None and ww[x]), None)
+                    steps += 1
+                    if not fetch(): res['status']='halt'; break
+                    if watching and hit:
+                        res['status']='watchpoint'; res['access'], res['watch'] = hit; break
+                else: res['status']='budget'
+        except Exception as e:
+            res['status']='error'; res['error']=str(e)
+        if res['status']!='budget': res['addr']=a
+        res['steps']=steps; res['pc']=self.pc
+        return res
+
+    def _bitmap(self, addrs):
+        """Bitmap de 256 posições com `addrs` (números ou labels), ou None se vazio."""
+        if not addrs: return None
+        bm = bytearray(256)
+        for x in addrs:
+            if isinstance(x, str):
+                if x not in self.symbols: raise Exception(f'Label desconhecido {x}')
+                x = self.symbols[x]
+            bm[x&0xFF] = 1
+        return bm
+
+    def _accesses(self, a):
+        """
+        Endereços de dados (lidos, escritos) pela instrução em `a`,
+        calculados antes de executá-la.
+        """
+        mem = self.memory
+        opc, mode = self.decode(mem[a])
+        if mode==0x0 or opc in (0x0,0x2,0x3,0xD,0xF): return (), ()
+        v = mem[(a+1)&0xFF]
+        if mode==0x1: ea = v
+        elif mode==0x2: ea = mem[v]
+        else: ea = (a+2+self.signed8(v))&0xFF
+        ptr = (v,) if mode==0x2 else ()
+        if opc==0x1: return ptr, (ea,)
+        if 0x4<=opc<=0x7: return ptr+(ea,), ()
+        return ptr, ()    # desvios: só o ponteiro do modo indireto
+
     def execute(self, opc, mode):
         """
         Executa a instrução decodificada.
@@ -206,21 +363,21 @@ class CPU:
 
         if opc==0x0: # NOT
             self.ac=(~self.ac)&0xFF
-            self.update_flags(self.ac)
+            self._nz=self.ac
             return True
 
         if opc==0x1: # STA
             # Diferentes modos de endereçamento
             if mode==0x1:  # direto
                 addr=self.memory[self.pc]; self.pc=(self.pc+1)&0xFF
-                self.memory[addr]=self.ac&0xFF
+                self.store(addr,self.ac&0xFF)
             elif mode==0x2:  # indireto
                 ptr=self.memory[self.pc]; self.pc=(self.pc+1)&0xFF
-                addr=self.memory[ptr]; self.memory[addr]=self.ac&0xFF
+                addr=self.memory[ptr]; self.store(addr,self.ac&0xFF)
             elif mode==0x3:  # relativo
                 off=self.memory[self.pc]; self.pc=(self.pc+1)&0xFF
                 addr=(self.pc+self.signed8(off))&0xFF
-                self.memory[addr]=self.ac&0xFF
+                self.store(addr,self.ac&0xFF)
             else:
                 raise Exception('STA modo inválido')
             return True
@@ -239,7 +396,7 @@ class CPU:
                 off=self.memory[self.pc]; self.pc=(self.pc+1)&0xFF
                 addr=(self.pc+self.signed8(off))&0xFF
                 self.ac=self.memory[addr]
-            self.update_flags(self.ac)
+            self._nz=self.ac
             return True
 
         if opc==0x5: # ADD
@@ -249,43 +406,93 @@ class CPU:
             elif mode==0x2: ptr=self.memory[self.pc]; self.pc=(self.pc+1)&0xFF; addr=self.memory[ptr]; op=self.memory[addr]
             elif mode==0x3: off=self.memory[self.pc]; self.pc=(self.pc+1)&0xFF; addr=(self.pc+self.signed8(off))&0xFF; op=self.memory[addr]
             else: raise Exception('ADD modo inválido')
-            # soma com AC e atualiza flags
-            res=self.ac+op
-            self.carry=1 if res>0xFF else 0
-            self.overflow=1 if (((self.ac^op)&0x80)==0 and ((self.ac^res)&0x80)!=0) else 0
-            self.ac=res&0xFF
-            self.update_flags(self.ac)
+            # soma com AC; carry e overflow saem dos operandos quando lidos
+            self._ca=self.ac; self._cb=op
+            self.ac=(self.ac+op)&0xFF
+            self._nz=self.ac
             return True
 
-        # (implementações similares para OR, AND, saltos, etc...)
-        # Cada bloco trata um opcode específico e segue o padrão:
-        # - lê operando conforme modo de endereçamento
-        # - executa a operação
-        # - atualiza flags se necessário
-        # - retorna True (continua execução)
+        if opc==0x6 or opc==0x7: # OR / AND
+            # obtém operando
+            if mode==0x0:   op=self.memory[self.pc]; self.pc=(self.pc+1)&0xFF
+            elif mode==0x1: addr=self.memory[self.pc]; self.pc=(self.pc+1)&0xFF; op=self.memory[addr]
+            elif mode==0x2: ptr=self.memory[self.pc]; self.pc=(self.pc+1)&0xFF; addr=self.memory[ptr]; op=self.memory[addr]
+            elif mode==0x3: off=self.memory[self.pc]; self.pc=(self.pc+1)&0xFF; addr=(self.pc+self.signed8(off))&0xFF; op=self.memory[addr]
+            self.ac=(self.ac|op) if opc==0x6 else (self.ac&op)
+            self._nz=self.ac
+            return True
 
-        # RTS, JSR, JMP e condicionais manipulam o PC e RS
-        # JV só desvia se flag overflow = 1
+        if opc==0xD: # RTS
+            self.pc=self.rs
+            return True
+
+        if 0x8<=opc<=0xC or opc==0xE: # JMP, JC, JN, JZ, JSR, JV
+            # calcula endereço de destino conforme modo
+            if mode==0x1:   target=self.memory[self.pc]; self.pc=(self.pc+1)&0xFF
+            elif mode==0x2: ptr=self.memory[self.pc]; self.pc=(self.pc+1)&0xFF; target=self.memory[ptr]
+            elif mode==0x3: off=self.memory[self.pc]; self.pc=(self.pc+1)&0xFF; target=(self.pc+self.signed8(off))&0xFF
+            else: raise Exception('Desvio modo inválido')
+            if opc==0xC: # JSR guarda endereço de retorno em RS
+                self.rs=self.pc; self.pc=target
+            elif (opc==0x8 or (opc==0x9 and self.carry) or (opc==0xA and self.negative)
+                  or (opc==0xB and self.zero) or (opc==0xE and self.overflow)):
+                self.pc=target
+            return True
 
         raise Exception(f'opc desconhecido {opc}')
 
+    def store(self, addr, val):
+        """
+        Grava `val` em memória a pedido de um STA. Ponto único de escrita
+        da execução: subclasses sobrescrevem para registrar as escritas.
+        """
+        self.memory[addr]=val
+
     def update_flags(self, r):
         """
         Atualiza flags N e Z de acordo com resultado (8 bits).
         """
-        r &= 0xFF
-        self.negative = 1 if (r&0x80) else 0
-        self.zero = 1 if r==0 else 0
+        self._nz = r&0xFF
 
     def getMemoryMap(self,posIni=0,posFin=255):
         """
         Retorna string com dump da memória (endereços e valores).
         """
-        buf=''; p=posIni
-        for _ in range(posIni,posFin+1):
-            buf += f'{p:02X} :: {self.memory[p]:02X} ({self.memory[p]:03})\n'
-            p+=1
-        return buf
+        buf=io.StringIO()
+        self.writeMemoryMap(buf,posIni,posFin)
+        return buf.getvalue()
+
+    def writeMemoryMap(self,f,posIni=0,posFin=255):
+        """
+        Escreve o dump da memória (mesmo formato de getMemoryMap)
+        diretamente no arquivo `f`, linha a linha.
+        """
+        view=self.view
+        for p in range(posIni,posFin+1):
+            v=view[p]
+            f.write(f'{p:02X} :: {v:02X} ({v:03})\n')
+
+    # ---------- Imagem de memória ----------
+
+    def load_image(self, data, origin=0):
+        """
+        Copia `data` (bytes, bytearray, memoryview ou lista de ints)
+        para a memória a partir de `origin`, com volta ao endereço 00.
+        """
+        n=len(data)
+        if n>256: raise Exception(f'Imagem de {n} bytes maior que a memória')
+        origin&=0xFF
+        first=min(n,256-origin)
+        self.memory[origin:origin+first]=bytes(data[:first])
+        if first<n: self.memory[0:n-first]=bytes(data[first:])
+
+    def dump_image(self, start=0, end=256):
+        """Retorna uma cópia (bytes) da memória em [start, end)."""
+        return self.view[start:end].tobytes()
+
+    def mem_slice(self, start=0, end=256):
+        """Retorna um memoryview de [start, end) sem copiar os bytes."""
+        return self.view[start:end]
 
     def getSymbolsTable(self):
         """
@@ -5,16 +5,16 @@
 #### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
 #################################################################
 
+import io
 import logging
 
-# Configuração básica do logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
 
 class CPU:
     def __init__(self):
-        # Memória de 256 posições (endereçamento de 8 bits)
-        self.memory = [0]*256
+        # Memória de 256 posições (endereçamento de 8 bits), em um
+        # bytearray exposto sem cópia através de um memoryview
+        self.memory = bytearray(256)
+        self.view = memoryview(self.memory)
         # Registradores principais
         self.ac = 0   # Acumulador
         self.pc = 0   # Program Counter
@@ -192,7 +192,7 @@ class CPU:
                 if val is None:
                     raise Exception(f'Linha {ln}: Valor DB inválido "{op}". '
                                     f'Certifique-se de que é um número válido (decimal, hexadecimal ou binário).')
-                self.memory[addr]=val; addr=(addr+1)&0xFF; continue
+                self.memory[addr]=val&0xFF; addr=(addr+1)&0xFF; continue
             if not mode_code: raise Exception(f'Linha {ln}: instrução fora de .CODE')
 
             # monta instrução
@@ -202,7 +202,7 @@ class CPU:
             mode_bits = (mode if mode is not None else 0)&0x03
             first = ((opc&0x0F)<<4) | (mode_bits<<2)
             self.memory[addr]=first; addr=(addr+1)&0xFF
-            logging.debug(f'Linha {ln}: Endereço {addr-1:02X}, byte {first:02X}')
+            logging.debug('Linha %d: Endereço %02X, byte %02X', ln, addr-1, first)
             if op is not None:
                 tok = op
                 if tok.upper().endswith(',I') or tok.upper().endswith(',R'):
@@ -211,8 +211,8 @@ class CPU:
                 if val is None:
                     raise Exception(f'Linha {ln}: Operando inválido "{op}". '
                                     f'Certifique-se de que o valor ou label está correto.')
-                self.memory[addr]=val; addr=(addr+1)&0xFF
-                logging.debug(f'Linha {ln}: Endereço {addr-1:02X}, byte {val:02X}')
+                self.memory[addr]=val&0xFF; addr=(addr+1)&0xFF
+                logging.debug('Linha %d: Endereço %02X, byte %02X', ln, addr-1, val)
         return True
 
     # ---------- Execução ----------
@@ -228,7 +228,6 @@ class CPU:
         instr = self.memory[self.pc]
         self.pc=(self.pc+1)&0xFF
         opc,mode = self.decode(instr)
-        logging.debug(f'Fetch: PC={self.pc-1:02X}, Instrução={instr:02X}, Opcode={opc:X}, Modo={mode:X}')
         return self.execute(opc,mode)
 
     def execute(self, opc, mode):
@@ -238,30 +237,25 @@ class CPU:
         """
         try:
             if opc==0xF: # HLT
-                logging.info('HLT: Finalizando a execução.')
                 return False
 
             if opc==0x0: # NOT
                 self.ac=(~self.ac)&0xFF
                 self.update_flags(self.ac)
-                logging.info(f'NOT: AC={self.ac:02X}, N={self.negative}, Z={self.zero}')
                 return True
 
             if opc==0x1: # STA
                 # Diferentes modos de endereçamento
                 if mode==0x1:  # direto
                     addr=self.memory[self.pc]; self.pc=(self.pc+1)&0xFF
-                    self.memory[addr]=self.ac&0xFF
-                    logging.info(f'STA (Direto): AC={self.ac:02X} armazenado em {addr:02X}')
+                    self.store(addr,self.ac&0xFF)
                 elif mode==0x2:  # indireto
                     ptr=self.memory[self.pc]; self.pc=(self.pc+1)&0xFF
-                    addr=self.memory[ptr]; self.memory[addr]=self.ac&0xFF
-                    logging.info(f'STA (Indireto): AC={self.ac:02X} armazenado em [{ptr:02X}]={addr:02X}')
+                    addr=self.memory[ptr]; self.store(addr,self.ac&0xFF)
                 elif mode==0x3:  # relativo
                     off=self.memory[self.pc]; self.pc=(self.pc+1)&0xFF
                     addr=(self.pc+self.signed8(off))&0xFF
-                    self.memory[addr]=self.ac&0xFF
-                    logging.info(f'STA (Relativo): AC={self.ac:02X} armazenado em {addr:02X} (offset {off:02X})')
+                    self.store(addr,self.ac&0xFF)
                 else:
                     raise ValueError('STA: Modo de endereçamento inválido.')
                 return True
@@ -270,20 +264,16 @@ class CPU:
                 # carrega valor no acumulador
                 if mode==0x0:  # imediato
                     self.ac=self.memory[self.pc]; self.pc=(self.pc+1)&0xFF
-                    logging.info(f'LDA (Imediato): AC carregado com {self.ac:02X}')
                 elif mode==0x1:  # direto
                     addr=self.memory[self.pc]; self.pc=(self.pc+1)&0xFF
                     self.ac=self.memory[addr]
-                    logging.info(f'LDA (Direto): AC carregado com [{addr:02X}]={self.ac:02X}')
                 elif mode==0x2:  # indireto
                     ptr=self.memory[self.pc]; self.pc=(self.pc+1)&0xFF
                     addr=self.memory[ptr]; self.ac=self.memory[addr]
-                    logging.info(f'LDA (Indireto): AC carregado com [[{ptr:02X}]]=[{addr:02X}]={self.ac:02X}')
                 elif mode==0x3:  # relativo
                     off=self.memory[self.pc]; self.pc=(self.pc+1)&0xFF
                     addr=(self.pc+self.signed8(off))&0xFF
                     self.ac=self.memory[addr]
-                    logging.info(f'LDA (Relativo): AC carregado com [{addr:02X}] (offset {off:02X}) ={self.ac:02X}')
                 self.update_flags(self.ac)
                 return True
 
@@ -296,7 +286,6 @@ class CPU:
                 self.overflow=1 if (((self.ac^op)&0x80)==0 and ((self.ac^res)&0x80)!=0) else 0
                 self.ac=res&0xFF
                 self.update_flags(self.ac)
-                logging.info(f'ADD: AC={self.ac:02X}, Carry={self.carry}, Overflow={self.overflow}')
                 return True
 
             # Implementações das outras instruções aqui...
@@ -304,7 +293,7 @@ class CPU:
             raise ValueError(f'Opcode desconhecido: {opc:02X}.')
 
         except ValueError as e:
-            logging.error(f'Erro na execução: {e}')
+            logging.error('Erro na execução: %s', e)
             raise Exception(f'Erro na execução no endereço {self.pc-1:02X}: {e}')
 
     def get_operand(self, mode):
@@ -332,6 +321,13 @@ class CPU:
         else:
             raise ValueError(f'Modo de endereçamento inválido: {mode:02X}.')
 
+    def store(self, addr, val):
+        """
+        Grava `val` em memória a pedido de um STA. Ponto único de escrita
+        da execução: tracers (ver tracing.py) se ligam aqui.
+        """
+        self.memory[addr]=val
+
     def update_flags(self, r):
         """
         Atualiza flags N e Z de acordo com resultado (8 bits).
@@ -344,11 +340,41 @@ class CPU:
         """
         Retorna string com dump da memória (endereços e valores).
         """
-        buf=''; p=posIni
-        for _ in range(posIni,posFin+1):
-            buf += f'{p:02X} :: {self.memory[p]:02X} ({self.memory[p]:03})\n'
-            p+=1
-        return buf
+        buf=io.StringIO()
+        self.writeMemoryMap(buf,posIni,posFin)
+        return buf.getvalue()
+
+    def writeMemoryMap(self,f,posIni=0,posFin=255):
+        """
+        Escreve o dump da memória (mesmo formato de getMemoryMap)
+        diretamente no arquivo `f`, linha a linha.
+        """
+        view=self.view
+        for p in range(posIni,posFin+1):
+            v=view[p]
+            f.write(f'{p:02X} :: {v:02X} ({v:03})\n')
+
+    # ---------- Imagem de memória ----------
+
+    def load_image(self, data, origin=0):
+        """
+        Copia `data` (bytes, bytearray, memoryview ou lista de ints)
+        para a memória a partir de `origin`, com volta ao endereço 00.
+        """
+        n=len(data)
+        if n>256: raise Exception(f'Imagem de {n} bytes maior que a memória')
+        origin&=0xFF
+        first=min(n,256-origin)
+        self.memory[origin:origin+first]=bytes(data[:first])
+        if first<n: self.memory[0:n-first]=bytes(data[first:])
+
+    def dump_image(self, start=0, end=256):
+        """Retorna uma cópia (bytes) da memória em [start, end)."""
+        return self.view[start:end].tobytes()
+
+    def mem_slice(self, start=0, end=256):
+        """Retorna um memoryview de [start, end) sem copiar os bytes."""
+        return self.view[start:end]
 
     def getSymbolsTable(self):
         """
@@ -364,7 +390,11 @@ class CPU:
 # ---------- Programa de teste ----------
 
 if __name__=='__main__':
+    from tracing import attach, LoggingTracer
+    # Configuração básica do logging (só ao executar como programa)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     cpu=CPU()
+    attach(cpu, LoggingTracer())
     asm = """
 ; Exemplo de programa para testar o simulador CLEÓPATRA 3.0
 .CODE #00
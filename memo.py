@@ -0,0 +1,372 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####     Memoização de sub-rotinas (JSR/RTS) por leituras    ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+import time
+from collections import OrderedDict
+from operator import itemgetter
+
+from engine import PredecodedCPU, INSTR_SIZE, _FLAG
+
+# Jcc -> flag testado
+_COND = {0x9:'carry', 0xA:'negative', 0xB:'zero', 0xE:'overflow'}
+_FLAGS = ('carry', 'negative', 'overflow', 'zero')
+
+# Instruções que leem / escrevem AC (e N/Z)
+_READS_AC = (0x0, 0x1, 0x5, 0x6, 0x7)
+_WRITES_AC = (0x0, 0x4, 0x5, 0x6, 0x7)
+
+MAX_CALL_STEPS = 4096   # chamada mais longa que é registrada
+MAX_SHAPES = 8          # conjuntos de leitura distintos por sub-rotina
+DEFAULT_CAPACITY = 4096 # entradas no cache (LRU)
+
+
+def _getter(addrs):
+    """Função memória -> tupla dos valores em `addrs`."""
+    if not addrs: return lambda mem: ()
+    if len(addrs)==1:
+        x = addrs[0]
+        return lambda mem: (mem[x],)
+    return itemgetter(*addrs)
+
+
+class _Shape:
+    """Conjunto de leitura de uma sub-rotina: AC, flags e endereços lidos antes de escritos."""
+    __slots__ = ('ac','flags','addrs','ident','get','tests')
+
+    def __init__(self, ac, flags, addrs):
+        self.ac = ac
+        self.flags = flags
+        self.addrs = addrs
+        self.ident = (ac, flags, addrs)
+        self.get = _getter(addrs)
+        self.tests = tuple(_FLAG[f] for f in flags)
+
+    def key(self, cpu):
+        return (cpu.ac if self.ac else 0, tuple(t(cpu) for t in self.tests), self.get(cpu.memory))
+
+
+class _Entry:
+    """Efeito registrado de uma chamada: escritas, AC, flags e nº de instruções."""
+    __slots__ = ('writes','ac','nz','cv','steps')
+
+    def __init__(self, writes, ac, nz, cv, steps):
+        self.writes = writes   # ((endereço, valor final), ...)
+        self.ac = ac           # AC final, ou None se a rotina não escreve AC
+        self.nz = nz           # registro de N/Z (CPU._nz), ou None
+        self.cv = cv           # operandos do último ADD (_ca, _cb), ou None
+        self.steps = steps     # instruções após o JSR, incluindo o RTS
+
+
+class MemoCPU(PredecodedCPU):
+    """
+    PredecodedCPU com memoização de sub-rotinas. Na primeira chamada a
+    um alvo de JSR, a rotina é executada instrução a instrução pelo
+    próprio handler do JSR, registrando o que ela lê antes de escrever
+    (AC, flags testados por Jcc e endereços de memória, inclusive
+    ponteiros) e o que escreve. Ao chegar ao RTS, o efeito fica no
+    cache com a chave (alvo, conjunto de leitura, valores lidos).
+    Chamadas seguintes cujos valores coincidem aplicam as escritas,
+    AC e flags e retornam direto.
+
+    Não são registradas chamadas com JSR aninhado (RS seria sobrescrito),
+    HLT, instrução inválida, escrita no próprio código ou mais de
+    MAX_CALL_STEPS instruções; a execução simplesmente segue normal a
+    partir do ponto em que o registro parou.
+
+    O cache é limitado a `capacity` entradas (LRU). Um STA, load_image
+    ou invalidate() sobre um byte de código executado por uma rotina
+    descarta as entradas dessa rotina.
+
+    Como no FusedCPU, um fetch() pode executar várias instruções e
+    `extra_steps` acumula as além da primeira; run() conta passos
+    exatos (uma chamada só é reaproveitada se couber no limite) e, com
+    breakpoints ou watchpoints, executa sem memoização.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        super().__init__()
+        self.capacity = capacity
+        self.memo = True
+        self.extra_steps = 0
+        self.max_skip = float('inf')   # instruções que uma chamada pode pular
+        self._fault_pc = None          # instrução em execução dentro de _record
+        self.cache = OrderedDict()     # (alvo, forma, chave) -> _Entry
+        self.shapes = {}               # alvo -> {forma: _Shape}
+        self.keys = {}                 # alvo -> chaves do cache
+        self.owners = [set() for _ in range(256)]   # byte de código -> alvos
+        self.refused = set()           # alvos que não podem ser registrados
+        self.hits = self.misses = self.evictions = 0
+
+    # ---------- Invalidação ----------
+
+    def invalidate(self, addr):
+        super().invalidate(addr)
+        if self.owners[addr&0xFF]: self.forget_at(addr&0xFF)
+
+    def invalidate_all(self):
+        super().invalidate_all()
+        self.cache.clear(); self.shapes.clear(); self.keys.clear()
+        self.refused.clear()
+        for o in self.owners: o.clear()
+
+    def forget_at(self, addr):
+        """Descarta as rotinas cujo código inclui o byte `addr`."""
+        for t in list(self.owners[addr]): self.forget(t)
+
+    def forget(self, target):
+        """Descarta tudo o que foi registrado para a rotina em `target`."""
+        for k in self.keys.pop(target, ()): del self.cache[k]
+        self.shapes.pop(target, None)
+        self.refused.discard(target)
+        for o in self.owners:
+            o.discard(target)
+
+    def memo_stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self.cache), 'routines': len(self.shapes)}
+
+    # ---------- Handlers ----------
+
+    def build_handler(self, a):
+        opc, mode = self.decode(self.memory[a])
+        if mode!=0x0 and opc==0x1: return self._build_sta(a, mode)
+        if mode!=0x0 and opc==0xC: return self._build_jsr(a, mode)
+        return super().build_handler(a)
+
+    def _build_sta(self, a, mode):
+        # como engine._build_sta, mais o descarte das rotinas afetadas
+        cpu = self; mem = self.memory; table = self.table
+        owners = self.owners; forget_at = self.forget_at
+        nxt = (a+2)&0xFF; v = mem[(a+1)&0xFF]
+        ea = (nxt+self.signed8(v))&0xFF if mode==0x3 else v
+        if mode==0x2:
+            def h():
+                t = mem[ea]
+                mem[t] = cpu.ac; cpu.pc = nxt
+                table[t] = None; table[(t-1)&0xFF] = None
+                if owners[t]: forget_at(t)
+                return True
+            return h
+        prev = (ea-1)&0xFF
+        def h():
+            mem[ea] = cpu.ac; cpu.pc = nxt
+            table[ea] = None; table[prev] = None
+            if owners[ea]: forget_at(ea)
+            return True
+        return h
+
+    def _build_jsr(self, a, mode):
+        mem = self.memory
+        nxt = (a+2)&0xFF; v = mem[(a+1)&0xFF]
+        ea = (nxt+self.signed8(v))&0xFF if mode==0x3 else v
+        call = self._call
+        if mode==0x2:
+            def h():
+                return call(mem[ea], nxt)
+        else:
+            def h():
+                return call(ea, nxt)
+        return h
+
+    # ---------- Chamada ----------
+
+    def _call(self, target, ret):
+        self.rs = ret; self.pc = target
+        if not self.memo or target in self.refused: return True
+        shapes = self.shapes.get(target)
+        if shapes:
+            cache = self.cache
+            for shape in shapes.values():
+                k = (target, shape.ident, shape.key(self))
+                e = cache.get(k)
+                if e is not None and e.steps <= self.max_skip:
+                    cache.move_to_end(k)
+                    self.hits += 1
+                    self._apply(e, ret)
+                    return True
+        self.misses += 1
+        return self._record(target, ret)
+
+    def _apply(self, e, ret):
+        mem = self.memory; table = self.table; owners = self.owners
+        for x, val in e.writes:
+            mem[x] = val
+            table[x] = None; table[(x-1)&0xFF] = None
+            if owners[x]: self.forget_at(x)
+        if e.ac is not None: self.ac = e.ac
+        if e.nz is not None: self._nz = e.nz
+        if e.cv is not None: self._ca, self._cb = e.cv
+        self.pc = ret
+        self.extra_steps += e.steps
+
+    def _record(self, target, ret):
+        """
+        Executa a rotina (JSR já feito) registrando leituras e escritas;
+        ao chegar ao RTS, guarda o efeito no cache. Retorna como fetch().
+        """
+        mem = self.memory; table = self.table
+        ac0 = self.ac
+        flags0 = {f: getattr(self, f) for f in _FLAGS}
+        reads = {}; written = set(); code = set()
+        need_ac = False; ac_set = False
+        flags_read = set(); nz_set = cv_set = False
+        limit = min(MAX_CALL_STEPS, self.max_skip)
+        steps = 0
+        refuse = False
+        while True:
+            if steps >= limit: break
+            a = self.pc
+            opc = mem[a]>>4
+            if opc==0xC or opc==0xF or opc in (0x2, 0x3):
+                # JSR aninhado, HLT ou opcode inválido: segue sem registrar
+                refuse = opc==0xC; break
+            ins = (a, (a+1)&0xFF) if INSTR_SIZE[opc]==2 else (a,)
+            if any(x in written for x in ins): refuse = True; break
+            code.update(ins)
+            rd, wr = self._accesses(a)
+            if any(x in code for x in wr): refuse = True; break
+            for x in rd:
+                if x not in written and x not in reads: reads[x] = mem[x]
+            if opc in _READS_AC and not ac_set: need_ac = True
+            f = _COND.get(opc)
+            if f is not None and not (cv_set if f in ('carry','overflow') else nz_set):
+                flags_read.add(f)
+            h = table[a]
+            if h is None: h = table[a] = self.build_handler(a)
+            steps += 1; self.extra_steps += 1
+            self._fault_pc = a     # se o handler falhar, run() aponta esta instrução
+            h()
+            self._fault_pc = None
+            written.update(wr)
+            if opc in _WRITES_AC: ac_set = nz_set = True
+            if opc==0x5: cv_set = True
+            if opc==0xD:
+                self._store(target, ret, reads, written, code, need_ac, ac0,
+                            flags_read, flags0, ac_set, nz_set, cv_set, steps)
+                return True
+        if refuse:
+            self.refused.add(target)
+            for x in code: self.owners[x].add(target)
+        return True
+
+    def _store(self, target, ret, reads, written, code, need_ac, ac0,
+               flags_read, flags0, ac_set, nz_set, cv_set, steps):
+        if self.pc!=ret: return
+        shapes = self.shapes.setdefault(target, {})
+        shape = _Shape(need_ac, tuple(sorted(flags_read)), tuple(sorted(reads)))
+        ident = shape.ident
+        if ident not in shapes:
+            if len(shapes) >= MAX_SHAPES: return
+            shapes[ident] = shape
+        mem = self.memory
+        key = (target, ident, (ac0 if need_ac else 0,
+                               tuple(flags0[f] for f in shape.flags),
+                               tuple(reads[x] for x in shape.addrs)))
+        self.cache[key] = _Entry(tuple((x, mem[x]) for x in sorted(written)),
+                                 self.ac if ac_set else None,
+                                 self._nz if nz_set else None,
+                                 (self._ca, self._cb) if cv_set else None, steps)
+        self.cache.move_to_end(key)
+        self.keys.setdefault(target, set()).add(key)
+        for x in code: self.owners[x].add(target)
+        while len(self.cache) > self.capacity:
+            k, _ = self.cache.popitem(last=False)
+            self.evictions += 1
+            ks = self.keys.get(k[0])
+            if ks is not None: ks.discard(k)
+
+    # ---------- Execução ----------
+
+    def run(self, max_steps=None, breakpoints=(), watch_reads=(), watch_writes=()):
+        if breakpoints or watch_reads or watch_writes:
+            # paradas dentro da rotina exigem instruções separadas
+            self.memo = False
+            try:
+                return super().run(max_steps, breakpoints, watch_reads, watch_writes)
+            finally:
+                self.memo = True
+        res = {'status':None,'steps':0,'pc':None,'addr':None,
+               'access':None,'watch':None,'error':None}
+        limit = max_steps if max_steps is not None else float('inf')
+        fetch = self.fetch
+        base = self.extra_steps
+        calls = 0
+        a = self.pc
+        self._fault_pc = None
+        try:
+            while True:
+                left = limit-calls-(self.extra_steps-base)
+                if left <= 0: res['status']='budget'; break
+                self.max_skip = left-1
+                a = self.pc
+                calls += 1
+                if not fetch(): res['status']='halt'; break
+        except Exception as e:
+            res['status']='error'; res['error']=str(e)
+            # erro dentro de uma rotina em gravação: a instrução que falhou
+            if self._fault_pc is not None: a = self._fault_pc
+        finally:
+            self.max_skip = float('inf')
+            self._fault_pc = None
+        if res['status']!='budget': res['addr']=a
+        res['steps']=calls+self.extra_steps-base; res['pc']=self.pc
+        return res
+
+
+# ---------- Comparação de desempenho ----------
+
+MUL_ASM = """
+; chama MUL (produto por somas sucessivas) com as mesmas entradas
+.CODE #00
+INICIO: JSR MUL
+        LDA CONT
+        ADD #FFh
+        STA CONT
+        JZ FIM
+        JMP INICIO
+FIM:    HLT
+MUL:    LDA #0
+        STA P
+        LDA Y
+        STA K
+LACO:   LDA K
+        JZ SAI
+        ADD #FFh
+        STA K
+        LDA P
+        ADD X
+        STA P
+        JMP LACO
+SAI:    RTS
+.ENDCODE
+.DATA #C0
+X: DB 7
+Y: DB 25
+P: DB 0
+K: DB 0
+CONT: DB 200
+.ENDDATA
+"""
+
+if __name__=='__main__':
+    def bench(cls):
+        cpu = cls(); cpu.assemble(MUL_ASM)
+        image = cpu.dump_image()
+        best = None
+        for _ in range(5):
+            cpu.load_image(image); cpu.pc = 0
+            t0 = time.perf_counter()
+            res = cpu.run()
+            dt = time.perf_counter()-t0
+            best = dt if best is None else min(best, dt)
+        return cpu, res, best
+    ref, r1, t1 = bench(PredecodedCPU)
+    memo, r2, t2 = bench(MemoCPU)
+    same = r1['steps']==r2['steps'] and ref.dump_image()==memo.dump_image()
+    print(f'PredecodedCPU : {r1["steps"]:8} passos {t1*1000:8.2f} ms')
+    print(f'MemoCPU       : {r2["steps"]:8} passos {t2*1000:8.2f} ms  {memo.memo_stats()}')
+    print(f'Ganho         : {t1/t2:.1f}x  (estado final idêntico: {same})')
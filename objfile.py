@@ -0,0 +1,169 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####      Arquivo objeto binário e carregador via mmap       ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+import argparse
+import mmap
+import struct
+import sys
+import zlib
+
+from assembler import assemble
+
+# Formato (little-endian):
+#   cabeçalho  magic 'CLEO', versão, flags, nº de seções, nº de símbolos,
+#              nº de entradas do mapa de linhas, CRC-32 do arquivo inteiro
+#              (calculado com o próprio campo do CRC zerado)
+#   imagem     256 bytes (em posição fixa, logo após o cabeçalho)
+#   seções     tipo (0 = CODE, 1 = DATA), início, nº de bytes
+#   símbolos   endereço, tamanho do nome, nome (UTF-8)
+#   linhas     nº da linha, endereço            (se FLAG_LINES)
+MAGIC = b'CLEO'
+VERSION = 2
+FLAG_LINES = 0x01
+
+_HEADER = struct.Struct('<4sBBHHII')
+_SECTION = struct.Struct('<BBI')
+_SYMBOL = struct.Struct('<iB')
+_LINE = struct.Struct('<Ii')
+_IMAGE_AT = _HEADER.size
+_CRC_AT = _HEADER.size-4
+
+
+def _crc(header, body):
+    """CRC-32 do cabeçalho (com o campo do CRC zerado) seguido do corpo."""
+    return zlib.crc32(body, zlib.crc32(bytes(header[:_CRC_AT])+bytes(4)))
+
+_KINDS = ('CODE', 'DATA')
+
+
+def dumps(prog, line_map=True):
+    """Serializa um assembler.Program no formato objeto (bytes)."""
+    body = [bytes(prog.image)]
+    for kind, start, size in prog.sections:
+        body.append(_SECTION.pack(_KINDS.index(kind), start, size))
+    for name, addr in prog.symbols.items():
+        raw = name.encode('utf-8')
+        if len(raw) > 255: raise Exception(f'Nome de símbolo longo demais: {name}')
+        body.append(_SYMBOL.pack(addr, len(raw))+raw)
+    if line_map:
+        for ln, addr in prog.line_map.items():
+            body.append(_LINE.pack(ln, addr))
+    body = b''.join(body)
+    fields = (MAGIC, VERSION, FLAG_LINES if line_map else 0,
+              len(prog.sections), len(prog.symbols), len(prog.line_map) if line_map else 0)
+    header = _HEADER.pack(*fields, 0)
+    return _HEADER.pack(*fields, _crc(header, body))+body
+
+
+def write_object(path, prog, line_map=True):
+    """Grava `prog` (assembler.Program) no arquivo objeto `path`."""
+    with open(path, 'wb') as f:
+        f.write(dumps(prog, line_map))
+
+
+def compile_source(src, path, line_map=True):
+    """Monta `src` e grava o arquivo objeto; retorna o Program."""
+    prog = assemble(src)
+    write_object(path, prog, line_map)
+    return prog
+
+
+class ObjectFile:
+    """
+    Arquivo objeto aberto via mmap. A validação (magic, versão, CRC) e
+    a leitura de seções, símbolos e linhas são feitas uma vez; load()
+    copia a imagem direto do mapeamento para a CPU, sem nenhuma análise
+    de texto, e pode ser chamado a cada execução.
+    """
+
+    def __init__(self, path, verify=True):
+        self._f = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:   # arquivo vazio
+            self._f.close()
+            raise Exception(f'{path}: arquivo objeto inválido')
+        try:
+            self._parse(path, verify)
+        except Exception:
+            self.close()
+            raise
+
+    def _parse(self, path, verify):
+        mm = self._mm
+        if len(mm) < _IMAGE_AT+256:
+            raise Exception(f'{path}: arquivo objeto truncado')
+        magic, version, flags, nsect, nsym, nlines, crc = _HEADER.unpack_from(mm)
+        if magic != MAGIC: raise Exception(f'{path}: não é um arquivo objeto CLEÓPATRA')
+        if version != VERSION: raise Exception(f'{path}: versão {version} não suportada')
+        if flags & ~FLAG_LINES or (nlines and not flags & FLAG_LINES):
+            raise Exception(f'{path}: arquivo objeto corrompido')
+        view = memoryview(mm)
+        if verify and _crc(view[:_IMAGE_AT], view[_IMAGE_AT:]) != crc:
+            view.release()
+            raise Exception(f'{path}: checksum inválido')
+        self.image = view[_IMAGE_AT:_IMAGE_AT+256]
+        view.release()
+        try:
+            pos = _IMAGE_AT+256
+            self.sections = []
+            for _ in range(nsect):
+                kind, start, size = _SECTION.unpack_from(mm, pos); pos += _SECTION.size
+                self.sections.append([_KINDS[kind], start, size])
+            self.symbols = {}
+            for _ in range(nsym):
+                addr, n = _SYMBOL.unpack_from(mm, pos); pos += _SYMBOL.size
+                self.symbols[mm[pos:pos+n].decode('utf-8')] = addr; pos += n
+            self.line_map = {}
+            end = pos+nlines*_LINE.size
+            # as tabelas devem ocupar o arquivo exatamente até o fim
+            if end != len(mm): raise IndexError
+            for ln, addr in _LINE.iter_unpack(mm[pos:end]):
+                self.line_map[ln] = addr
+        except (struct.error, IndexError, UnicodeDecodeError):
+            raise Exception(f'{path}: arquivo objeto corrompido')
+
+    def load(self, cpu):
+        """Carrega a imagem, os símbolos e o mapa de linhas em `cpu`."""
+        cpu.load_image(self.image)
+        cpu.symbols = dict(self.symbols)
+        cpu.line_map = dict(self.line_map)
+
+    def close(self):
+        image = getattr(self, 'image', None)
+        if image is not None: image.release()
+        self._mm.close()
+        self._f.close()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+
+def load_object(path, cpu, verify=True):
+    """Abre `path`, carrega em `cpu` e fecha (para uma única execução)."""
+    with ObjectFile(path, verify) as obj:
+        obj.load(cpu)
+        return obj.sections
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Gera arquivo objeto CLEÓPATRA a partir do fonte.')
+    ap.add_argument('source', help='arquivo .asm')
+    ap.add_argument('-o', '--output', help='arquivo objeto (padrão: fonte com extensão .cleo)')
+    ap.add_argument('--no-lines', action='store_true', help='omite o mapa de linhas')
+    args = ap.parse_args(argv)
+    out = args.output or args.source.rsplit('.', 1)[0]+'.cleo'
+    with open(args.source, encoding='utf-8') as f:
+        prog = compile_source(f.read(), out, not args.no_lines)
+    for kind, start, size in prog.sections:
+        print(f'{kind:4} {start:02X} {size:5} bytes')
+    print(f'{len(prog.symbols)} símbolos -> {out}')
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
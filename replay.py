@@ -0,0 +1,305 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####     Gravação e reprodução determinística de execuções   ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+import argparse
+import struct
+import sys
+import time
+import zlib
+from bisect import bisect_right
+
+from engine import FusedCPU
+
+# Formato (little-endian):
+#   cabeçalho  magic 'CREC', versão, intervalo entre checkpoints, nº de
+#              passos gravados, status final, nº de eventos, nº de checkpoints
+#   corpo (zlib)
+#     imagem       256 bytes (memória inicial; execução a partir de PC=00)
+#     eventos      passo, tipo, endereço, valor
+#     checkpoints  passo, nº de eventos já aplicados, registradores
+#                  (pc, ac, rs, carry, overflow, negative, zero), memória
+MAGIC = b'CREC'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sBIQBII')
+_EVENT = struct.Struct('<QBBB')
+_CHECKPOINT = struct.Struct('<QI7B')
+
+# Tipos de evento (entradas não determinísticas)
+EV_MEMORY = 0      # valor injetado na memória
+
+_STATUS = (None, 'halt', 'budget', 'error')
+
+DEFAULT_INTERVAL = 1<<16
+
+
+def _regs(cpu):
+    return (cpu.pc, cpu.ac, cpu.rs, cpu.carry, cpu.overflow, cpu.negative, cpu.zero)
+
+
+def _apply_event(cpu, ev):
+    step, kind, addr, value = ev
+    if kind==EV_MEMORY:
+        cpu.load_image(bytes((value,)), addr)
+    else:
+        raise Exception(f'Tipo de evento desconhecido {kind}')
+
+
+class Checkpoint:
+    """Estado completo após `step` instruções e os `ev` primeiros eventos."""
+    __slots__ = ('step','ev','regs','memory')
+
+    def __init__(self, step, ev, regs, memory):
+        self.step = step
+        self.ev = ev
+        self.regs = regs       # (pc, ac, rs, carry, overflow, negative, zero)
+        self.memory = memory   # bytes (256)
+
+    def restore(self, cpu):
+        cpu.load_image(self.memory)
+        (cpu.pc, cpu.ac, cpu.rs, cpu.carry, cpu.overflow,
+         cpu.negative, cpu.zero) = self.regs
+
+
+class Recording:
+    """
+    Execução gravada: memória inicial, eventos (passo, tipo, endereço,
+    valor) e checkpoints a cada `interval` instruções. Um evento no
+    passo n vale depois da n-ésima instrução e antes da seguinte; o
+    estado no passo n (e o checkpoint desse passo) já inclui os eventos
+    do passo n.
+    """
+
+    def __init__(self, image, interval=DEFAULT_INTERVAL):
+        if not 0 < interval < 1<<32:
+            raise Exception(f'Intervalo entre checkpoints inválido: {interval}')
+        self.image = bytes(image)
+        self.interval = interval
+        self.events = []
+        self.checkpoints = [Checkpoint(0, 0, (0,)*7, self.image)]
+        self.steps = 0
+        self.status = None
+
+    def dumps(self):
+        body = [self.image]
+        body += [_EVENT.pack(*ev) for ev in self.events]
+        for c in self.checkpoints:
+            body.append(_CHECKPOINT.pack(c.step, c.ev, *c.regs))
+            body.append(c.memory)
+        header = _HEADER.pack(MAGIC, VERSION, self.interval, self.steps,
+                              _STATUS.index(self.status), len(self.events), len(self.checkpoints))
+        return header+zlib.compress(b''.join(body))
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.dumps())
+
+    @classmethod
+    def loads(cls, data, name='gravação'):
+        if len(data) < _HEADER.size: raise Exception(f'{name}: arquivo truncado')
+        magic, version, interval, steps, status, nev, ncp = _HEADER.unpack_from(data)
+        if magic != MAGIC: raise Exception(f'{name}: não é uma gravação CLEÓPATRA')
+        if version != VERSION: raise Exception(f'{name}: versão {version} não suportada')
+        try:
+            body = zlib.decompress(data[_HEADER.size:])
+            rec = cls(body[:256], interval)
+            pos = 256
+            rec.events = [_EVENT.unpack_from(body, pos+k*_EVENT.size) for k in range(nev)]
+            pos += nev*_EVENT.size
+            rec.checkpoints = []
+            for _ in range(ncp):
+                step, ev, *regs = _CHECKPOINT.unpack_from(body, pos); pos += _CHECKPOINT.size
+                rec.checkpoints.append(Checkpoint(step, ev, tuple(regs), body[pos:pos+256])); pos += 256
+            if pos != len(body) or len(rec.image) != 256: raise ValueError
+        except (zlib.error, struct.error, ValueError, IndexError):
+            raise Exception(f'{name}: gravação corrompida')
+        rec.steps = steps
+        rec.status = _STATUS[status]
+        return rec
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.loads(f.read(), path)
+
+
+class Recorder:
+    """
+    Executa um programa no motor `engine` (padrão FusedCPU, com contagem
+    exata de passos em run()) gravando o necessário para reproduzi-lo:
+    a imagem inicial, os valores injetados por inject() e um checkpoint
+    completo a cada `interval` instruções.
+    """
+
+    def __init__(self, image, interval=DEFAULT_INTERVAL, engine=FusedCPU):
+        self.cpu = engine()
+        self.cpu.load_image(image)
+        self.recording = Recording(self.cpu.dump_image(), interval)
+
+    @classmethod
+    def from_source(cls, src, interval=DEFAULT_INTERVAL, engine=FusedCPU):
+        cpu = engine()
+        cpu.assemble(src)
+        rec = cls(cpu.dump_image(), interval, engine)
+        rec.cpu.symbols = cpu.symbols
+        return rec
+
+    def inject(self, addr, value):
+        """Grava `value` em `addr` agora (entrada externa), registrando o evento."""
+        ev = (self.recording.steps, EV_MEMORY, addr&0xFF, value&0xFF)
+        self.recording.events.append(ev)
+        _apply_event(self.cpu, ev)
+
+    def run(self, max_steps=None):
+        """
+        Executa (até HLT, erro ou `max_steps`) com checkpoints nos
+        múltiplos de `interval`. Retorna o dicionário de CPU.run com
+        os passos desta chamada.
+        """
+        rec = self.recording; cpu = self.cpu
+        if rec.status in ('halt', 'error'): raise Exception(f'Execução já terminou ({rec.status})')
+        interval = rec.interval
+        done = 0
+        while True:
+            # checkpoint do limite de intervalo só agora, antes de seguir,
+            # para incluir os eventos injetados nesse mesmo passo
+            if rec.steps%interval==0 and rec.checkpoints[-1].step!=rec.steps:
+                rec.checkpoints.append(Checkpoint(rec.steps, len(rec.events),
+                                                  _regs(cpu), cpu.dump_image()))
+            chunk = interval-rec.steps%interval
+            if max_steps is not None: chunk = min(chunk, max_steps-done)
+            res = cpu.run(chunk)
+            rec.steps += res['steps']; done += res['steps']
+            if res['status']!='budget':
+                rec.status = res['status']; break
+            if max_steps is not None and done >= max_steps:
+                rec.status = 'budget'; break
+        res['steps'] = done
+        return res
+
+
+class Replayer:
+    """
+    Reproduz uma Recording no motor `engine`: seek(n) restaura o
+    checkpoint mais próximo anterior a n e reexecuta no máximo
+    `interval` instruções (aplicando os eventos no passo certo).
+    """
+
+    def __init__(self, recording, engine=FusedCPU):
+        self.recording = recording
+        self.cpu = engine()
+        self._steps = [c.step for c in recording.checkpoints]
+        self.step = None
+        self._ev = 0
+        self.seek(0)
+
+    def seek(self, n):
+        """Leva a CPU ao estado após `n` instruções; retorna a CPU."""
+        rec = self.recording
+        if not 0 <= n <= rec.steps:
+            raise Exception(f'Passo {n} fora da gravação (0..{rec.steps})')
+        if self.step is None or n < self.step or n-self.step > rec.interval:
+            c = rec.checkpoints[bisect_right(self._steps, n)-1]
+            c.restore(self.cpu)
+            self.step = c.step; self._ev = c.ev
+        self._forward(n)
+        return self.cpu
+
+    def _forward(self, n):
+        cpu = self.cpu; events = self.recording.events
+        while True:
+            while self._ev < len(events) and events[self._ev][0] <= self.step:
+                _apply_event(cpu, events[self._ev]); self._ev += 1
+            if self.step >= n: break
+            stop = n
+            if self._ev < len(events): stop = min(stop, events[self._ev][0])
+            res = cpu.run(stop-self.step)
+            self.step += res['steps']
+            if res['status']!='budget': break
+
+    def state(self):
+        """(passo, registradores, memória) do estado atual."""
+        return self.step, _regs(self.cpu), self.cpu.dump_image()
+
+    def verify(self):
+        """
+        Reexecuta a gravação inteira conferindo cada checkpoint; retorna
+        o passo do primeiro checkpoint divergente, ou None.
+        """
+        self.seek(0)
+        for c in self.recording.checkpoints[1:]:
+            self.seek(c.step)
+            if _regs(self.cpu)!=c.regs or self.cpu.dump_image()!=c.memory:
+                return c.step
+        return None
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Grava e reproduz execuções CLEÓPATRA.')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('record', help='executa um fonte e grava a execução')
+    p.add_argument('source', help='arquivo .asm')
+    p.add_argument('-o', '--output', help='gravação (padrão: fonte com extensão .crec)')
+    p.add_argument('--max-steps', type=int, default=None)
+    p.add_argument('--interval', type=int, default=DEFAULT_INTERVAL, help='instruções entre checkpoints')
+    p.add_argument('--inject', action='append', default=[], metavar='PASSO:END=VALOR',
+                   help='injeta VALOR (hexa) no endereço END (hexa) após PASSO instruções')
+    p = sub.add_parser('seek', help='mostra o estado em um passo')
+    p.add_argument('recording')
+    p.add_argument('step', type=int)
+    p = sub.add_parser('verify', help='reexecuta e confere todos os checkpoints')
+    p.add_argument('recording')
+    args = ap.parse_args(argv)
+
+    if args.cmd=='record':
+        if args.interval <= 0: ap.error('--interval deve ser positivo')
+        with open(args.source, encoding='utf-8') as f:
+            rec = Recorder.from_source(f.read(), args.interval)
+        injects = []
+        for s in args.inject:
+            try:
+                step, rest = s.split(':'); addr, value = rest.split('=')
+                injects.append((int(step), int(addr, 16), int(value, 16)))
+            except ValueError:
+                ap.error(f'injeção inválida: {s}')
+        injects.sort()
+        t0 = time.perf_counter()
+        for step, addr, value in injects:
+            left = step-rec.recording.steps
+            if args.max_steps is not None: left = min(left, args.max_steps-rec.recording.steps)
+            if left > 0 and rec.run(left)['status']!='budget': break
+            if rec.recording.steps < step: break
+            rec.inject(addr, value)
+        if rec.recording.status in (None, 'budget'):
+            left = None if args.max_steps is None else args.max_steps-rec.recording.steps
+            if left is None or left > 0: rec.run(left)
+        dt = time.perf_counter()-t0
+        out = args.output or args.source.rsplit('.', 1)[0]+'.crec'
+        rec.recording.save(out)
+        r = rec.recording
+        print(f'{r.steps} passos ({r.status}) em {dt:.2f} s, {len(r.events)} eventos, '
+              f'{len(r.checkpoints)} checkpoints -> {out}')
+        return 0
+
+    rec = Recording.load(args.recording)
+    t0 = time.perf_counter()
+    rp = Replayer(rec)
+    if args.cmd=='verify':
+        bad = rp.verify()
+        print(f'{len(rec.checkpoints)} checkpoints conferidos em {time.perf_counter()-t0:.2f} s: '
+              + ('ok' if bad is None else f'divergência no passo {bad}'))
+        return 0 if bad is None else 1
+    rp.seek(args.step)
+    dt = time.perf_counter()-t0
+    step, (pc, ac, rs, c, v, n, z), _ = rp.state()
+    print(f'passo {step}: PC: {pc:02X} AC: {ac:02X} RS: {rs:02X} N: {n} Z: {z} C: {c} V: {v}'
+          f'  ({dt*1000:.1f} ms)')
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,283 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####      Serviço local de trabalhos (asyncio, JSON lines)    ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import batch
+from batch import ENGINES, DEFAULT_MAX_STEPS, DEFAULT_TIMEOUT
+
+# Tamanho da janela de tempos usada nos percentis
+_WINDOW = 4096
+
+# Maior linha (requisição) aceita, em bytes
+_LINE_LIMIT = 1<<20
+
+
+def _run_src_job(job):
+    """Executado no processo trabalhador (CPU e cache de batch._init_worker)."""
+    t0 = time.perf_counter()
+    res = batch.run_source(batch._cpu, job['src'], job['max_steps'], job['timeout'], batch._cache)
+    res['time'] = round(time.perf_counter()-t0, 6)
+    return res
+
+
+def percentile(values, p):
+    """Percentil `p` (0..100) pelo método do posto mais próximo; None se vazio."""
+    if not values: return None
+    s = sorted(values)
+    k = max(0, min(len(s)-1, -(-len(s)*p//100)-1))
+    return s[int(k)]
+
+
+class JobService:
+    """
+    Servidor local que recebe fontes CLEÓPATRA e parâmetros de execução
+    como JSON lines (um objeto por linha) e responde um objeto por
+    trabalho, na ordem em que terminam (o campo "id" é devolvido).
+
+    Requisição:  {"id": ..., "src": "...", "max_steps": N, "timeout": S}
+                 {"op": "metrics"}
+    Resposta:    resultado de batch.run_source + "id", "time" (execução)
+                 e "latency" (fila + execução)
+
+    Os trabalhos vão para uma fila limitada a `queue_size`; com a fila
+    cheia, o servidor para de ler a conexão até abrir espaço, e a pressão
+    chega ao cliente pelo próprio socket. `workers` processos executam
+    os trabalhos; max_steps e timeout são limitados pelos valores do
+    servidor.
+    """
+
+    def __init__(self, workers=2, queue_size=64, engine='predecoded',
+                 max_steps=DEFAULT_MAX_STEPS, timeout=DEFAULT_TIMEOUT, cache_dir=None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.engine = engine
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.cache_dir = cache_dir
+        self.queue = None
+        self.pool = None
+        self.server = None
+        self._tasks = []
+        self._conns = {}     # tarefa de cada conexão -> writer
+        # contadores
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.started_at = None
+        self.run_times = deque(maxlen=_WINDOW)
+        self.latencies = deque(maxlen=_WINDOW)
+
+    # ---------- Ciclo de vida ----------
+
+    async def start(self, path=None, host='127.0.0.1', port=0):
+        """Inicia o pool e escuta no socket Unix `path` ou em host:port."""
+        self.queue = asyncio.Queue(self.queue_size)
+        self.pool = ProcessPoolExecutor(self.workers, initializer=batch._init_worker,
+                                        initargs=(self.engine, self.cache_dir))
+        self._tasks = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+        self.started_at = time.monotonic()
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self._handle, path, limit=_LINE_LIMIT)
+        else:
+            self.server = await asyncio.start_server(self._handle, host, port, limit=_LINE_LIMIT)
+        return self.server
+
+    def address(self):
+        """Endereço em que o servidor escuta (caminho ou (host, porta))."""
+        return self.server.sockets[0].getsockname()
+
+    async def stop(self):
+        self.server.close()
+        # wait_closed() espera as conexões abertas (a partir do 3.12):
+        # fecha e cancela as conexões antes, mesmo as ociosas
+        for t, writer in list(self._conns.items()):
+            writer.close(); t.cancel()
+        await asyncio.gather(*self._conns, return_exceptions=True)
+        await self.server.wait_closed()
+        for t in self._tasks: t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.pool.shutdown(cancel_futures=True)
+
+    # ---------- Trabalhos ----------
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job, fut = await self.queue.get()
+            self.in_flight += 1
+            try:
+                res = await loop.run_in_executor(self.pool, _run_src_job, job)
+            except Exception as e:
+                res = {'status': 'error', 'error': str(e)}
+            finally:
+                self.in_flight -= 1
+                self.queue.task_done()
+            if not fut.done(): fut.set_result(res)
+
+    async def enqueue(self, msg):
+        """
+        Coloca um trabalho na fila (esperando enquanto ela estiver cheia)
+        e retorna uma corrotina que aguarda o resultado.
+        """
+        t0 = time.monotonic()
+        max_steps = int(msg.get('max_steps', self.max_steps))
+        timeout = float(msg.get('timeout', self.timeout))
+        if max_steps < 0: raise ValueError('max_steps negativo')
+        if not math.isfinite(timeout) or timeout < 0: raise ValueError('timeout inválido')
+        job = {'src': msg['src'],
+               'max_steps': min(max_steps, self.max_steps),
+               'timeout': min(timeout, self.timeout)}
+        fut = asyncio.get_running_loop().create_future()
+        self.submitted += 1
+        await self.queue.put((job, fut))
+        return self._finish(fut, t0)
+
+    async def _finish(self, fut, t0):
+        res = await fut
+        latency = time.monotonic()-t0
+        self.completed += 1
+        if res['status'] in ('error', 'asm_error'): self.failed += 1
+        if 'time' in res: self.run_times.append(res['time'])
+        self.latencies.append(latency)
+        res['latency'] = round(latency, 6)
+        return res
+
+    async def submit(self, msg):
+        """Enfileira um trabalho e aguarda o resultado."""
+        return await (await self.enqueue(msg))
+
+    def metrics(self):
+        elapsed = time.monotonic()-self.started_at if self.started_at else 0
+        return {'submitted': self.submitted, 'completed': self.completed,
+                'failed': self.failed, 'in_flight': self.in_flight,
+                'queue_depth': self.queue.qsize() if self.queue else 0,
+                'jobs_per_s': self.completed/elapsed if elapsed else 0.0,
+                'run_p50': percentile(self.run_times, 50),
+                'run_p99': percentile(self.run_times, 99),
+                'latency_p50': percentile(self.latencies, 50),
+                'latency_p99': percentile(self.latencies, 99)}
+
+    # ---------- Protocolo ----------
+
+    async def _handle(self, reader, writer):
+        me = asyncio.current_task()
+        self._conns[me] = writer
+        lock = asyncio.Lock()
+        pending = set()
+
+        async def reply(obj):
+            async with lock:
+                writer.write((json.dumps(obj)+'\n').encode('utf-8'))
+                await writer.drain()
+
+        async def serve(msg, result):
+            res = await result
+            if 'id' in msg: res['id'] = msg['id']
+            await reply(res)
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await reply({'status': 'bad_request', 'error': 'linha muito longa'}); break
+                if not line: break
+                if not line.strip(): continue
+                try:
+                    msg = json.loads(line)
+                    if not isinstance(msg, dict): raise ValueError
+                except ValueError:
+                    await reply({'status': 'bad_request', 'error': 'JSON inválido'}); continue
+                if msg.get('op') == 'metrics':
+                    await reply(self.metrics()); continue
+                if not isinstance(msg.get('src'), str):
+                    await reply({'status': 'bad_request', 'error': 'campo "src" ausente', 'id': msg.get('id')})
+                    continue
+                try:
+                    # a leitura só continua depois que o trabalho entra na fila
+                    result = await self.enqueue(msg)
+                except (TypeError, ValueError, OverflowError) as e:
+                    await reply({'status': 'bad_request', 'error': str(e), 'id': msg.get('id')})
+                    continue
+                t = asyncio.create_task(serve(msg, result))
+                pending.add(t); t.add_done_callback(pending.discard)
+            if pending: await asyncio.gather(*pending, return_exceptions=True)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            for t in pending: t.cancel()
+            self._conns.pop(me, None)
+            writer.close()
+
+
+async def request(messages, path=None, host='127.0.0.1', port=None):
+    """
+    Cliente: envia `messages` (dicionários) numa conexão e retorna as
+    respostas, uma por mensagem, na ordem em que chegaram.
+    """
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path, limit=_LINE_LIMIT)
+    else:
+        reader, writer = await asyncio.open_connection(host, port, limit=_LINE_LIMIT)
+
+    async def send():
+        for m in messages:
+            writer.write((json.dumps(m)+'\n').encode('utf-8'))
+            await writer.drain()
+
+    sender = asyncio.create_task(send())
+    out = []
+    for _ in messages:
+        line = await reader.readline()
+        if not line: break
+        out.append(json.loads(line))
+    await sender
+    writer.close()
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Serviço local de montagem e execução CLEÓPATRA.')
+    where = ap.add_mutually_exclusive_group()
+    where.add_argument('--socket', help='caminho do socket Unix')
+    where.add_argument('--port', type=int, default=8765, help='porta TCP em 127.0.0.1')
+    ap.add_argument('-j', '--workers', type=int, default=2, help='processos trabalhadores')
+    ap.add_argument('--queue-size', type=int, default=64, help='trabalhos aguardando na fila')
+    ap.add_argument('--max-steps', type=int, default=DEFAULT_MAX_STEPS, help='limite por trabalho')
+    ap.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='segundos por trabalho')
+    ap.add_argument('--engine', choices=sorted(ENGINES), default='predecoded')
+    ap.add_argument('--cache-dir', help='diretório do cache de montagens em disco')
+    args = ap.parse_args(argv)
+
+    async def serve():
+        svc = JobService(args.workers, args.queue_size, args.engine,
+                         args.max_steps, args.timeout, args.cache_dir)
+        server = await svc.start(args.socket, port=args.port)
+        print(f'Escutando em {svc.address()}', file=sys.stderr)
+        try:
+            async with server: await server.serve_forever()
+        finally:
+            await svc.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####     Snapshots incrementais e depuração com volta no tempo ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+from bisect import bisect_right
+
+from main import CPU
+
+# Custo aproximado (bytes) de um snapshot sem memória
+_SNAP_OVERHEAD = 64
+
+
+class Snapshot:
+    """
+    Estado da CPU em um passo. `addrs`/`values` guardam apenas os bytes
+    escritos desde o snapshot anterior; `full` guarda a memória inteira
+    nos snapshots-chave.
+    """
+    __slots__ = ('step','regs','addrs','values','full')
+
+    def __init__(self, step, regs, addrs, values, full=None):
+        self.step = step
+        self.regs = regs       # (pc, ac, rs, carry, overflow, negative, zero)
+        self.addrs = addrs     # bytes: endereços alterados
+        self.values = values   # bytes: valores correspondentes
+        self.full = full       # bytes (256) ou None
+
+    def size(self):
+        return _SNAP_OVERHEAD+2*len(self.addrs)+(256 if self.full is not None else 0)
+
+
+class TimeTravelCPU(CPU):
+    """
+    CPU com histórico de snapshots para depuração reversa.
+
+    - a cada `interval` instruções (via fetch) um snapshot é gravado;
+    - escritas de STA são registradas e cada snapshot guarda só os bytes
+      alterados desde o anterior; a cada `keyframe_every` snapshots a
+      memória inteira é guardada, limitando o custo de restore();
+    - quando o histórico passa de `budget` bytes, os snapshots mais
+      antigos são descartados (um grupo de snapshot-chave por vez).
+
+    Escritas externas (assemble, load_image, reset) limpam o histórico.
+    """
+
+    def __init__(self, interval=1, budget=1<<20, keyframe_every=32):
+        super().__init__()
+        self.interval = max(1, interval)
+        self.budget = budget
+        self.keyframe_every = max(1, keyframe_every)
+        self.clear_history()
+
+    # ---------- Registro de escritas ----------
+
+    def store(self, addr, val):
+        self.memory[addr] = val
+        self._dirty.add(addr)
+
+    def clear_history(self):
+        """Descarta todos os snapshots; o próximo será um snapshot-chave."""
+        self.snapshots = []
+        self._steps = []       # passo de cada snapshot (para busca binária)
+        self._dirty = set()
+        self._since_key = 0
+        self._bytes = 0
+        self.step_count = 0
+
+    def assemble(self, src):
+        r = super().assemble(src)
+        self.clear_history()
+        return r
+
+    def load_image(self, data, origin=0):
+        super().load_image(data, origin)
+        self.clear_history()
+
+    def reset(self):
+        super().reset()
+        self.clear_history()
+
+    # ---------- Snapshots ----------
+
+    def _regs(self):
+        return (self.pc, self.ac, self.rs, self.carry, self.overflow, self.negative, self.zero)
+
+    def snapshot(self):
+        """Grava o estado atual e retorna o índice do snapshot."""
+        if self.snapshots and self.snapshots[-1].step==self.step_count:
+            return len(self.snapshots)-1
+        if not self.snapshots or self._since_key >= self.keyframe_every:
+            snap = Snapshot(self.step_count, self._regs(), b'', b'', self.dump_image())
+            self._since_key = 1
+        else:
+            addrs = bytes(sorted(self._dirty))
+            mem = self.memory
+            snap = Snapshot(self.step_count, self._regs(), addrs, bytes(mem[a] for a in addrs))
+            self._since_key += 1
+        self._dirty.clear()
+        self.snapshots.append(snap)
+        self._steps.append(snap.step)
+        self._bytes += snap.size()
+        self._enforce_budget()
+        return len(self.snapshots)-1
+
+    def _enforce_budget(self):
+        snaps = self.snapshots
+        while self._bytes > self.budget:
+            # próximo snapshot-chave depois do primeiro; mantém pelo menos um grupo
+            nxt = next((i for i in range(1, len(snaps)) if snaps[i].full is not None), None)
+            if nxt is None: break
+            self._bytes -= sum(s.size() for s in snaps[:nxt])
+            del snaps[:nxt]
+            del self._steps[:nxt]
+
+    def memory_used(self):
+        """Bytes (aproximados) ocupados pelo histórico."""
+        return self._bytes
+
+    def restore(self, n):
+        """
+        Restaura o snapshot de índice `n` (aceita negativos).
+        Custa no máximo `keyframe_every` deltas. Snapshots posteriores
+        são descartados: a execução recomeça a partir de `n`.
+        """
+        snaps = self.snapshots
+        if not snaps: raise Exception('Nenhum snapshot gravado')
+        n = range(len(snaps))[n]
+        k = n
+        while snaps[k].full is None: k -= 1
+        mem = self.memory
+        mem[:] = snaps[k].full
+        for s in snaps[k+1:n+1]:
+            for a, v in zip(s.addrs, s.values): mem[a] = v
+        s = snaps[n]
+        (self.pc, self.ac, self.rs, self.carry, self.overflow,
+         self.negative, self.zero) = s.regs
+        self.step_count = s.step
+        self._bytes -= sum(x.size() for x in snaps[n+1:])
+        del snaps[n+1:]
+        del self._steps[n+1:]
+        self._dirty.clear()
+        self._since_key = n-k+1
+        return s.step
+
+    # ---------- Execução ----------
+
+    def fetch(self):
+        if self.step_count % self.interval == 0: self.snapshot()
+        r = super().fetch()
+        self.step_count += 1
+        return r
+
+    def goto_step(self, step):
+        """
+        Volta (ou avança) até o passo `step`: restaura o snapshot mais
+        próximo anterior e reexecuta no máximo `interval` instruções.
+        """
+        if step < self.step_count:
+            i = bisect_right(self._steps, step)-1
+            if i < 0: raise Exception(f'Passo {step} anterior ao histórico disponível')
+            self.restore(i)
+        while self.step_count < step:
+            if not self.fetch(): break
+        return self.step_count
+
+    def step_back(self, n=1):
+        """Desfaz as últimas `n` instruções."""
+        return self.goto_step(max(0, self.step_count-n))
+
+
+if __name__=='__main__':
+    from engine import BENCH_ASM
+    cpu = TimeTravelCPU(interval=4, keyframe_every=16)
+    cpu.assemble(BENCH_ASM)
+    cpu.pc = 0
+    while cpu.fetch(): pass
+    print(f'Executado até o passo {cpu.step_count}; AC={cpu.ac:02X}')
+    print(f'{len(cpu.snapshots)} snapshots, {cpu.memory_used()} bytes')
+    for _ in range(3):
+        cpu.step_back()
+        print(f'passo {cpu.step_count}: PC={cpu.pc:02X} AC={cpu.ac:02X} CONT={cpu.memory[0x40]:02X}')
+    cpu.goto_step(100)
+    print(f'passo {cpu.step_count}: PC={cpu.pc:02X} AC={cpu.ac:02X} CONT={cpu.memory[0x40]:02X}')
@@ -0,0 +1,197 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####       Modelo de custo em ciclos e contador de ciclos    ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+import argparse
+import json
+import sys
+from bisect import bisect_right
+
+from blocks import BlockCPU
+from engine import MNEMONICS, BENCH_ASM
+
+# Custo em ciclos de cada instrução por modo (#imm, direto, ind, rel).
+# Modelo padrão: 1 ciclo por byte buscado, 1 por acesso à memória de
+# dados, 1 pela soma do ADD e pelo teste de flag do Jcc; o indireto
+# custa uma leitura a mais (ponteiro) e o relativo uma soma a mais
+# (PC + deslocamento). Modos inválidos custam 0 (geram erro).
+DEFAULT_COSTS = {
+    #       #imm dir ind rel
+    'NOT': (1, 1, 1, 1),
+    'STA': (0, 3, 4, 4),
+    'LDA': (2, 3, 4, 4),
+    'ADD': (3, 4, 5, 5),
+    'OR':  (2, 3, 4, 4),
+    'AND': (2, 3, 4, 4),
+    'JMP': (0, 2, 3, 3),
+    'JC':  (0, 3, 4, 4),
+    'JN':  (0, 3, 4, 4),
+    'JZ':  (0, 3, 4, 4),
+    'JSR': (0, 3, 4, 4),
+    'RTS': (2, 2, 2, 2),
+    'JV':  (0, 3, 4, 4),
+    'HLT': (1, 1, 1, 1),
+}
+
+_OPCODES = {m: opc for opc, m in MNEMONICS.items()}
+
+
+def cost_table(costs=None):
+    """
+    Tabela de 64 custos indexada por opc<<2 | modo. `costs` sobrepõe
+    DEFAULT_COSTS: mnemônico -> inteiro (todos os modos) ou 4 valores.
+    """
+    merged = dict(DEFAULT_COSTS)
+    for m, c in (costs or {}).items():
+        if m.upper() not in _OPCODES: raise Exception(f'Mnemônico desconhecido: {m}')
+        c = (c,)*4 if isinstance(c, int) else tuple(c)
+        if len(c)!=4 or any(not isinstance(x, int) or x < 0 for x in c):
+            raise Exception(f'Custo inválido para {m}: esperado inteiro ou 4 inteiros >= 0')
+        merged[m.upper()] = c
+    table = [0]*64
+    for m, c in merged.items():
+        opc = _OPCODES[m]
+        for mode in range(4): table[opc<<2|mode] = c[mode]
+    return table
+
+
+class TimedCPU(BlockCPU):
+    """
+    BlockCPU com contagem de ciclos. O custo de cada instrução vem da
+    tabela (opcode, modo) e é somado na compilação do bloco: cada saída
+    do bloco ganha um contador próprio (`ex[k] += 1`) cujo conjunto de
+    (endereço, ciclos) já é conhecido. O custo na execução é um
+    incremento por bloco; totais e a divisão por label são montados só
+    na consulta.
+
+    Ciclos são contados por run(); fetch() passo a passo não conta.
+    A instrução que gera erro não é cobrada.
+    """
+
+    def __init__(self, costs=None):
+        super().__init__()
+        self.cost = cost_table(costs)
+        self.ex = []            # saída -> nº de vezes executada
+        self.exits = []         # saída -> ((endereço, ciclos), ...)
+        self._exit_ids = {}     # (endereço, ciclos)... -> saída
+
+    def block_globals(self):
+        ns = super().block_globals()
+        ns['ex'] = self.ex
+        return ns
+
+    def exit_source(self, executed):
+        cost = self.cost
+        key = tuple((a, cost[opc<<2|mode]) for a, opc, mode, v, ea, nxt in executed)
+        k = self._exit_ids.get(key)
+        if k is None:
+            k = self._exit_ids[key] = len(self.exits)
+            self.exits.append(key); self.ex.append(0)
+        return (f'ex[{k}] += 1',)
+
+    def reset_cycles(self):
+        """Zera os contadores (os blocos compilados continuam válidos)."""
+        self.ex[:] = [0]*len(self.ex)
+
+    # ---------- Consultas ----------
+
+    def address_cycles(self, counts=None):
+        """Lista de 256 totais de ciclos por endereço de instrução."""
+        out = [0]*256
+        for key, n in zip(self.exits, self.ex if counts is None else counts):
+            if n:
+                for a, c in key: out[a] += n*c
+        return out
+
+    def label_cycles(self, per_addr):
+        """Ciclos agrupados pelo label anterior mais próximo de cada endereço."""
+        items = sorted((v&0xFF, k) for k, v in self.symbols.items())
+        starts = [v for v, _ in items]
+        out = {}
+        for a, n in enumerate(per_addr):
+            if not n: continue
+            i = bisect_right(starts, a)-1
+            name = items[i][1] if i >= 0 else f'{a:02X}'
+            out[name] = out.get(name, 0)+n
+        return out
+
+    @property
+    def cycles(self):
+        """Total acumulado de ciclos."""
+        return sum(n*sum(c for _, c in key) for key, n in zip(self.exits, self.ex) if n)
+
+    # ---------- Execução ----------
+
+    def run(self, max_steps=None):
+        """
+        Executa bloco a bloco a partir do PC até HLT, erro ou
+        `max_steps` (verificado em limite de bloco, como run_blocks).
+        Retorna o dicionário de CPU.run com mais dois campos desta
+        execução: cycles (total) e cycles_by_label.
+        """
+        res = {'status':None,'steps':0,'pc':None,'addr':None,
+               'access':None,'watch':None,'error':None}
+        before = list(self.ex)
+        blocks = self.blocks
+        steps = 0
+        a = self.pc
+        try:
+            while True:
+                if max_steps is not None and steps >= max_steps:
+                    res['status']='budget'; break
+                a = self.pc
+                blk = blocks.get(a)
+                if blk is None:
+                    blk = self.compile_block(a)
+                    if blk is None:
+                        # instrução inválida: CPU.fetch gera o erro
+                        steps += 1
+                        self.fetch()
+                        continue
+                k = blk.fn()
+                steps += k
+                if blk.halts and k==blk.n:
+                    res['status']='halt'; a = (self.pc-1)&0xFF   # o HLT
+                    break
+        except Exception as e:
+            res['status']='error'; res['error']=str(e)
+        if res['status']!='budget': res['addr']=a
+        res['steps']=steps; res['pc']=self.pc
+        before += [0]*(len(self.ex)-len(before))
+        delta = [n-m for n, m in zip(self.ex, before)]
+        per_addr = self.address_cycles(delta)
+        res['cycles'] = sum(per_addr)
+        res['cycles_by_label'] = self.label_cycles(per_addr)
+        return res
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Executa um programa CLEÓPATRA contando ciclos.')
+    ap.add_argument('source', nargs='?', help='arquivo .asm (padrão: laço de comparação de desempenho)')
+    ap.add_argument('--costs', help='JSON mnemônico -> ciclos (inteiro ou [#imm, dir, ind, rel])')
+    ap.add_argument('--max-steps', type=int, default=None)
+    args = ap.parse_args(argv)
+    costs = None
+    if args.costs:
+        with open(args.costs, encoding='utf-8') as f:
+            costs = json.load(f)
+    src = BENCH_ASM
+    if args.source:
+        with open(args.source, encoding='utf-8') as f:
+            src = f.read()
+    cpu = TimedCPU(costs)
+    cpu.assemble(src)
+    res = cpu.run(args.max_steps)
+    print(f"{res['steps']} instruções, {res['cycles']} ciclos ({res['status']}"
+          + (f": {res['error']}" if res['error'] else '') + ')')
+    total = res['cycles'] or 1
+    for name, n in sorted(res['cycles_by_label'].items(), key=lambda x: -x[1]):
+        print(f'  {name:>12} {n:12} {100*n/total:6.2f}%')
+    return 0 if res['status']!='error' else 1
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,389 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####        Rastreamento plugável (custo zero se desligado)  ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+import argparse
+import logging
+import struct
+import sys
+import zlib
+from bisect import bisect_right
+
+from engine import MNEMONICS
+
+MODE_NAMES = ('Imediato','Direto','Indireto','Relativo')
+
+# Desvios: JMP, JC, JN, JZ, JSR, RTS, JV -> flag testado (None = sempre)
+JUMPS = {0x8:None, 0x9:'carry', 0xA:'negative', 0xB:'zero', 0xC:None, 0xD:None, 0xE:'overflow'}
+
+# Tipos de registro
+INSTR, WRITE, JUMP = 0, 1, 2
+
+
+class Tracer:
+    """
+    Interface de rastreamento. Subclasses sobrescrevem os ganchos que
+    interessam; os demais não são instalados (não custam nada).
+
+    instr(cpu, addr, byte)           após cada instrução (estado já atualizado)
+    write(cpu, addr, old, new)       em cada escrita de STA
+    jump(cpu, addr, opc, taken, pc)  após JMP/Jcc/JSR/RTS
+    """
+
+    def instr(self, cpu, addr, byte): pass
+    def write(self, cpu, addr, old, new): pass
+    def jump(self, cpu, addr, opc, taken, pc): pass
+    def close(self): pass
+
+    def wants(self, hook):
+        """True se a subclasse implementa o gancho `hook`."""
+        return getattr(type(self), hook) is not getattr(Tracer, hook)
+
+
+def attach(cpu, tracer):
+    """
+    Liga `tracer` em `cpu`. Os métodos da classe não mudam: fetch e store
+    ganham versões rastreadas apenas na instância, então uma CPU sem
+    tracer executa exatamente o mesmo código de antes.
+    Vale para CPUs que passam por fetch()/store() (main.CPU, main2.CPU
+    e derivadas); os motores especializados não chamam store().
+    """
+    detach(cpu)
+    cls = type(cpu)
+    cpu.tracer = tracer
+
+    if tracer.wants('write'):
+        cls_store = cls.store
+        on_write = tracer.write
+        def store(addr, val):
+            old = cpu.memory[addr]
+            cls_store(cpu, addr, val)
+            on_write(cpu, addr, old, val)
+        cpu.store = store
+
+    on_instr = tracer.instr if tracer.wants('instr') else None
+    on_jump = tracer.jump if tracer.wants('jump') else None
+    if on_instr or on_jump:
+        cls_fetch = cls.fetch
+        def fetch():
+            a = cpu.pc
+            b = cpu.memory[a]
+            r = cls_fetch(cpu)
+            if on_jump is not None:
+                opc = b>>4
+                if opc in JUMPS:
+                    flag = JUMPS[opc]
+                    on_jump(cpu, a, opc, flag is None or bool(getattr(cpu, flag)), cpu.pc)
+            if on_instr is not None: on_instr(cpu, a, b)
+            return r
+        cpu.fetch = fetch
+
+
+def detach(cpu):
+    """Desliga o tracer de `cpu` (se houver) e devolve-o."""
+    tracer = cpu.__dict__.pop('tracer', None)
+    cpu.__dict__.pop('fetch', None)
+    cpu.__dict__.pop('store', None)
+    return tracer
+
+
+# ---------- Tracers prontos ----------
+
+class RingTracer(Tracer):
+    """Guarda os últimos `size` eventos em um buffer circular pré-alocado."""
+
+    def __init__(self, size=4096):
+        self.size = size
+        self.buf = [None]*size
+        self.count = 0
+
+    def _add(self, rec):
+        self.buf[self.count % self.size] = rec
+        self.count += 1
+
+    def instr(self, cpu, addr, byte):
+        self._add((INSTR, addr, byte, cpu.ac,
+                   cpu.negative<<3 | cpu.zero<<2 | cpu.carry<<1 | cpu.overflow))
+
+    def write(self, cpu, addr, old, new):
+        self._add((WRITE, addr, old, new, 0))
+
+    def jump(self, cpu, addr, opc, taken, pc):
+        self._add((JUMP, addr, opc, int(taken), pc))
+
+    def records(self):
+        """Eventos guardados, do mais antigo ao mais recente."""
+        if self.count <= self.size: return self.buf[:self.count]
+        i = self.count % self.size
+        return self.buf[i:]+self.buf[:i]
+
+
+class BinaryTraceWriter(Tracer):
+    """
+    Grava os eventos em um arquivo binário, em registros fixos de 5 bytes
+    (tipo, e quatro campos de 8 bits, como em RingTracer). Os registros
+    vão direto para um bytearray, descarregado em blocos de `size`
+    registros.
+    """
+    REC = struct.Struct('5B')
+
+    def __init__(self, path, size=4096):
+        self.limit = size*self.REC.size
+        self.buf = bytearray()
+        self.f = open(path, 'wb')
+
+    def _add(self, *rec):
+        buf = self.buf
+        buf.extend(rec)
+        if len(buf) >= self.limit: self.flush()
+
+    def instr(self, cpu, addr, byte):
+        self._add(INSTR, addr, byte, cpu.ac,
+                  cpu.negative<<3 | cpu.zero<<2 | cpu.carry<<1 | cpu.overflow)
+
+    def write(self, cpu, addr, old, new):
+        self._add(WRITE, addr, old, new, 0)
+
+    def jump(self, cpu, addr, opc, taken, pc):
+        self._add(JUMP, addr, opc, int(taken), pc)
+
+    def flush(self):
+        self.f.write(self.buf)
+        self.buf.clear()
+
+    def close(self):
+        if self.f.closed: return
+        self.flush()
+        self.f.close()
+
+    @classmethod
+    def read(cls, path):
+        """Lê um arquivo gravado por BinaryTraceWriter (lista de tuplas)."""
+        with open(path, 'rb') as f:
+            return list(cls.REC.iter_unpack(f.read()))
+
+
+class LoggingTracer(Tracer):
+    """
+    Log textual da execução (o antigo log de main2.py), via `logging`.
+    As mensagens só são formatadas se o nível estiver habilitado.
+    """
+
+    def __init__(self, logger=None):
+        self.log = logger or logging.getLogger('cleopatra')
+        self._last_write = None
+
+    def write(self, cpu, addr, old, new):
+        self._last_write = addr
+
+    def instr(self, cpu, addr, byte):
+        log = self.log
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('Fetch: PC=%02X, Instrução=%02X, Opcode=%X, Modo=%X',
+                      addr, byte, byte>>4, (byte>>2)&3)
+        if not log.isEnabledFor(logging.INFO): return
+        opc = byte>>4; mode = MODE_NAMES[(byte>>2)&3]
+        if opc==0xF:
+            log.info('HLT: Finalizando a execução.')
+        elif opc==0x0:
+            log.info('NOT: AC=%02X, N=%d, Z=%d', cpu.ac, cpu.negative, cpu.zero)
+        elif opc==0x1:
+            log.info('STA (%s): AC=%02X armazenado em %02X', mode, cpu.ac, self._last_write)
+        elif opc==0x4:
+            log.info('LDA (%s): AC carregado com %02X', mode, cpu.ac)
+        elif opc==0x5:
+            log.info('ADD: AC=%02X, Carry=%d, Overflow=%d', cpu.ac, cpu.carry, cpu.overflow)
+        else:
+            log.info('%s (%s): AC=%02X PC=%02X', MNEMONICS.get(opc, '?'), mode, cpu.ac, cpu.pc)
+
+
+# ---------- Trace binário compactado ----------
+
+# Registro de largura fixa: PC da instrução, byte da instrução, AC após,
+# flags (N<<3 | Z<<2 | C<<1 | V, e TRACE_WRITE se houve escrita), PC
+# seguinte, endereço e valor escritos (0 se não houve escrita).
+TRACE_REC = 7
+TRACE_WRITE = 0x10
+
+_TRACE_MAGIC = b'CTRC'
+_TRACE_INDEX = b'CTRI'
+_TRACE_HEADER = struct.Struct('<4sBBI')     # magic, versão, tamanho do registro, registros por bloco
+_TRACE_CHUNK = struct.Struct('<I')          # tamanho comprimido do bloco
+_TRACE_ENTRY = struct.Struct('<QII')        # posição no arquivo, 1º passo, nº de registros
+_TRACE_FOOTER = struct.Struct('<IQ4s')      # nº de blocos, nº de passos, magic do índice
+
+
+def _delta(raw):
+    """XOR de cada registro com o anterior (o 1º com zero), em uma operação."""
+    x = int.from_bytes(raw, 'big')
+    return (x ^ (x >> 8*TRACE_REC)).to_bytes(len(raw), 'big')
+
+
+def _undelta(data):
+    """Inverso de _delta: XOR prefixado por duplicação (log2(n) operações)."""
+    x = int.from_bytes(data, 'big')
+    shift = 8*TRACE_REC
+    bits = 8*len(data)
+    while shift < bits:
+        x ^= x >> shift
+        shift <<= 1
+    return x.to_bytes(len(data), 'big')
+
+
+class CompressedTraceWriter(Tracer):
+    """
+    Grava um registro de TRACE_REC bytes por instrução em blocos de
+    `chunk` registros. Cada bloco é codificado por diferença (XOR com
+    o registro anterior, o que zera quase todos os bytes) e comprimido
+    com zlib de forma independente. Ao fechar, um índice dos blocos é
+    gravado no fim do arquivo, permitindo posicionar por passo.
+    """
+
+    def __init__(self, path, chunk=4096, level=6):
+        self.f = open(path, 'wb')
+        self.chunk = chunk
+        self.level = level
+        self.buf = bytearray()
+        self.count = 0          # registros no bloco atual
+        self.steps = 0          # registros já gravados em blocos
+        self.index = []
+        self._write = None
+        self.f.write(_TRACE_HEADER.pack(_TRACE_MAGIC, 1, TRACE_REC, chunk))
+
+    def write(self, cpu, addr, old, new):
+        self._write = (addr, new)
+
+    def instr(self, cpu, addr, byte):
+        fl = cpu.negative<<3 | cpu.zero<<2 | cpu.carry<<1 | cpu.overflow
+        w = self._write
+        if w is None:
+            self.buf.extend((addr, byte, cpu.ac, fl, cpu.pc, 0, 0))
+        else:
+            self.buf.extend((addr, byte, cpu.ac, fl|TRACE_WRITE, cpu.pc, w[0], w[1]))
+            self._write = None
+        self.count += 1
+        if self.count == self.chunk: self.flush()
+
+    def flush(self):
+        """Comprime e grava o bloco atual (se não estiver vazio)."""
+        if not self.count: return
+        data = zlib.compress(_delta(self.buf), self.level)
+        self.index.append((self.f.tell(), self.steps, self.count))
+        self.f.write(_TRACE_CHUNK.pack(len(data)))
+        self.f.write(data)
+        self.steps += self.count
+        self.buf.clear()
+        self.count = 0
+
+    def close(self):
+        if self.f.closed: return
+        self.flush()
+        for entry in self.index: self.f.write(_TRACE_ENTRY.pack(*entry))
+        self.f.write(_TRACE_FOOTER.pack(len(self.index), self.steps, _TRACE_INDEX))
+        self.f.close()
+
+
+class TraceReader:
+    """
+    Leitor de arquivos de CompressedTraceWriter. Usa o índice do fim do
+    arquivo (ou, se o arquivo não foi fechado, percorre os blocos) e
+    descomprime só os blocos do intervalo pedido.
+    Registros: (pc, byte, ac, flags, pc seguinte, endereço escrito, valor).
+    """
+
+    def __init__(self, path):
+        self.f = open(path, 'rb')
+        magic, version, size, self.chunk = _TRACE_HEADER.unpack(self.f.read(_TRACE_HEADER.size))
+        if magic != _TRACE_MAGIC or version != 1 or size != TRACE_REC:
+            self.f.close()
+            raise Exception(f'{path}: não é um trace CLEÓPATRA')
+        self.index = self._read_index()
+        self.steps = sum(n for _, _, n in self.index)
+        self._cached = (None, None)
+
+    def _read_index(self):
+        f = self.f
+        end = f.seek(0, 2)
+        if end >= _TRACE_HEADER.size+_TRACE_FOOTER.size:
+            f.seek(end-_TRACE_FOOTER.size)
+            n, steps, magic = _TRACE_FOOTER.unpack(f.read(_TRACE_FOOTER.size))
+            if magic == _TRACE_INDEX:
+                f.seek(end-_TRACE_FOOTER.size-n*_TRACE_ENTRY.size)
+                return list(_TRACE_ENTRY.iter_unpack(f.read(n*_TRACE_ENTRY.size)))
+        # arquivo sem índice (gravação interrompida): percorre os blocos
+        index = []
+        pos = _TRACE_HEADER.size; step = 0
+        while True:
+            f.seek(pos)
+            head = f.read(_TRACE_CHUNK.size)
+            if len(head) < _TRACE_CHUNK.size: break
+            (size,) = _TRACE_CHUNK.unpack(head)
+            data = f.read(size)
+            if len(data) < size: break
+            try: n = len(zlib.decompress(data))//TRACE_REC
+            except zlib.error: break
+            index.append((pos, step, n))
+            pos += _TRACE_CHUNK.size+size; step += n
+        return index
+
+    def __len__(self):
+        return self.steps
+
+    def _chunk(self, i):
+        if self._cached[0] == i: return self._cached[1]
+        pos = self.index[i][0]
+        self.f.seek(pos)
+        (size,) = _TRACE_CHUNK.unpack(self.f.read(_TRACE_CHUNK.size))
+        data = _undelta(zlib.decompress(self.f.read(size)))
+        self._cached = (i, data)
+        return data
+
+    def records(self, start=0, end=None):
+        """Gera os registros dos passos [start, end)."""
+        end = self.steps if end is None else min(end, self.steps)
+        if start < 0: start = 0
+        firsts = [s for _, s, _ in self.index]
+        i = bisect_right(firsts, start)-1
+        while start < end and i < len(self.index):
+            _, first, n = self.index[i]
+            data = self._chunk(i)
+            for k in range(start-first, min(end-first, n)):
+                yield tuple(data[k*TRACE_REC:(k+1)*TRACE_REC])
+            start = first+n; i += 1
+
+    def record(self, step):
+        """Registro do passo `step` (base 0)."""
+        if not 0 <= step < self.steps: raise IndexError(step)
+        return next(self.records(step, step+1))
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+
+def render(records):
+    """Linhas no formato do log de main.py: 'PC: .. AC: .. N: . Z: . C: . V: .'."""
+    for pc, byte, ac, fl, nxt, wa, wv in records:
+        yield (f'PC: {nxt:02X} AC: {ac:02X} N: {fl>>3&1} Z: {fl>>2&1} '
+               f'C: {fl>>1&1} V: {fl&1}')
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Mostra um trecho de um trace binário compactado.')
+    ap.add_argument('trace', help='arquivo gravado por CompressedTraceWriter')
+    ap.add_argument('--start', type=int, default=0, help='primeiro passo (base 0)')
+    ap.add_argument('--end', type=int, default=None, help='passo final (exclusivo)')
+    args = ap.parse_args(argv)
+    with TraceReader(args.trace) as r:
+        for line in render(r.records(args.start, args.end)):
+            print(line)
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,197 @@
+#################################################################
+####             C L E O P A T R A    S E L E N E            ####
+####     Motor vetorial (NumPy): N CPUs em passo conjunto     ####
+#################################################################
+#### Prof. Filipo Mor - github.com/ProfessorFilipo           ####
+#################################################################
+
+import numpy as np
+
+from main import CPU
+
+# Estado de cada via (lane)
+RUNNING = 0   # ainda executando (ou estourou o limite de passos)
+HALTED  = 1   # executou HLT
+ERROR   = 2   # opcode ou modo de endereçamento inválido
+
+_SIZE = np.array([1,2,2,2,2,2,2,2,2,2,2,2,2,1,2,1], dtype=np.int16)
+
+
+class VectorCPU:
+    """
+    Executa o mesmo programa em N estados de CPU ao mesmo tempo.
+    A memória é uma matriz N×256 e os registradores são vetores de
+    tamanho N. Todas as vias avançam juntas, com execução mascarada por
+    opcode e modo; vias que executam HLT (ou falham) saem do conjunto
+    ativo e ficam congeladas.
+    """
+
+    def __init__(self, memories, pc=0):
+        self.memory = np.array(memories, dtype=np.uint8).reshape(-1, 256)
+        n = self.memory.shape[0]
+        self.ac = np.zeros(n, dtype=np.int16)
+        self.pc = np.full(n, pc&0xFF, dtype=np.int16)
+        self.rs = np.zeros(n, dtype=np.int16)
+        self.carry = np.zeros(n, dtype=np.int16)
+        self.overflow = np.zeros(n, dtype=np.int16)
+        self.negative = np.zeros(n, dtype=np.int16)
+        self.zero = np.zeros(n, dtype=np.int16)
+        self.status = np.full(n, RUNNING, dtype=np.int8)
+        self.steps = np.zeros(n, dtype=np.int64)
+        # endereço da instrução que falhou (-1 = sem erro)
+        self.error_at = np.full(n, -1, dtype=np.int16)
+
+    @classmethod
+    def broadcast(cls, image, n, pc=0):
+        """Cria N vias a partir de uma única imagem de 256 bytes."""
+        img = np.frombuffer(bytes(image), dtype=np.uint8)
+        return cls(np.tile(img, (n, 1)), pc)
+
+    @classmethod
+    def sweep(cls, src, addr, values=range(256), pc=0):
+        """
+        Monta `src` uma vez e cria uma via para cada valor em `values`
+        gravado no endereço (ou label) `addr`.
+        """
+        cpu = CPU()
+        cpu.assemble(src)
+        if isinstance(addr, str): addr = cpu.symbols[addr]
+        values = np.asarray(list(values), dtype=np.uint8)
+        vc = cls.broadcast(cpu.memory, len(values), pc)
+        vc.memory[:, addr] = values
+        return vc
+
+    def __len__(self):
+        return self.memory.shape[0]
+
+    # ---------- Execução ----------
+
+    def step(self):
+        """Executa uma instrução em cada via ativa. Retorna nº de vias ativas."""
+        idx = np.flatnonzero(self.status == RUNNING)
+        if idx.size == 0: return 0
+        mem = self.memory
+        a = self.pc[idx]
+        b = mem[idx, a].astype(np.int16)
+        opc = b >> 4
+        mode = (b >> 2) & 0x3
+        v = mem[idx, (a+1)&0xFF].astype(np.int16)
+        nxt = (a + _SIZE[opc]) & 0xFF
+        # endereço efetivo: direto = v, relativo = PC+desloc, indireto = mem[v]
+        sv = np.where(v < 0x80, v, v-0x100)
+        ea = np.where(mode == 0x3, (nxt+sv)&0xFF, v)
+        ind = mode == 0x2
+        ea = np.where(ind, mem[idx, ea], ea).astype(np.int16)
+        val = np.where(mode == 0x0, v, mem[idx, ea]).astype(np.int16)
+
+        ac = self.ac[idx]
+        new_ac = ac.copy()
+        new_pc = nxt.copy()
+        nz = np.zeros(idx.size, dtype=bool)   # vias que atualizam N/Z
+
+        m = opc == 0x0                        # NOT
+        new_ac[m] = ac[m] ^ 0xFF; nz |= m
+        m = opc == 0x4                        # LDA
+        new_ac[m] = val[m]; nz |= m
+        m = opc == 0x6                        # OR
+        new_ac[m] = ac[m] | val[m]; nz |= m
+        m = opc == 0x7                        # AND
+        new_ac[m] = ac[m] & val[m]; nz |= m
+        m = opc == 0x5                        # ADD
+        if m.any():
+            ii = idx[m]
+            x = ac[m]; y = val[m]; res = x+y; r = res & 0xFF
+            self.carry[ii] = res >> 8
+            self.overflow[ii] = ((x^r) & (y^r)) >> 7
+            new_ac[m] = r; nz |= m
+        if nz.any():
+            ii = idx[nz]; r = new_ac[nz]
+            self.negative[ii] = r >> 7
+            self.zero[ii] = (r == 0)
+
+        # modo imediato é inválido para STA e desvios (exceto RTS/HLT/NOT)
+        bad = (opc == 0x2) | (opc == 0x3)
+        bad |= (mode == 0x0) & ((opc == 0x1) | ((opc >= 0x8) & (opc <= 0xC)) | (opc == 0xE))
+
+        m = (opc == 0x1) & ~bad               # STA
+        if m.any():
+            mem[idx[m], ea[m]] = ac[m].astype(np.uint8)
+
+        jmp = (opc == 0x8)
+        jmp |= (opc == 0x9) & (self.carry[idx] == 1)
+        jmp |= (opc == 0xA) & (self.negative[idx] == 1)
+        jmp |= (opc == 0xB) & (self.zero[idx] == 1)
+        jmp |= (opc == 0xE) & (self.overflow[idx] == 1)
+        jsr = opc == 0xC
+        jmp = (jmp | jsr) & ~bad
+        new_pc[jmp] = ea[jmp]
+        if jsr.any():
+            self.rs[idx[jsr & ~bad]] = nxt[jsr & ~bad]
+        m = opc == 0xD                        # RTS
+        new_pc[m] = self.rs[idx[m]]
+
+        # falhas: PC para logo após o byte de opcode, como em CPU.fetch
+        new_pc[bad] = (a[bad]+1) & 0xFF
+        self.ac[idx] = new_ac
+        self.pc[idx] = new_pc
+        self.steps[idx] += 1
+        if bad.any():
+            self.status[idx[bad]] = ERROR
+            self.error_at[idx[bad]] = a[bad]
+        m = opc == 0xF                        # HLT
+        self.status[idx[m]] = HALTED
+        return int(np.count_nonzero(self.status == RUNNING))
+
+    def run(self, max_steps=100000):
+        """
+        Executa até todas as vias pararem ou até `max_steps` passos.
+        Retorna o número de vias que ainda estão ativas.
+        """
+        active = len(self)
+        for _ in range(max_steps):
+            active = self.step()
+            if not active: break
+        return active
+
+    # ---------- Resultados ----------
+
+    def lane(self, i):
+        """Registradores, flags e estado finais da via `i`."""
+        return {
+            'ac': int(self.ac[i]), 'pc': int(self.pc[i]), 'rs': int(self.rs[i]),
+            'n': int(self.negative[i]), 'z': int(self.zero[i]),
+            'c': int(self.carry[i]), 'v': int(self.overflow[i]),
+            'status': int(self.status[i]), 'steps': int(self.steps[i]),
+        }
+
+    def lane_memory(self, i):
+        """Memória final da via `i` como bytes."""
+        return self.memory[i].tobytes()
+
+
+if __name__=='__main__':
+    import time
+    asm = """
+; Exemplo de programa para testar o simulador CLEÓPATRA 3.0
+.CODE #00
+START: LDA B
+       NOT
+       ADD #1
+       ADD A
+       STA C
+END:   HLT
+.ENDCODE
+.DATA #0A
+A: DB #05
+B: DB #04
+C: DB #00
+D: DB #FE
+.ENDDATA
+"""
+    t0 = time.perf_counter()
+    vc = VectorCPU.sweep(asm, 'A')
+    vc.run()
+    dt = time.perf_counter()-t0
+    print(f'{len(vc)} vias em {dt*1000:.1f} ms')
+    for i in (0, 1, 4, 255):
+        print(f'A={i:3}: C={vc.memory[i, 0x0C]:02X}', vc.lane(i))